@@ -0,0 +1,172 @@
+"""
+Compare the JSON API's ``values_list()`` serialization with model-instance serializers.
+
+Usage (from the django_blog directory):
+
+	python benchmarks/api_serialization.py --posts 20000 --limit 50 --pages 200
+
+The script builds a throwaway SQLite database (``--database``) and seeds
+``--posts`` posts with three tags each. It then serializes the same fields
+(the API's default post fields) in up to three ways:
+
+- ``values``: ``blog.api``'s ``Selection``, as the API endpoints do.
+- ``instances``: posts loaded with ``select_related('author')`` and
+  ``prefetch_related('tags')``, with a dict built from each instance.
+- ``drf``: a Django REST framework ``ModelSerializer``, only if
+  ``rest_framework`` is installed. It is not a dependency of this project.
+
+For each way it reports two things:
+
+- The median and p95 time to build and encode one page of ``--limit`` posts.
+- The rows per second and peak Python memory (``tracemalloc``) when exporting
+  every post. The ``values`` export streams through ``api.stream_rows``. The
+  other two build the whole list first and encode it once, as a naive export
+  view would.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+FIELDS = ('id', 'title', 'author', 'published_date', 'updated', 'excerpt', 'comment_count', 'tags')
+
+
+def setup(database):
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
+	os.environ['SQLITE_PATH'] = database
+	sys.path.insert(0, str(PROJECT_DIR))
+	import django
+
+	django.setup()
+	from django.core.management import call_command
+
+	call_command('migrate', verbosity=0)
+
+
+def seed(posts):
+	import random
+
+	from django.contrib.auth.models import User
+
+	from blog.models import Post, Tag
+
+	missing = posts - Post.objects.count()
+	if missing <= 0:
+		return
+	random.seed(0)
+	authors = [User.objects.get_or_create(username=f'bench{i}')[0] for i in range(20)]
+	tags = [Tag.objects.get_or_create(name=f'topic-{i}')[0] for i in range(50)]
+	words = ['api', 'django', 'values', 'cursor', 'stream', 'latency', 'export', 'mobile']
+	for start in range(0, missing, 1000):
+		batch = []
+		for i in range(start, min(start + 1000, missing)):
+			body = ' '.join(random.choice(words) for _ in range(400))
+			batch.append(Post(title=f'Benchmark post {i}', content=body, excerpt=body[:200], author=random.choice(authors)))
+		created = Post.objects.bulk_create(batch)
+		Post.tags.through.objects.bulk_create([
+			Post.tags.through(post_id=post.pk, tag_id=tag.pk) for post in created for tag in random.sample(tags, 3)
+		])
+
+
+def instance_dict(post):
+	return {
+		'id': post.pk,
+		'title': post.title,
+		'author': post.author.username,
+		'published_date': post.published_date,
+		'updated': post.updated,
+		'excerpt': post.excerpt,
+		'comment_count': post.comment_count,
+		'tags': sorted(tag.name for tag in post.tags.all()),
+	}
+
+
+def serializers():
+	"""``{name: (page, export)}``: each returns the JSON for a queryset of posts."""
+	from django.core.serializers.json import DjangoJSONEncoder
+
+	from blog import api
+	from blog.models import Post
+
+	encode = DjangoJSONEncoder().encode
+	selection = api.Selection(api.PostResource(), FIELDS, ('id',))
+
+	def values_page(queryset):
+		return encode(selection.serialize(list(selection.rows(queryset))))
+
+	def values_export(queryset):
+		return ''.join(api.stream_rows(selection, queryset, api.EXPORT_CHUNK_SIZE))
+
+	def instances(queryset):
+		return encode([instance_dict(post) for post in queryset.select_related('author').prefetch_related('tags')])
+
+	modes = {'values': (values_page, values_export), 'instances': (instances, instances)}
+	try:
+		from rest_framework import serializers as drf
+	except ImportError:
+		return modes
+
+	class PostSerializer(drf.ModelSerializer):
+		author = drf.CharField(source='author.username')
+		tags = drf.SlugRelatedField(many=True, read_only=True, slug_field='name')
+
+		class Meta:
+			model = Post
+			fields = FIELDS
+
+	def drf_json(queryset):
+		queryset = queryset.select_related('author').prefetch_related('tags')
+		return json.dumps(PostSerializer(queryset, many=True).data, cls=DjangoJSONEncoder)
+
+	modes['drf'] = (drf_json, drf_json)
+	return modes
+
+
+def main(options):
+	database = options.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+	setup(database)
+	seed(options.posts)
+
+	from blog.models import Post
+
+	total = Post.objects.count()
+	last = Post.objects.order_by('-pk').values_list('pk', flat=True).first()
+	print(f'{total:,} posts, pages of {options.limit}')
+	print(f'{"mode":<11}{"page p50 ms":>12}{"page p95 ms":>12}{"export rows/s":>15}{"export peak MB":>16}')
+	for name, (page, export) in serializers().items():
+		timings = []
+		for number in range(options.pages):
+			# Seek to each page by primary key so that every mode runs the same cheap query.
+			after = number * options.limit % max(last - options.limit, 1)
+			started = time.perf_counter()
+			page(Post.objects.filter(pk__gt=after).order_by('pk')[:options.limit])
+			timings.append(time.perf_counter() - started)
+		p95 = statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0]
+
+		started = time.perf_counter()
+		export(Post.objects.order_by('pk'))
+		elapsed = time.perf_counter() - started
+		# A second pass for memory: tracing slows allocation-heavy code several times over.
+		tracemalloc.start()
+		export(Post.objects.order_by('pk'))
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		print(
+			f'{name:<11}{statistics.median(timings) * 1000:>12.2f}{p95 * 1000:>12.2f}'
+			f'{total / elapsed:>15,.0f}{peak / 2**20:>16.1f}'
+		)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--posts', type=int, default=20000)
+	parser.add_argument('--limit', type=int, default=50, help='posts per page')
+	parser.add_argument('--pages', type=int, default=200, help='timed pages per mode')
+	parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+	main(parser.parse_args())
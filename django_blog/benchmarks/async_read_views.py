@@ -0,0 +1,158 @@
+"""
+Compare the sync read views with their ASGI-native versions under uvicorn.
+
+Usage (from the django_blog directory; needs uvicorn installed):
+
+	python benchmarks/async_read_views.py --posts 2000 --concurrency 64 --duration 10
+
+The script builds a throwaway SQLite database (``--database``), seeds it,
+starts ``uvicorn django_blog.asgi:application`` and drives each URL pair with
+``--concurrency`` keep-alive clients written on plain asyncio. It reports
+requests/sec and p50/p99 latency per URL. ``--cache`` keeps the blog cache on;
+by default it is the dummy backend so every request reaches the database.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+PAIRS = [
+	('post list', '/posts/', '/async/posts/'),
+	('post detail', '/posts/{pk}/', '/async/posts/{pk}/'),
+	('tag listing', '/tags/bench/', '/async/tags/bench/'),
+	('search', '/search/?q=benchmark', '/async/search/?q=benchmark'),
+]
+
+
+def setup_database(env, posts):
+	"""Migrate and seed the benchmark database; return the pk of a post to fetch."""
+	subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], cwd=PROJECT_DIR, env=env, check=True)
+	seed = f'''
+from django.contrib.auth.models import User
+from blog.models import Comment, Post, Tag
+author, _ = User.objects.get_or_create(username='bench')
+tag, _ = Tag.objects.get_or_create(name='bench')
+missing = {posts} - Post.objects.count()
+for i in range(max(missing, 0)):
+	post = Post.objects.create(title=f'Benchmark post {{i}}', content='Benchmark body ' * 40, author=author)
+	post.set_tags([tag])
+	if i % 10 == 0:
+		comment = Comment.objects.create(post=post, author=author, content='A comment')
+		post.record_comment_added(comment)
+print(Post.objects.order_by('-pk').values_list('pk', flat=True).first())
+'''
+	result = subprocess.run(
+		[sys.executable, 'manage.py', 'shell', '-c', seed],
+		cwd=PROJECT_DIR, env=env, check=True, capture_output=True, text=True,
+	)
+	return int(result.stdout.strip().splitlines()[-1])
+
+
+async def wait_for_port(host, port, timeout=20):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			_, writer = await asyncio.open_connection(host, port)
+		except OSError:
+			await asyncio.sleep(0.1)
+			continue
+		writer.close()
+		return
+	raise RuntimeError('uvicorn did not start')
+
+
+async def fetch(reader, writer, host, path):
+	writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+	await writer.drain()
+	status_line = await reader.readline()
+	length, chunked = 0, False
+	while (line := await reader.readline()) not in (b'\r\n', b''):
+		name, _, value = line.decode().partition(':')
+		if name.lower() == 'content-length':
+			length = int(value)
+		elif name.lower() == 'transfer-encoding' and 'chunked' in value:
+			chunked = True
+	if chunked:
+		while size := int((await reader.readline()).strip() or b'0', 16):
+			await reader.readexactly(size + 2)
+		await reader.readline()
+	else:
+		await reader.readexactly(length)
+	return int(status_line.split()[1])
+
+
+async def client(host, port, path, stop_at, latencies, errors):
+	reader, writer = await asyncio.open_connection(host, port)
+	try:
+		while time.monotonic() < stop_at:
+			started = time.perf_counter()
+			status = await fetch(reader, writer, host, path)
+			latencies.append(time.perf_counter() - started)
+			if status != 200:
+				errors.append(status)
+	finally:
+		writer.close()
+
+
+async def run_load(host, port, path, concurrency, duration):
+	latencies, errors = [], []
+	stop_at = time.monotonic() + duration
+	await asyncio.gather(*(client(host, port, path, stop_at, latencies, errors) for _ in range(concurrency)))
+	return latencies, errors
+
+
+def summarize(latencies, duration):
+	if len(latencies) < 2:
+		return 0.0, 0.0, 0.0
+	cuts = statistics.quantiles(latencies, n=100)
+	return len(latencies) / duration, cuts[49] * 1000, cuts[98] * 1000
+
+
+async def main(options):
+	database = options.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+	env = {
+		**os.environ,
+		'DJANGO_SETTINGS_MODULE': 'django_blog.settings',
+		'SQLITE_PATH': database,
+		'BLOG_CACHE_BACKEND': os.environ.get('BLOG_CACHE_BACKEND', 'locmem') if options.cache else 'dummy',
+	}
+	pk = setup_database(env, options.posts)
+	server = subprocess.Popen(
+		[sys.executable, '-m', 'uvicorn', 'django_blog.asgi:application',
+		 '--host', options.host, '--port', str(options.port), '--log-level', 'warning', '--no-access-log'],
+		cwd=PROJECT_DIR, env=env,
+	)
+	try:
+		await wait_for_port(options.host, options.port)
+		print(f'{"view":<14}{"mode":<7}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+		for label, sync_path, async_path in PAIRS:
+			for mode, path in (('sync', sync_path), ('async', async_path)):
+				path = path.format(pk=pk)
+				await run_load(options.host, options.port, path, min(options.concurrency, 4), 1)  # warm up
+				latencies, errors = await run_load(
+					options.host, options.port, path, options.concurrency, options.duration
+				)
+				rps, p50, p99 = summarize(latencies, options.duration)
+				print(f'{label:<14}{mode:<7}{rps:>10.1f}{p50:>10.1f}{p99:>10.1f}{len(errors):>8}')
+	finally:
+		server.terminate()
+		server.wait()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--posts', type=int, default=2000)
+	parser.add_argument('--concurrency', type=int, default=64)
+	parser.add_argument('--duration', type=float, default=10.0, help='seconds per URL')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+	parser.add_argument('--cache', action='store_true', help='keep the blog cache enabled')
+	asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Measure comment moderation throughput.
+
+Usage (from the django_blog directory):
+
+	python benchmarks/comment_moderation.py --comments 20000 --batch-size 500
+
+The script builds a throwaway SQLite database (``--database``), queues
+``--comments`` submissions spread over ``--posts`` posts (one in ten of them
+spam: link-stuffed or copied), and drains the queue with the configured
+classifiers. It reports comments per second overall, the median batch time,
+and how many submissions were approved and rejected.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+WORDS = [
+	'query', 'index', 'django', 'migration', 'cache', 'template', 'latency', 'thread', 'great',
+	'post', 'thanks', 'example', 'explain', 'plan', 'database', 'row', 'column', 'page', 'reply',
+]
+SPAM = 'Cheap pills and casino bonus at http://spam.example http://spam.example/a http://spam.example/b'
+
+
+def setup(database):
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
+	os.environ['SQLITE_PATH'] = database
+	os.environ['BLOG_CACHE_BACKEND'] = 'dummy'
+	sys.path.insert(0, str(PROJECT_DIR))
+	import django
+
+	django.setup()
+	from django.core.management import call_command
+
+	call_command('migrate', verbosity=0)
+
+
+def seed(comments, posts):
+	from django.contrib.auth.models import User
+
+	from blog.models import CommentSubmission, Post
+
+	author, _ = User.objects.get_or_create(username='bench')
+	created = Post.objects.bulk_create([Post(title=f'Post {i}', content='Body', author=author) for i in range(posts)])
+	random.seed(0)
+	rows = []
+	for i in range(comments):
+		if i % 10 == 9:
+			content = SPAM
+		else:
+			content = ' '.join(random.choice(WORDS) for _ in range(random.randint(5, 40)))
+		rows.append(CommentSubmission(post=created[i % posts], author=author, content=content))
+	CommentSubmission.objects.bulk_create(rows, batch_size=2000)
+
+
+def main(options):
+	database = options.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+	setup(database)
+	seed(options.comments, options.posts)
+
+	from blog import moderation
+
+	classifiers = moderation.load_classifiers()
+	timings, approved, rejected = [], 0, 0
+	started = time.perf_counter()
+	while True:
+		batch_started = time.perf_counter()
+		batch_approved, batch_rejected = moderation.moderate_batch(classifiers, options.batch_size)
+		if not batch_approved + batch_rejected:
+			break
+		timings.append(time.perf_counter() - batch_started)
+		approved += batch_approved
+		rejected += batch_rejected
+	elapsed = time.perf_counter() - started
+	print(f'{approved + rejected:,} comments in {elapsed:.2f}s: {(approved + rejected) / elapsed:,.0f} comments/sec')
+	print(f'{len(timings)} batches, median {statistics.median(timings) * 1000:.0f} ms')
+	print(f'approved {approved:,}, rejected {rejected:,}')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--comments', type=int, default=20000)
+	parser.add_argument('--posts', type=int, default=200)
+	parser.add_argument('--batch-size', type=int, default=500)
+	parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+	main(parser.parse_args())
@@ -0,0 +1,145 @@
+"""
+Measure what deferring the body columns saves on the listing pages.
+
+Usage (from the django_blog directory):
+
+	python benchmarks/listing_columns.py --posts 400 --body-kb 50 --requests 30
+
+The script builds a throwaway SQLite database (``--database``), seeds posts
+whose bodies average ``--body-kb`` kilobytes, and requests each listing with
+the Django test client twice: once with ``PostQuerySet.for_listing()`` as
+shipped and once with it loading every column, as it did before. For each page
+it reports the bytes the page's SELECTs returned from the database and the
+median and p95 response time. The blog cache uses the dummy backend so every
+request reaches the database.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+URLS = [
+	('post list', '/posts/'),
+	('tag listing', '/tags/bench/'),
+	('author posts', '/authors/bench/'),
+	('search', '/search/?q=benchmark'),
+]
+
+
+def setup(database):
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
+	os.environ['SQLITE_PATH'] = database
+	os.environ['BLOG_CACHE_BACKEND'] = 'dummy'
+	sys.path.insert(0, str(PROJECT_DIR))
+	import django
+
+	django.setup()
+	from django.core.management import call_command
+	from django.test.utils import setup_test_environment
+
+	setup_test_environment()
+	call_command('migrate', verbosity=0)
+
+
+def seed(posts, body_kb):
+	import random
+
+	from django.contrib.auth.models import User
+
+	from blog.models import Post, Tag
+	from blog.search import get_search_backend
+
+	author, _ = User.objects.get_or_create(username='bench')
+	tag, _ = Tag.objects.get_or_create(name='bench')
+	missing = posts - Post.objects.count()
+	if missing <= 0:
+		return
+	words = ['benchmark', 'django', 'listing', 'column', 'excerpt', 'database', 'bytes', 'latency']
+	random.seed(0)
+	batch = []
+	for i in range(missing):
+		# Bodies vary from half to one and a half times the average.
+		size = int(body_kb * 1024 * random.uniform(0.5, 1.5))
+		body = ' '.join(random.choice(words) for _ in range(size // 8))
+		post = Post(title=f'Benchmark post {i}', content=body, author=author)
+		post.render_content()
+		batch.append(post)
+		if len(batch) == 200 or i == missing - 1:
+			created = Post.objects.bulk_create(batch)
+			Post.tags.through.objects.bulk_create([Post.tags.through(post_id=p.pk, tag_id=tag.pk) for p in created])
+			get_search_backend().index_posts([p.pk for p in created])
+			batch = []
+	Post.rebuild_counters()
+
+
+def result_bytes(sql):
+	"""Size of the rows ``sql`` returns, re-running the captured statement."""
+	from django.db import connection
+
+	total = 0
+	with connection.cursor() as cursor:
+		cursor.execute(sql)
+		for row in cursor.fetchall():
+			for value in row:
+				if isinstance(value, str):
+					total += len(value.encode())
+				elif isinstance(value, (bytes, memoryview)):
+					total += len(value)
+				elif value is not None:
+					total += 8
+	return total
+
+
+def measure(client, url, requests):
+	from django.db import connection
+	from django.test.utils import CaptureQueriesContext
+
+	with CaptureQueriesContext(connection) as queries:
+		client.get(url)
+	transferred = sum(result_bytes(q['sql']) for q in queries.captured_queries if q['sql'].startswith('SELECT'))
+	timings = []
+	for _ in range(requests):
+		started = time.perf_counter()
+		response = client.get(url)
+		timings.append(time.perf_counter() - started)
+		assert response.status_code == 200, (url, response.status_code)
+	p95 = statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0]
+	return transferred, statistics.median(timings) * 1000, p95 * 1000
+
+
+def main(options):
+	database = options.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+	setup(database)
+	seed(options.posts, options.body_kb)
+
+	from django.test import Client
+
+	from blog.models import PostQuerySet
+
+	deferred = PostQuerySet.for_listing
+
+	def every_column(queryset):
+		return queryset.select_related('author').prefetch_related('tags')
+
+	client = Client()
+	print(f'{"page":<14}{"mode":<10}{"DB bytes":>14}{"p50 ms":>10}{"p95 ms":>10}')
+	for label, url in URLS:
+		for mode, for_listing in (('full', every_column), ('deferred', deferred)):
+			PostQuerySet.for_listing = for_listing
+			transferred, p50, p95 = measure(client, url, options.requests)
+			print(f'{label:<14}{mode:<10}{transferred:>14,}{p50:>10.1f}{p95:>10.1f}')
+	PostQuerySet.for_listing = deferred
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--posts', type=int, default=400)
+	parser.add_argument('--body-kb', type=float, default=50.0, help='average body size in kilobytes')
+	parser.add_argument('--requests', type=int, default=30, help='timed requests per page and mode')
+	parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+	main(parser.parse_args())
@@ -0,0 +1,126 @@
+"""
+Measure what a post edit costs with related posts: in the request, and in the worker.
+
+Usage (from the django_blog directory):
+
+	python benchmarks/related_refresh.py --posts 20000 --edits 50
+
+The script builds a throwaway SQLite database (``--database``), seeds
+``--posts`` posts of 300 words from a 5,000-word vocabulary with three tags
+each, and computes every post's neighbours as an import would. It then
+reports:
+
+- The median time to save an edited post and its tags, which only queues it.
+- The time a cold worker takes for its first queued post, matrix load included.
+- The median time a warm worker takes to refresh one queued post.
+- The time to refresh ``--edits`` queued posts in one batch.
+
+It needs numpy and scipy, like the related posts themselves.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup(database):
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
+	os.environ['SQLITE_PATH'] = database
+	sys.path.insert(0, str(PROJECT_DIR))
+	import django
+
+	django.setup()
+	from django.core.management import call_command
+
+	call_command('migrate', verbosity=0)
+
+
+def seed(posts, words):
+	import random
+
+	from django.contrib.auth.models import User
+
+	from blog import bulk
+	from blog.models import Post, Tag
+
+	missing = posts - Post.objects.count()
+	if missing <= 0:
+		return
+	random.seed(0)
+	author = User.objects.get_or_create(username='bench')[0]
+	tags = [Tag.objects.get_or_create(name=f'topic-{i}')[0] for i in range(100)]
+	for start in range(0, missing, 1000):
+		batch = []
+		for i in range(start, min(start + 1000, missing)):
+			body = ' '.join(random.choices(words, k=300))
+			batch.append(Post(title=' '.join(random.choices(words, k=5)), content=body, excerpt=body[:200], author=author))
+		created = Post.objects.bulk_create(batch)
+		Post.tags.through.objects.bulk_create([
+			Post.tags.through(post_id=post.pk, tag_id=tag.pk) for post in created for tag in random.sample(tags, 3)
+		])
+	# Counters, tag co-occurrence and every post's neighbours, as after an import.
+	bulk.finalize()
+
+
+def main(options):
+	import random
+
+	database = options.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+	setup(database)
+	random.seed(1)
+	words = [f'word{i}' for i in range(5000)]
+	seed(options.posts, words)
+
+	from blog import related
+	from blog.models import Post, Tag
+
+	tags = list(Tag.objects.all())
+	pks = list(Post.objects.values_list('pk', flat=True))
+
+	def edit(pk):
+		post = Post.objects.get(pk=pk)
+		post.content = ' '.join(random.choices(words, k=300))
+		post.save()
+		post.set_tags(random.sample(tags, 3))
+
+	saves = []
+	for pk in random.sample(pks, 20):
+		started = time.perf_counter()
+		edit(pk)
+		saves.append(time.perf_counter() - started)
+	related.reset()
+	started = time.perf_counter()
+	related.drain()
+	cold = time.perf_counter() - started
+
+	warm = []
+	for pk in random.sample(pks, 10):
+		edit(pk)
+		started = time.perf_counter()
+		related.drain()
+		warm.append(time.perf_counter() - started)
+
+	for pk in random.sample(pks, options.edits):
+		edit(pk)
+	started = time.perf_counter()
+	related.drain()
+	batch = time.perf_counter() - started
+
+	print(f'{len(pks):,} posts')
+	print(f'save (queue only)     {statistics.median(saves) * 1000:8.1f} ms')
+	print(f'cold worker, 20 posts {cold * 1000:8.1f} ms')
+	print(f'warm worker, 1 post   {statistics.median(warm) * 1000:8.1f} ms')
+	print(f'warm worker, {options.edits} posts {batch * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--posts', type=int, default=20000)
+	parser.add_argument('--edits', type=int, default=50, help='posts refreshed in one batch')
+	parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+	main(parser.parse_args())
@@ -0,0 +1,79 @@
+"""
+Measure search-suggestion latency and memory on a large prefix index.
+
+Usage (from the django_blog directory):
+
+	python benchmarks/suggest_latency.py --titles 1000000 --lookups 5000
+
+The script builds a ``SuggestionIndex`` in memory from ``--titles`` random
+titles (3 to 10 words from a 50,000-word vocabulary) and ``--tags`` tag names,
+without touching a database. It reports the build time, the number of index
+entries, the median, p99 and maximum lookup latency for random word prefixes,
+the mean and maximum time to add each of ``--adds`` posts (the maximum
+includes merging the insert buffer into the main array), and the process's
+peak memory.
+"""
+import argparse
+import os
+import random
+import resource
+import string
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup():
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
+	sys.path.insert(0, str(PROJECT_DIR))
+	import django
+
+	django.setup()
+
+
+def main(options):
+	setup()
+	from blog.suggest import SuggestionIndex
+
+	random.seed(0)
+	words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(50000)]
+	titles = [
+		(pk, ' '.join(random.choices(words, k=random.randint(3, 10))).title())
+		for pk in range(1, options.titles + 1)
+	]
+	tags = [(pk, word, word) for pk, word in enumerate(words[:options.tags], start=1)]
+
+	started = time.perf_counter()
+	index = SuggestionIndex(titles, tags, limit=options.titles)
+	print(f'built {len(index.entries):,} entries in {time.perf_counter() - started:.1f}s')
+
+	timings = []
+	for _ in range(options.lookups):
+		word = random.choice(words)
+		prefix = word[:random.randint(1, len(word))]
+		started = time.perf_counter()
+		index.suggest(prefix)
+		timings.append(time.perf_counter() - started)
+	timings.sort()
+	p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+	print(f'lookup p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms, max {timings[-1] * 1000:.3f} ms')
+
+	timings = []
+	for pk in range(options.titles + 1, options.titles + options.adds + 1):
+		title = ' '.join(random.choices(words, k=random.randint(3, 10))).title()
+		started = time.perf_counter()
+		index.set_post(pk, title)
+		timings.append(time.perf_counter() - started)
+	print(f'add a post mean {sum(timings) / len(timings) * 1000:.3f} ms, max {max(timings) * 1000:.1f} ms')
+	print(f'peak memory {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--titles', type=int, default=1000000)
+	parser.add_argument('--tags', type=int, default=5000)
+	parser.add_argument('--lookups', type=int, default=5000)
+	parser.add_argument('--adds', type=int, default=5000)
+	main(parser.parse_args())
@@ -0,0 +1,293 @@
+"""
+Read-only JSON API for posts, comments and tags.
+
+Rows are read with ``values_list()`` and zipped straight into dicts: no model
+instances are built. ``?fields=title,author`` limits a response to the named
+fields and the query to their columns, so a listing never reads a post body
+nobody asked for. List endpoints page with ``KeysetPaginator``:
+``?cursor=`` takes the ``next``/``previous`` token of the page before, and
+``?limit=`` sets the page size (up to ``BLOG_API_MAX_PAGE_SIZE``).
+
+The export endpoints stream every matching row as JSON Lines, one object
+per line. They read ``EXPORT_CHUNK_SIZE`` rows per query in primary-key
+order, so memory use stays flat however large the table is.
+
+Malformed parameters get a 400 and unknown objects a 404, both as
+``{"error": "..."}``.
+"""
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from .models import Comment, Post, Tag
+from .pagination import KeysetPaginator
+from .views import ParentPostMixin
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def page_size(value):
+	default = getattr(settings, 'BLOG_API_PAGE_SIZE', 50)
+	largest = getattr(settings, 'BLOG_API_MAX_PAGE_SIZE', 200)
+	if not value:
+		return default
+	try:
+		size = int(value)
+	except ValueError:
+		size = 0
+	if not 1 <= size <= largest:
+		raise BadRequest(f'limit must be a whole number from 1 to {largest}.')
+	return size
+
+
+class Resource:
+	"""
+	A model as the API shows it. ``columns`` maps each output field to the
+	lookup ``values_list()`` reads it from; ``lists`` are fields filled from
+	one extra query per page by ``load_list()``.
+	"""
+
+	columns = {}
+	lists = ()
+	default_fields = ()
+	detail_fields = None
+
+	def parse_fields(self, value, default=None):
+		"""The output fields named by a ``?fields=`` value, in request order."""
+		if not value:
+			return list(default or self.default_fields)
+		names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+		unknown = [name for name in names if name not in self.columns and name not in self.lists]
+		if unknown or not names:
+			available = ', '.join([*self.columns, *self.lists])
+			raise BadRequest(f'Unknown fields: {", ".join(unknown) or "(none given)"}. Available: {available}.')
+		return names
+
+	def load_list(self, name, pks):
+		"""Return ``{pk: [values]}`` for the list field ``name``."""
+		raise NotImplementedError
+
+
+class Selection:
+	"""
+	The columns to read for some output fields, plus the ones paging needs.
+
+	The requested columns come first and the extra ones (cursor keys, the
+	primary key for list fields) are appended, so ``zip()`` against the
+	requested names drops the extras without looking at them.
+	"""
+
+	def __init__(self, resource, names, ordering):
+		self.resource = resource
+		self.names = [name for name in names if name in resource.columns]
+		self.lists = [name for name in names if name in resource.lists]
+		self.lookups = [resource.columns[name] for name in self.names]
+		self.key_positions = [self._position(name.lstrip('-')) for name in ordering]
+		self.pk_position = self._position('id')
+
+	def _position(self, lookup):
+		if lookup not in self.lookups:
+			self.lookups.append(lookup)
+		return self.lookups.index(lookup)
+
+	def key(self, row):
+		return [row[position] for position in self.key_positions]
+
+	def rows(self, queryset):
+		return queryset.values_list(*self.lookups)
+
+	def serialize(self, rows):
+		names = self.names
+		objects = [dict(zip(names, row)) for row in rows]
+		if self.lists and rows:
+			pks = [row[self.pk_position] for row in rows]
+			for name in self.lists:
+				values = self.resource.load_list(name, pks)
+				for obj, pk in zip(objects, pks):
+					obj[name] = values.get(pk, [])
+		return objects
+
+
+class PostResource(Resource):
+	columns = {
+		'id': 'id',
+		'title': 'title',
+		'author': 'author__username',
+		'published_date': 'published_date',
+		'updated': 'updated',
+		'excerpt': 'excerpt',
+		'content': 'content',
+		'content_html': 'content_html',
+		'comment_count': 'comment_count',
+		'last_commented_at': 'last_commented_at',
+	}
+	lists = ('tags',)
+	default_fields = ('id', 'title', 'author', 'published_date', 'updated', 'excerpt', 'comment_count', 'tags')
+	detail_fields = default_fields + ('content_html',)
+
+	def load_list(self, name, pks):
+		tags = {}
+		rows = (
+			Post.tags.through.objects.filter(post_id__in=pks)
+			.order_by('tag__name')
+			.values_list('post_id', 'tag__name')
+		)
+		for post_id, tag in rows:
+			tags.setdefault(post_id, []).append(tag)
+		return tags
+
+
+class CommentResource(Resource):
+	columns = {
+		'id': 'id',
+		'post': 'post_id',
+		'parent': 'parent_id',
+		'author': 'author__username',
+		'content': 'content',
+		'created_at': 'created_at',
+		'updated_at': 'updated_at',
+	}
+	default_fields = tuple(columns)
+
+
+class TagResource(Resource):
+	columns = {'id': 'id', 'name': 'name', 'slug': 'slug', 'post_count': 'post_count'}
+	default_fields = tuple(columns)
+
+
+class ApiView(View):
+	"""Base view: GET only, with errors answered as JSON."""
+
+	http_method_names = ['get', 'head', 'options']
+	resource = None
+
+	def dispatch(self, request, *args, **kwargs):
+		try:
+			return super().dispatch(request, *args, **kwargs)
+		except BadRequest as exc:
+			return JsonResponse({'error': str(exc)}, status=400)
+		except Http404 as exc:
+			return JsonResponse({'error': str(exc) or 'Not found.'}, status=404)
+
+	def get_queryset(self):
+		raise NotImplementedError
+
+	def get_fields(self, default=None):
+		return self.resource.parse_fields(self.request.GET.get('fields'), default)
+
+
+class ResourceListView(ApiView):
+	"""One page of ``get_queryset()`` in ``ordering``, which must be unique per row."""
+
+	ordering = ()
+
+	def get(self, request, *args, **kwargs):
+		selection = Selection(self.resource, self.get_fields(), self.ordering)
+		paginator = KeysetPaginator(
+			selection.rows(self.get_queryset()), page_size(request.GET.get('limit')),
+			ordering=self.ordering, key=selection.key,
+		)
+		try:
+			page = paginator.page(request.GET.get('cursor'))
+		except ValueError:
+			raise BadRequest('Invalid page cursor.')
+		return JsonResponse({
+			'results': selection.serialize(page.object_list),
+			'next': page.next_cursor,
+			'previous': page.previous_cursor,
+		})
+
+
+class ResourceExportView(ApiView):
+	"""Every row of ``get_queryset()`` in primary-key order, streamed as JSON Lines."""
+
+	def get(self, request, *args, **kwargs):
+		selection = Selection(self.resource, self.get_fields(), ('id',))
+		return StreamingHttpResponse(
+			stream_rows(selection, self.get_queryset(), EXPORT_CHUNK_SIZE),
+			content_type='application/x-ndjson; charset=utf-8',
+		)
+
+
+def stream_rows(selection, queryset, chunk_size):
+	"""Yield one block of JSON Lines per ``chunk_size`` rows, seeking by primary key."""
+	encode = DjangoJSONEncoder().encode
+	queryset = selection.rows(queryset).order_by('pk')
+	after = None
+	while True:
+		chunk = queryset if after is None else queryset.filter(pk__gt=after)
+		rows = list(chunk[:chunk_size])
+		if not rows:
+			return
+		yield ''.join(encode(obj) + '\n' for obj in selection.serialize(rows))
+		after = rows[-1][selection.pk_position]
+
+
+class PostQueryMixin:
+	"""Posts, optionally narrowed by ``?tag=<slug>`` and ``?author=<username>``."""
+
+	resource = PostResource()
+
+	def get_queryset(self):
+		queryset = Post.objects.all()
+		tag = self.request.GET.get('tag')
+		if tag:
+			queryset = queryset.tagged(Tag.objects.filter(slug=tag))
+		author = self.request.GET.get('author')
+		if author:
+			queryset = queryset.filter(author__username=author)
+		return queryset
+
+
+class PostListView(PostQueryMixin, ResourceListView):
+	ordering = ('-published_date', '-id')
+
+
+class PostExportView(PostQueryMixin, ResourceExportView):
+	pass
+
+
+class PostDetailView(ApiView):
+	resource = PostResource()
+
+	def get(self, request, pk):
+		selection = Selection(self.resource, self.get_fields(self.resource.detail_fields), ())
+		rows = list(selection.rows(Post.objects.filter(pk=pk)))
+		if not rows:
+			raise Http404('No post found matching the query.')
+		return JsonResponse(selection.serialize(rows)[0])
+
+
+class CommentListView(ParentPostMixin, ResourceListView):
+	"""A post's comments in thread order: each reply follows its parent."""
+
+	resource = CommentResource()
+	ordering = ('path',)
+
+	def get_queryset(self):
+		return Comment.objects.filter(post=self.parent_post)
+
+
+class CommentExportView(ResourceExportView):
+	"""Every comment, or a single post's with ``?post=<id>``."""
+
+	resource = CommentResource()
+
+	def get_queryset(self):
+		queryset = Comment.objects.all()
+		post = self.request.GET.get('post')
+		if post:
+			if not post.isdigit():
+				raise BadRequest('post must be a post id.')
+			queryset = queryset.filter(post_id=post)
+		return queryset
+
+
+class TagListView(ResourceListView):
+	resource = TagResource()
+	ordering = ('name',)
+
+	def get_queryset(self):
+		return Tag.objects.all()
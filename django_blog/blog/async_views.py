@@ -0,0 +1,117 @@
+"""
+ASGI-native versions of the public read views.
+
+Each class subclasses its sync counterpart in ``blog/views.py`` (so querysets,
+cache versions and validators stay in one place) and replaces ``get`` with a
+coroutine that reads through the async ORM. Every row a template needs is
+fetched before rendering, so templates render on the event loop without a
+thread hop. Mounted under ``/async/`` by ``blog/urls.py``.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+
+from .caching import arender_comment_thread, arender_post_cards
+from .forms import CommentForm
+from .models import Post, PostSimilarity, Tag
+from .tag_stats import related_tags, tag_cloud
+from .views import (
+	PostByTagListView,
+	PostDetailView,
+	PostListView,
+	PostSearchView,
+	TaggedPostListView,
+	acomment_thread_context,
+)
+
+
+class AsyncReadViewMixin:
+	"""Load the user and session up front; templates read both synchronously."""
+
+	async def dispatch(self, request, *args, **kwargs):
+		request.user = await request.auser()
+		# Fills the session cache that the messages framework reads.
+		await request.session.aitems()
+		return await super().dispatch(request, *args, **kwargs)
+
+	def render(self, context):
+		return HttpResponse(render_to_string(self.template_name, context, self.request))
+
+
+class AsyncListMixin(AsyncReadViewMixin):
+	async def aget_extra_context(self, posts):
+		return {}
+
+	async def get(self, request, *args, **kwargs):
+		queryset = self.get_queryset()
+		paginator, page, posts, is_paginated = await self.apaginate_queryset(
+			queryset, self.get_paginate_by(queryset)
+		)
+		context = {
+			'view': self,
+			'paginator': paginator,
+			'page_obj': page,
+			'is_paginated': is_paginated,
+			'object_list': posts,
+			self.context_object_name: posts,
+		}
+		context.update(await self.aget_extra_context(posts))
+		return self.render(context)
+
+
+class AsyncPostListView(AsyncListMixin, PostListView):
+	async def aget_extra_context(self, posts):
+		return {'post_cards': await arender_post_cards(posts)}
+
+
+async def atag_sidebar_context(tag):
+	# Usually served from tag_stats' per-process LRU; the thread hop covers misses.
+	return {
+		'related_tags': await sync_to_async(related_tags)(tag) if tag else [],
+		'tag_cloud': await sync_to_async(tag_cloud)(),
+	}
+
+
+class AsyncTaggedPostListView(AsyncListMixin, TaggedPostListView):
+	async def aget_extra_context(self, posts):
+		tag = await Tag.objects.named(self.kwargs['tag_name']).afirst()
+		return {'tag_name': self.kwargs['tag_name'], **await atag_sidebar_context(tag)}
+
+
+class AsyncPostByTagListView(AsyncListMixin, PostByTagListView):
+	async def aget_extra_context(self, posts):
+		tag_slug = self.kwargs['tag_slug']
+		tag = await Tag.objects.filter(slug=tag_slug).afirst()
+		return {'tag': tag, 'tag_name': tag.name if tag else tag_slug, **await atag_sidebar_context(tag)}
+
+
+class AsyncPostSearchView(AsyncListMixin, PostSearchView):
+	async def aget_extra_context(self, posts):
+		return {'query': self.get_search_query()}
+
+
+class AsyncPostDetailView(AsyncReadViewMixin, PostDetailView):
+	async def get(self, request, *args, **kwargs):
+		try:
+			self.object = await self.get_queryset().aget(pk=self.kwargs['pk'])
+		except Post.DoesNotExist:
+			raise Http404('No post found matching the query.')
+
+		post = self.object
+		cursor = request.GET.get('comments')
+		context = {
+			'view': self,
+			'object': post,
+			'post': post,
+			'comment_form': CommentForm(),
+			'related_posts': [row async for row in PostSimilarity.objects.for_post(post.pk)],
+		}
+		if request.user.is_authenticated:
+			context.update(await acomment_thread_context(post, cursor))
+		else:
+			context['comment_thread'] = await arender_comment_thread(
+				post,
+				lambda: acomment_thread_context(post, cursor),
+				variant=cursor or '',
+			)
+		return self.render(context)
@@ -0,0 +1,315 @@
+"""
+Streaming bulk import and export of posts with their tags and comments.
+
+Each record is one post::
+
+	{"id": 12, "title": "...", "content": "...", "author": "alice",
+	 "published_date": "2024-03-01T12:00:00+00:00", "updated": "...",
+	 "tags": ["django", "orm"],
+	 "comments": [{"id": 7, "parent": null, "author": "bob", "content": "...",
+	               "created_at": "...", "updated_at": "..."}]}
+
+JSONL files hold one record per line. CSV files have the columns in
+``CSV_FIELDS``; ``tags`` and ``comments`` are JSON-encoded in their cells.
+``id`` and comment ids only link replies to their parent inside one record;
+imported rows get new primary keys.
+
+``Importer`` writes a batch of records with a fixed number of queries:
+``bulk_create`` for users, posts, through-table rows and one per comment
+depth, ``Tag.objects.resolve_names`` for tags. No per-row signals fire, so
+``finalize()`` rebuilds the derived tables once at the end.
+"""
+import csv
+import json
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, related
+from .models import Comment, Post, PostArchiveBucket, Tag, TagCooccurrence, path_segment
+from .search import get_search_backend
+
+FORMATS = ('jsonl', 'csv')
+CSV_FIELDS = ['id', 'title', 'content', 'author', 'published_date', 'updated', 'tags', 'comments']
+# Comment threads can make a CSV cell much larger than csv's 128 KiB default.
+CSV_FIELD_LIMIT = 2 ** 31 - 1
+
+
+def detect_format(path, fmt=None):
+	return fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+
+
+def _datetime(value, field):
+	if not value:
+		return timezone.now()
+	parsed = parse_datetime(value)
+	if parsed is None:
+		raise ValueError(f'{field} is not an ISO 8601 datetime: {value!r}')
+	if timezone.is_naive(parsed):
+		parsed = timezone.make_aware(parsed)
+	return parsed
+
+
+def clean_record(record):
+	"""Validate one record and convert its dates; raises ``ValueError``."""
+	for field in ('title', 'content', 'author'):
+		if not record.get(field):
+			raise ValueError(f'missing {field}')
+	record['published_date'] = _datetime(record.get('published_date'), 'published_date')
+	if record.get('updated'):
+		record['updated'] = _datetime(record['updated'], 'updated')
+	else:
+		record['updated'] = record['published_date']
+	record['tags'] = list(record.get('tags') or ())
+	record['comments'] = list(record.get('comments') or ())
+	depths = {}
+	for comment in record['comments']:
+		if not comment.get('author') or not comment.get('content'):
+			raise ValueError(f'comment {comment.get("id")!r} is missing author or content')
+		parent = comment.get('parent')
+		if parent is not None and parent not in depths:
+			raise ValueError(f'comment {comment.get("id")!r} precedes its parent {parent!r}')
+		depth = depths[parent] + 1 if parent is not None else 0
+		# The same limit as replying on the site: deeper paths would not fit in ``Comment.path``.
+		if depth >= Comment.MAX_DEPTH:
+			raise ValueError(f'comment {comment.get("id")!r} is nested deeper than {Comment.MAX_DEPTH} levels')
+		depths[comment.get('id')] = depth
+		comment['created_at'] = _datetime(comment.get('created_at'), 'created_at')
+		if comment.get('updated_at'):
+			comment['updated_at'] = _datetime(comment['updated_at'], 'updated_at')
+		else:
+			comment['updated_at'] = comment['created_at']
+	return record
+
+
+def _from_csv_row(row):
+	record = dict(row)
+	record['tags'] = json.loads(record.get('tags') or '[]')
+	record['comments'] = json.loads(record.get('comments') or '[]')
+	return record
+
+
+def read_records(path, fmt, skip=0):
+	"""Yield cleaned records from ``path`` one at a time, after the first ``skip``."""
+	with open(path, encoding='utf-8', newline='') as handle:
+		if fmt == 'csv':
+			csv.field_size_limit(CSV_FIELD_LIMIT)
+			records = map(_from_csv_row, csv.DictReader(handle))
+		else:
+			records = (json.loads(line) for line in handle if line.strip())
+		for number, record in enumerate(islice(records, skip, None), start=skip + 1):
+			try:
+				yield clean_record(record)
+			except (ValueError, TypeError, AttributeError) as exc:
+				raise ValueError(f'record {number}: {exc}') from exc
+
+
+class RecordWriter:
+	def __init__(self, handle, fmt):
+		self.handle = handle
+		self.csv = csv.DictWriter(handle, CSV_FIELDS) if fmt == 'csv' else None
+
+	def header(self):
+		if self.csv:
+			self.csv.writeheader()
+
+	def write(self, record):
+		if self.csv:
+			self.csv.writerow({
+				**record,
+				'tags': json.dumps(record['tags']),
+				'comments': json.dumps(record['comments']),
+			})
+		else:
+			self.handle.write(json.dumps(record) + '\n')
+
+
+def export_records(after=0, batch_size=1000):
+	"""
+	Yield ``(post_pk, record)`` for posts with ``pk > after`` in primary-key
+	order, reading ``batch_size`` posts (plus their tags and comments) per step.
+	"""
+	while True:
+		posts = list(
+			Post.objects.filter(pk__gt=after)
+			.order_by('pk')
+			.select_related('author')
+			.prefetch_related('tags')[:batch_size]
+		)
+		if not posts:
+			return
+		comments = {}
+		rows = (
+			Comment.objects.filter(post_id__in=[post.pk for post in posts])
+			.order_by('post_id', 'path')
+			.values_list('post_id', 'id', 'parent_id', 'author__username', 'content', 'created_at', 'updated_at')
+		)
+		for post_id, pk, parent_id, author, content, created_at, updated_at in rows:
+			comments.setdefault(post_id, []).append({
+				'id': pk,
+				'parent': parent_id,
+				'author': author,
+				'content': content,
+				'created_at': created_at.isoformat(),
+				'updated_at': updated_at.isoformat(),
+			})
+		for post in posts:
+			yield post.pk, {
+				'id': post.pk,
+				'title': post.title,
+				'content': post.content,
+				'author': post.author.username,
+				'published_date': post.published_date.isoformat(),
+				'updated': post.updated.isoformat(),
+				'tags': [tag.name for tag in post.tags.all()],
+				'comments': comments.get(post.pk, []),
+			}
+		after = posts[-1].pk
+
+
+@contextmanager
+def keep_timestamps():
+	"""
+	Store the records' own dates: ``bulk_create`` would otherwise let
+	``auto_now``/``auto_now_add`` overwrite them. Only for management commands,
+	since it changes the fields for the whole process while active.
+	"""
+	fields = [Post._meta.get_field(name) for name in ('published_date', 'updated')]
+	fields += [Comment._meta.get_field(name) for name in ('created_at', 'updated_at')]
+	saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+	for field in fields:
+		field.auto_now = field.auto_now_add = False
+	try:
+		yield
+	finally:
+		for field, auto_now, auto_now_add in saved:
+			field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+	"""Writes batches of cleaned records; call inside ``keep_timestamps()``."""
+
+	def import_batch(self, records):
+		"""Insert one batch of records; return ``(posts, comments)`` created."""
+		users = self._resolve_users(
+			{record['author'] for record in records}
+			| {comment['author'] for record in records for comment in record['comments']}
+		)
+		posts = [
+			Post(
+				title=record['title'],
+				content=record['content'],
+				author_id=users[record['author']],
+				published_date=record['published_date'],
+				updated=record['updated'],
+			)
+			for record in records
+		]
+		for post in posts:
+			# bulk_create skips Post.save(), which normally renders the body.
+			post.render_content()
+		Post.objects.bulk_create(posts)
+		self._link_tags(records, posts)
+		comments = self._create_comments(records, posts, users)
+		get_search_backend().index_posts([post.pk for post in posts])
+		return len(posts), comments
+
+	def _resolve_users(self, usernames):
+		found = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+		missing = [name for name in usernames if name not in found]
+		if missing:
+			try:
+				with transaction.atomic():
+					User.objects.bulk_create([User(username=name, password=make_password(None)) for name in missing])
+			except IntegrityError:
+				# Another writer created some of these users first; their rows are used below.
+				pass
+			found.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+		return found
+
+	def _link_tags(self, records, posts):
+		tags = {tag.name: tag.pk for tag in Tag.objects.resolve_names(
+			name for record in records for name in record['tags']
+		)}
+		Through = Post.tags.through
+		links = {
+			(post.pk, tags[name.strip()])
+			for record, post in zip(records, posts)
+			for name in record['tags']
+			if name and name.strip()
+		}
+		Through.objects.bulk_create([Through(post_id=post_id, tag_id=tag_id) for post_id, tag_id in links], batch_size=2000)
+
+	def _create_comments(self, records, posts, users):
+		"""One ``bulk_create`` per thread depth, then one ``bulk_update`` of every ``path``."""
+		levels = []
+		for record, post in zip(records, posts):
+			depth = {}
+			for comment in record['comments']:
+				parent = comment.get('parent')
+				depth[comment.get('id')] = level = depth[parent] + 1 if parent is not None else 0
+				if level == len(levels):
+					levels.append([])
+				levels[level].append((post.pk, comment))
+
+		created, rows = {}, []
+		for level in levels:
+			objects = Comment.objects.bulk_create([
+				Comment(
+					post_id=post_id,
+					author_id=users[comment['author']],
+					parent=created[post_id, comment['parent']] if comment.get('parent') is not None else None,
+					content=comment['content'],
+					created_at=comment['created_at'],
+					updated_at=comment['updated_at'],
+				)
+				for post_id, comment in level
+			])
+			for (post_id, comment), obj in zip(level, objects):
+				obj.path = (obj.parent.path if obj.parent else '') + path_segment(obj.pk)
+				created[post_id, comment.get('id')] = obj
+				rows.append(obj)
+		Comment.objects.bulk_update(rows, ['path'], batch_size=500)
+		return len(rows)
+
+
+def finalize():
+	"""Rebuild what per-row signals would have maintained during the import."""
+	Post.rebuild_counters()
+	PostArchiveBucket.objects.rebuild()
+	TagCooccurrence.objects.rebuild()
+	if related.available():
+		related.rebuild()
+	caching.bump('posts', 'tags')
+
+
+class Progress:
+	"""Counts rows and reports throughput to ``stream`` at most every ``interval`` seconds."""
+
+	def __init__(self, stream, label, interval=2.0):
+		self.stream = stream
+		self.label = label
+		self.interval = interval
+		self.rows = 0
+		self.started = self.reported = time.monotonic()
+
+	@property
+	def elapsed(self):
+		return time.monotonic() - self.started
+
+	@property
+	def rate(self):
+		return self.rows / self.elapsed if self.elapsed else 0.0
+
+	def add(self, rows):
+		self.rows += rows
+		now = time.monotonic()
+		if self.stream is not None and now - self.reported >= self.interval:
+			self.stream.write(f'{self.label} {self.rows} rows ({self.rate:.0f} rows/sec)')
+			self.reported = now
@@ -0,0 +1,291 @@
+"""
+Versioned caching for blog pages and fragments.
+
+Every cache key embeds the current value of one or more *version counters*
+(``posts``, ``post:<pk>``, ``comments:<post_pk>``, ``tag:<slug>``). Receivers in
+``blog/signals.py`` bump only the counters a change affects, so stale entries are
+never read again and simply age out of the cache.
+
+The cache alias comes from ``BLOG_CACHE_ALIAS`` (default ``'default'``), so any
+Django cache backend works: locmem, file-based or Redis.
+"""
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+VERSION_PREFIX = 'blog:v:'
+# When each counter was last bumped, for Last-Modified headers.
+BUMPED_PREFIX = 'blog:bumped:'
+METRICS_PREFIX = 'blog:metrics:'
+METRIC_NAMESPACES = ('page', 'post_card', 'comment_thread', 'feed_entry')
+
+
+def get_cache():
+	return caches[getattr(settings, 'BLOG_CACHE_ALIAS', 'default')]
+
+
+def fragment_timeout():
+	return getattr(settings, 'BLOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_versions(*names):
+	"""Return ``{name: version}``; counters that were never bumped are at version 1."""
+	stored = get_cache().get_many([VERSION_PREFIX + name for name in names])
+	return {name: stored.get(VERSION_PREFIX + name, 1) for name in names}
+
+
+async def aget_versions(*names):
+	stored = await get_cache().aget_many([VERSION_PREFIX + name for name in names])
+	return {name: stored.get(VERSION_PREFIX + name, 1) for name in names}
+
+
+def _version_state(names, stored):
+	versions = {name: stored.get(VERSION_PREFIX + name, 1) for name in names}
+	bumped = [stored.get(BUMPED_PREFIX + name) for name in names if versions[name] != 1]
+	if None in bumped:
+		return versions, None
+	return versions, datetime.datetime.fromtimestamp(max(bumped, default=0), tz=datetime.timezone.utc)
+
+
+def get_version_state(*names):
+	"""
+	``(versions, bumped_at)``: the counters as ``get_versions()`` returns them,
+	and when the latest of them was bumped as an aware datetime (the epoch if
+	none ever was). ``bumped_at`` is ``None`` when a bumped counter's time has
+	been evicted, so no modification date can be trusted.
+	"""
+	keys = [prefix + name for name in names for prefix in (VERSION_PREFIX, BUMPED_PREFIX)]
+	return _version_state(names, get_cache().get_many(keys))
+
+
+async def aget_version_state(*names):
+	keys = [prefix + name for name in names for prefix in (VERSION_PREFIX, BUMPED_PREFIX)]
+	return _version_state(names, await get_cache().aget_many(keys))
+
+
+def bump(*names):
+	cache = get_cache()
+	names = set(names)
+	for name in names:
+		key = VERSION_PREFIX + name
+		try:
+			cache.incr(key)
+		except ValueError:
+			# Missing counters read as 1. If add() loses a race, the key exists now.
+			if not cache.add(key, 2, timeout=None):
+				cache.incr(key)
+	now = time.time()
+	cache.set_many({BUMPED_PREFIX + name: now for name in names}, timeout=None)
+
+
+def tag_name_version(name):
+	"""
+	The counter for the tag page at ``/tags/<name>/``. The name comes from the
+	URL, so it is hashed: any spaces or length still make a valid memcached key.
+	"""
+	return 'tag-name:' + hashlib.md5(name.lower().encode()).hexdigest()
+
+
+def record(namespace, hits=0, misses=0):
+	cache = get_cache()
+	for outcome, count in (('hits', hits), ('misses', misses)):
+		if not count:
+			continue
+		key = f'{METRICS_PREFIX}{namespace}:{outcome}'
+		try:
+			cache.incr(key, count)
+		except ValueError:
+			if not cache.add(key, count, timeout=None):
+				cache.incr(key, count)
+
+
+async def arecord(namespace, hits=0, misses=0):
+	cache = get_cache()
+	for outcome, count in (('hits', hits), ('misses', misses)):
+		if not count:
+			continue
+		key = f'{METRICS_PREFIX}{namespace}:{outcome}'
+		try:
+			await cache.aincr(key, count)
+		except ValueError:
+			if not await cache.aadd(key, count, timeout=None):
+				await cache.aincr(key, count)
+
+
+def metrics():
+	"""Return ``{namespace: {'hits': n, 'misses': n}}`` for every cached namespace."""
+	keys = [f'{METRICS_PREFIX}{ns}:{outcome}' for ns in METRIC_NAMESPACES for outcome in ('hits', 'misses')]
+	stored = get_cache().get_many(keys)
+	return {
+		ns: {outcome: stored.get(f'{METRICS_PREFIX}{ns}:{outcome}', 0) for outcome in ('hits', 'misses')}
+		for ns in METRIC_NAMESPACES
+	}
+
+
+def _versioned_key(prefix, ident, versions):
+	stamp = '.'.join(str(versions[name]) for name in sorted(versions))
+	return f'{prefix}:{ident}:{stamp}'
+
+
+def _fragment_keys(namespace, objects, versions, variant):
+	return [
+		_versioned_key(f'blog:frag:{namespace}{variant}', obj.pk, {'post': versions[f'post:{obj.pk}']})
+		for obj in objects
+	]
+
+
+def _fill_fragments(keys, objects, cached, render):
+	"""Return ``(fragments, missing)``, rendering the objects whose key is not in ``cached``."""
+	missing = {}
+	fragments = []
+	for key, obj in zip(keys, objects):
+		if key not in cached:
+			missing[key] = render(obj)
+		fragments.append(mark_safe(cached[key] if key in cached else missing[key]))
+	return fragments, missing
+
+
+def cached_fragments(namespace, objects, render, variant=''):
+	"""
+	Return ``render(obj)`` for each object, keyed on the object's ``post:<pk>``
+	version. Cached fragments are fetched with a single ``get_many``.
+	"""
+	objects = list(objects)
+	keys = _fragment_keys(namespace, objects, get_versions(*(f'post:{obj.pk}' for obj in objects)), variant)
+	cache = get_cache()
+	fragments, missing = _fill_fragments(keys, objects, cache.get_many(keys), render)
+	if missing:
+		cache.set_many(missing, fragment_timeout())
+	record(namespace, hits=len(objects) - len(missing), misses=len(missing))
+	return fragments
+
+
+async def acached_fragments(namespace, objects, render, variant=''):
+	objects = list(objects)
+	versions = await aget_versions(*(f'post:{obj.pk}' for obj in objects))
+	keys = _fragment_keys(namespace, objects, versions, variant)
+	cache = get_cache()
+	fragments, missing = _fill_fragments(keys, objects, await cache.aget_many(keys), render)
+	if missing:
+		await cache.aset_many(missing, fragment_timeout())
+	await arecord(namespace, hits=len(objects) - len(missing), misses=len(missing))
+	return fragments
+
+
+def _render_post_card(post):
+	return render_to_string('blog/post_card.html', {'post': post})
+
+
+def render_post_cards(posts):
+	"""Return the rendered card for each post, reusing cached cards with one ``get_many``."""
+	return cached_fragments('post_card', posts, _render_post_card)
+
+
+async def arender_post_cards(posts):
+	return await acached_fragments('post_card', posts, _render_post_card)
+
+
+def _comment_thread_key(post, versions, variant):
+	ident = f'{post.pk}:{hashlib.md5(variant.encode()).hexdigest()}'
+	return _versioned_key('blog:frag:comment_thread', ident, versions)
+
+
+def render_comment_thread(post, get_context, variant=''):
+	"""
+	Return the anonymous view of one page of ``post``'s comment threads.
+	``get_context`` builds the template context and only runs on a miss;
+	``variant`` tells pages of the same thread apart (e.g. the page cursor).
+	"""
+	key = _comment_thread_key(post, get_versions(f'comments:{post.pk}'), variant)
+	cache = get_cache()
+	html = cache.get(key)
+	if html is not None:
+		record('comment_thread', hits=1)
+		return mark_safe(html)
+	html = render_to_string('blog/comment_thread.html', get_context())
+	cache.set(key, html, fragment_timeout())
+	record('comment_thread', misses=1)
+	return html
+
+
+async def arender_comment_thread(post, aget_context, variant=''):
+	"""Async ``render_comment_thread()``; ``aget_context`` is a coroutine function."""
+	key = _comment_thread_key(post, await aget_versions(f'comments:{post.pk}'), variant)
+	cache = get_cache()
+	html = await cache.aget(key)
+	if html is not None:
+		await arecord('comment_thread', hits=1)
+		return mark_safe(html)
+	html = render_to_string('blog/comment_thread.html', await aget_context())
+	await cache.aset(key, html, fragment_timeout())
+	await arecord('comment_thread', misses=1)
+	return html
+
+
+class AnonymousPageCacheMixin:
+	"""
+	Serve whole GET responses to anonymous visitors from the blog cache.
+
+	Subclasses list the version counters the page depends on in
+	``get_page_cache_versions()``; bumping any of them invalidates the page.
+	"""
+
+	def get_page_cache_versions(self):
+		raise NotImplementedError
+
+	def _page_key(self, request, versions):
+		path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+		return _versioned_key(f'blog:page:{type(self).__name__}', path, versions)
+
+	@staticmethod
+	def _cacheable(response):
+		if response.status_code != 200 or response.streaming:
+			return None
+		if hasattr(response, 'render'):
+			response.render()
+		return (response.content, response['Content-Type'])
+
+	def dispatch(self, request, *args, **kwargs):
+		if request.method != 'GET' or request.user.is_authenticated or len(get_messages(request)):
+			return super().dispatch(request, *args, **kwargs)
+
+		self.args, self.kwargs = args, kwargs
+		if self.view_is_async:
+			return self._page_cache_adispatch(request, *args, **kwargs)
+		key = self._page_key(request, get_versions(*self.get_page_cache_versions()))
+		cache = get_cache()
+		cached = cache.get(key)
+		if cached is not None:
+			record('page', hits=1)
+			content, content_type = cached
+			return HttpResponse(content, content_type=content_type)
+
+		response = super().dispatch(request, *args, **kwargs)
+		entry = self._cacheable(response)
+		if entry is not None:
+			cache.set(key, entry, fragment_timeout())
+		record('page', misses=1)
+		return response
+
+	async def _page_cache_adispatch(self, request, *args, **kwargs):
+		key = self._page_key(request, await aget_versions(*self.get_page_cache_versions()))
+		cache = get_cache()
+		cached = await cache.aget(key)
+		if cached is not None:
+			await arecord('page', hits=1)
+			content, content_type = cached
+			return HttpResponse(content, content_type=content_type)
+
+		response = await super().dispatch(request, *args, **kwargs)
+		entry = self._cacheable(response)
+		if entry is not None:
+			await cache.aset(key, entry, fragment_timeout())
+		await arecord('page', misses=1)
+		return response
@@ -0,0 +1,173 @@
+"""
+Conditional GET (ETag / Last-Modified) for blog read views.
+
+Validators come from a cheap query over the rows a page shows (ids, ``updated``
+timestamps, comment counters) instead of a full render, so a matching
+``If-None-Match`` / ``If-Modified-Since`` gets a 304 before any template runs.
+
+Views that list cache version counters in ``get_page_cache_versions()`` also
+fold those counters into the ETag, and their bump times into Last-Modified.
+The counters cover what the rows do not: tag and author names, related-post
+titles and the sidebars.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.contrib.messages import get_messages
+from django.db.models import Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import caching
+from .models import Comment, Post, PostSimilarity
+from .pagination import KeysetPaginator
+
+
+class ConditionalGetMixin:
+	"""
+	Answer GET/HEAD with 304 when ``get_validators()`` matches the request.
+
+	``get_validators()`` returns ``(parts, last_modified)``: a list of values the
+	page depends on (hashed into the ETag) and an aware datetime, or
+	``(None, None)`` to skip the check (e.g. when the object does not exist).
+	"""
+
+	def get_validators(self):
+		raise NotImplementedError
+
+	async def aget_validators(self):
+		return await sync_to_async(self.get_validators)()
+
+	def _version_names(self):
+		return self.get_page_cache_versions() if hasattr(self, 'get_page_cache_versions') else []
+
+	@staticmethod
+	def _with_versions(parts, last_modified, state):
+		versions, bumped_at = state
+		parts = [*parts, *sorted(versions.items())]
+		if bumped_at is None:
+			return parts, None
+		return parts, max(last_modified, bumped_at) if last_modified else last_modified
+
+	def _check(self, request, parts, last_modified):
+		"""Return ``(etag, timestamp, response)``; ``response`` is a 304/412 or None."""
+		# Logged-in users see edit links and forms, so their pages differ.
+		viewer = request.user.pk if request.user.is_authenticated else 'anon'
+		raw = '|'.join(str(part) for part in [request.get_full_path(), viewer, *parts])
+		etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+		timestamp = int(last_modified.timestamp()) if last_modified else None
+		return etag, timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+	@staticmethod
+	def _add_validators(response, etag, timestamp):
+		if response.status_code in (200, 304):
+			response.headers.setdefault('ETag', etag)
+			if timestamp is not None:
+				response.headers.setdefault('Last-Modified', http_date(timestamp))
+			patch_vary_headers(response, ['Cookie'])
+		return response
+
+	def dispatch(self, request, *args, **kwargs):
+		if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+			return super().dispatch(request, *args, **kwargs)
+
+		self.args, self.kwargs = args, kwargs
+		if self.view_is_async:
+			return self._conditional_adispatch(request, *args, **kwargs)
+		parts, last_modified = self.get_validators()
+		if parts is None:
+			return super().dispatch(request, *args, **kwargs)
+		names = self._version_names()
+		if names:
+			parts, last_modified = self._with_versions(parts, last_modified, caching.get_version_state(*names))
+		etag, timestamp, response = self._check(request, parts, last_modified)
+		if response is None:
+			response = super().dispatch(request, *args, **kwargs)
+		return self._add_validators(response, etag, timestamp)
+
+	async def _conditional_adispatch(self, request, *args, **kwargs):
+		parts, last_modified = await self.aget_validators()
+		if parts is None:
+			return await super().dispatch(request, *args, **kwargs)
+		names = self._version_names()
+		if names:
+			parts, last_modified = self._with_versions(parts, last_modified, await caching.aget_version_state(*names))
+		etag, timestamp, response = self._check(request, parts, last_modified)
+		if response is None:
+			response = await super().dispatch(request, *args, **kwargs)
+		return self._add_validators(response, etag, timestamp)
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+	"""Validators for ``KeysetPaginationMixin`` listings: the current page's ids and timestamps."""
+
+	def _validator_paginator(self):
+		queryset = (
+			self.get_queryset()
+			.select_related(None)
+			.prefetch_related(None)
+			.only('pk', 'published_date', 'updated', 'comment_count', 'last_commented_at', 'render_version')
+		)
+		return KeysetPaginator(queryset, self.get_paginate_by(queryset), ordering=self.keyset_ordering)
+
+	@staticmethod
+	def _page_validators(page):
+		parts = [(post.pk, post.updated.isoformat(), post.comment_count, post.render_version) for post in page]
+		stamps = [post.updated for post in page] + [post.last_commented_at for post in page if post.last_commented_at]
+		return parts, max(stamps, default=None)
+
+	def get_validators(self):
+		try:
+			page = self._validator_paginator().page(self.request.GET.get(self.cursor_kwarg))
+		except ValueError:
+			return None, None
+		return self._page_validators(page)
+
+	async def aget_validators(self):
+		try:
+			page = await self._validator_paginator().apage(self.request.GET.get(self.cursor_kwarg))
+		except ValueError:
+			return None, None
+		return self._page_validators(page)
+
+
+class ConditionalDetailMixin(ConditionalGetMixin):
+	"""
+	Validators for ``PostDetailView``: the post's ``updated``, its comments'
+	latest edit and id, and when its related posts were last recomputed.
+	"""
+
+	def _validator_query(self):
+		# Correlated subqueries rather than JOIN + GROUP BY: each is an index
+		# lookup on blog_comment and the outer query stays a primary-key fetch.
+		comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+		similar = PostSimilarity.objects.filter(post=OuterRef('pk')).order_by().values('post')
+		return (
+			Post.objects.filter(pk=self.kwargs['pk'])
+			.annotate(
+				comments_updated=Subquery(comments.annotate(latest=Max('updated_at')).values('latest')),
+				comments_max_id=Subquery(comments.annotate(last=Max('id')).values('last')),
+				related_at=Subquery(similar.annotate(latest=Max('computed_at')).values('latest')),
+			)
+			.values('updated', 'comment_count', 'render_version', 'comments_updated', 'comments_max_id', 'related_at')
+		)
+
+	@staticmethod
+	def _row_validators(row):
+		if row is None:
+			return None, None
+		parts = [
+			row['updated'].isoformat(),
+			row['comment_count'],
+			row['render_version'],
+			row['comments_updated'],
+			row['comments_max_id'],
+			row['related_at'],
+		]
+		return parts, max(filter(None, [row['updated'], row['comments_updated'], row['related_at']]))
+
+	def get_validators(self):
+		return self._row_validators(self._validator_query().first())
+
+	async def aget_validators(self):
+		return self._row_validators(await self._validator_query().afirst())
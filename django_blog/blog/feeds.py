@@ -0,0 +1,247 @@
+"""
+Atom, RSS 2.0 and JSON Feed syndication for blog posts.
+
+Feeds are streamed: posts are read with ``.iterator()`` in chunks (author and
+tags preloaded per chunk) and each chunk's serialized entries are looked up in
+the blog cache with one ``get_many``, so even a full archive feed never holds
+the whole queryset or the whole document in memory.
+"""
+import json
+from email.utils import format_datetime
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, Max
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import iri_to_uri
+from django.views import View
+
+from . import caching
+from .conditional import ConditionalGetMixin
+from .models import Post, Tag
+
+FEED_CHUNK_SIZE = 200
+
+
+def feed_entries():
+	return getattr(settings, 'BLOG_FEED_ENTRIES', 50)
+
+
+class FeedWriter:
+	"""
+	Serializes one feed format. ``feed`` is a dict with ``title``, ``link``,
+	``feed_url``, ``updated`` and ``base`` (the scheme and host for entry links).
+	"""
+
+	content_type = None
+	separator = ''
+
+	def header(self, feed):
+		raise NotImplementedError
+
+	def entry(self, post, feed):
+		raise NotImplementedError
+
+	def footer(self, feed):
+		raise NotImplementedError
+
+	@staticmethod
+	def post_url(post, feed):
+		return feed['base'] + iri_to_uri(reverse('post-detail', args=[post.pk]))
+
+
+class AtomWriter(FeedWriter):
+	content_type = 'application/atom+xml; charset=utf-8'
+
+	def header(self, feed):
+		return (
+			'<?xml version="1.0" encoding="utf-8"?>\n'
+			'<feed xmlns="http://www.w3.org/2005/Atom">'
+			f'<title>{escape(feed["title"])}</title>'
+			f'<link href={quoteattr(feed["link"])} rel="alternate"/>'
+			f'<link href={quoteattr(feed["feed_url"])} rel="self"/>'
+			f'<id>{escape(feed["feed_url"])}</id>'
+			f'<updated>{feed["updated"].isoformat()}</updated>'
+		)
+
+	def entry(self, post, feed):
+		url = self.post_url(post, feed)
+		categories = ''.join(f'<category term={quoteattr(tag.name)}/>' for tag in post.tags.all())
+		return (
+			'<entry>'
+			f'<title>{escape(post.title)}</title>'
+			f'<link href={quoteattr(url)} rel="alternate"/>'
+			f'<id>{escape(url)}</id>'
+			f'<published>{post.published_date.isoformat()}</published>'
+			f'<updated>{post.updated.isoformat()}</updated>'
+			f'<author><name>{escape(post.author.username)}</name></author>'
+			f'{categories}'
+			f'<content type="text">{escape(post.content)}</content>'
+			'</entry>'
+		)
+
+	def footer(self, feed):
+		return '</feed>\n'
+
+
+class RSSWriter(FeedWriter):
+	content_type = 'application/rss+xml; charset=utf-8'
+
+	def header(self, feed):
+		return (
+			'<?xml version="1.0" encoding="utf-8"?>\n'
+			'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+			'<channel>'
+			f'<title>{escape(feed["title"])}</title>'
+			f'<link>{escape(feed["link"])}</link>'
+			f'<description>{escape(feed["title"])}</description>'
+			f'<atom:link href={quoteattr(feed["feed_url"])} rel="self"/>'
+			f'<lastBuildDate>{format_datetime(feed["updated"])}</lastBuildDate>'
+		)
+
+	def entry(self, post, feed):
+		url = self.post_url(post, feed)
+		categories = ''.join(f'<category>{escape(tag.name)}</category>' for tag in post.tags.all())
+		return (
+			'<item>'
+			f'<title>{escape(post.title)}</title>'
+			f'<link>{escape(url)}</link>'
+			f'<guid isPermaLink="true">{escape(url)}</guid>'
+			f'<pubDate>{format_datetime(post.published_date)}</pubDate>'
+			f'<dc:creator>{escape(post.author.username)}</dc:creator>'
+			f'{categories}'
+			f'<description>{escape(post.content)}</description>'
+			'</item>'
+		)
+
+	def footer(self, feed):
+		return '</channel></rss>\n'
+
+
+class JSONFeedWriter(FeedWriter):
+	content_type = 'application/feed+json; charset=utf-8'
+	separator = ','
+
+	def header(self, feed):
+		head = json.dumps({
+			'version': 'https://jsonfeed.org/version/1.1',
+			'title': feed['title'],
+			'home_page_url': feed['link'],
+			'feed_url': feed['feed_url'],
+		})
+		# Reopen the object so the items array can be streamed into it.
+		return head[:-1] + ', "items": ['
+
+	def entry(self, post, feed):
+		url = self.post_url(post, feed)
+		return json.dumps({
+			'id': url,
+			'url': url,
+			'title': post.title,
+			'content_text': post.content,
+			'date_published': post.published_date.isoformat(),
+			'date_modified': post.updated.isoformat(),
+			'authors': [{'name': post.author.username}],
+			'tags': [tag.name for tag in post.tags.all()],
+		})
+
+	def footer(self, feed):
+		return ']}\n'
+
+
+WRITERS = {
+	'atom': AtomWriter,
+	'rss': RSSWriter,
+	'json': JSONFeedWriter,
+}
+
+
+def stream_feed(writer, feed, posts, fmt):
+	"""Yield the feed document piece by piece, serializing ``posts`` a chunk at a time."""
+	yield writer.header(feed)
+	first = True
+	iterator = posts.iterator(chunk_size=FEED_CHUNK_SIZE)
+	while chunk := list(islice(iterator, FEED_CHUNK_SIZE)):
+		entries = caching.cached_fragments(
+			'feed_entry',
+			chunk,
+			lambda post: writer.entry(post, feed),
+			variant=f':{fmt}:{feed["base"]}',
+		)
+		for entry in entries:
+			yield entry if first else writer.separator + entry
+			first = False
+	yield writer.footer(feed)
+
+
+class PostFeedView(ConditionalGetMixin, View):
+	"""
+	Newest posts as a feed in the format named by the ``fmt`` URL kwarg.
+
+	``?archive=1`` streams every post instead of the latest ``BLOG_FEED_ENTRIES``.
+	"""
+
+	title = 'Latest posts'
+
+	def get_scope(self):
+		"""Return ``(queryset, title)`` for the posts this feed covers."""
+		return Post.objects.all(), self.title
+
+	def get_link(self):
+		return reverse('post-list')
+
+	def get_posts(self):
+		"""Return the feed's posts, newest first, limited unless ``?archive`` is set."""
+		if not hasattr(self, '_posts'):
+			if self.kwargs['fmt'] not in WRITERS:
+				raise Http404('Unknown feed format.')
+			queryset, self.feed_title = self.get_scope()
+			queryset = queryset.order_by('-published_date', '-id')
+			if not self.request.GET.get('archive'):
+				queryset = queryset[:feed_entries()]
+			self._posts = queryset
+		return self._posts
+
+	def get_validators(self):
+		row = self.get_posts().aggregate(updated=Max('updated'), last_id=Max('id'), total=Count('id'))
+		self.feed_updated = row['updated'] or timezone.now()
+		# Tag renames change entries without touching ``updated``; ``posts`` is bumped for those.
+		version = caching.get_versions('posts')['posts']
+		return [row['updated'], row['last_id'], row['total'], version], row['updated']
+
+	def get(self, request, *args, **kwargs):
+		posts = self.get_posts()
+		if not hasattr(self, 'feed_updated'):
+			self.get_validators()
+		writer = WRITERS[self.kwargs['fmt']]()
+		feed = {
+			'title': self.feed_title,
+			'link': request.build_absolute_uri(self.get_link()),
+			'feed_url': request.build_absolute_uri(),
+			'updated': self.feed_updated,
+			'base': f'{request.scheme}://{request.get_host()}',
+		}
+		return StreamingHttpResponse(
+			stream_feed(writer, feed, posts.select_related('author').prefetch_related('tags'), self.kwargs['fmt']),
+			content_type=writer.content_type,
+		)
+
+
+class TagFeedView(PostFeedView):
+	def get_scope(self):
+		self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
+		return Post.objects.tagged(Tag.objects.filter(pk=self.tag.pk)), f'Posts tagged "{self.tag.name}"'
+
+	def get_link(self):
+		return reverse('post-by-tag', args=[self.tag.slug])
+
+
+class AuthorFeedView(PostFeedView):
+	def get_scope(self):
+		self.author = get_object_or_404(User, username=self.kwargs['username'])
+		return Post.objects.filter(author=self.author), f'Posts by {self.author.username}'
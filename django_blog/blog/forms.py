@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.forms import widgets
 
 from taggit.forms import TagWidget
@@ -44,20 +45,19 @@ class PostForm(forms.ModelForm):
             self.fields['tags'].initial = ", ".join(existing)
 
     def save(self, commit=True):
-        post = super().save(commit=commit)
+        if not commit:
+            return super().save(commit=False)
 
         raw_tags = (self.cleaned_data.get('tags') or '').strip()
-        if commit:
-            tag_names = [t.strip() for t in raw_tags.split(',') if t.strip()]
-            tags = []
-            for name in tag_names:
-                tag, _ = Tag.objects.get_or_create(name=name)
-                tags.append(tag)
-            post.tags.set(tags)
+        with transaction.atomic():
+            post = super().save()
+            post.set_tags(Tag.objects.resolve_names(raw_tags.split(',')))
         return post
 
 
 class CommentForm(forms.ModelForm):
+	parent = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
 	class Meta:
 		model = Comment
 		fields = ("content",)
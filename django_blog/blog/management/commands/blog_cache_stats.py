@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog import caching
+
+
+class Command(BaseCommand):
+	help = 'Show hit/miss counts for the blog page and fragment caches.'
+
+	def handle(self, *args, **options):
+		for namespace, counts in caching.metrics().items():
+			total = counts['hits'] + counts['misses']
+			ratio = counts['hits'] / total if total else 0
+			self.stdout.write(f"{namespace:<16} hits={counts['hits']:<8} misses={counts['misses']:<8} hit-rate={ratio:.1%}")
@@ -0,0 +1,68 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import bulk
+
+
+class Command(BaseCommand):
+	help = 'Export posts with their tags and comments to a JSONL or CSV file.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--format', choices=bulk.FORMATS, help='Defaults to csv for *.csv, otherwise jsonl.')
+		parser.add_argument('--batch-size', type=int, default=1000)
+		parser.add_argument(
+			'--resume', action='store_true',
+			help='Continue an interrupted export from its <path>.checkpoint file.',
+		)
+
+	def handle(self, *args, **options):
+		path = options['path']
+		checkpoint_path = path + '.checkpoint'
+		after = 0
+		if options['resume']:
+			if not os.path.exists(checkpoint_path):
+				raise CommandError(f'No checkpoint at {checkpoint_path}.')
+			with open(checkpoint_path) as handle:
+				checkpoint = json.load(handle)
+			after = checkpoint['last_pk']
+			handle = open(path, 'r+', encoding='utf-8', newline='')
+			# Drop anything written after the last checkpoint; those posts are exported again.
+			handle.truncate(checkpoint['offset'])
+			handle.seek(checkpoint['offset'])
+			self.stdout.write(f'Resuming after post {after}.')
+
+		else:
+			handle = open(path, 'w', encoding='utf-8', newline='')
+		writer = bulk.RecordWriter(handle, bulk.detect_format(path, options['format']))
+		if not after:
+			writer.header()
+
+		progress = bulk.Progress(self.stderr if options['verbosity'] else None, 'Exported')
+		posts = 0
+		with handle:
+			batch = 0
+			for pk, record in bulk.export_records(after, options['batch_size']):
+				writer.write(record)
+				posts += 1
+				batch += 1
+				progress.add(1 + len(record['comments']))
+				if batch == options['batch_size']:
+					self._save_checkpoint(handle, checkpoint_path, pk)
+					batch = 0
+		if os.path.exists(checkpoint_path):
+			os.remove(checkpoint_path)
+		self.stdout.write(self.style.SUCCESS(
+			f'Exported {posts} posts ({progress.rows} rows) in {progress.elapsed:.1f}s ({progress.rate:.0f} rows/sec).'
+		))
+
+	@staticmethod
+	def _save_checkpoint(handle, checkpoint_path, last_pk):
+		handle.flush()
+		os.fsync(handle.fileno())
+		temporary = checkpoint_path + '.tmp'
+		with open(temporary, 'w') as checkpoint:
+			json.dump({'last_pk': last_pk, 'offset': handle.tell()}, checkpoint)
+		os.replace(temporary, checkpoint_path)
@@ -0,0 +1,52 @@
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog import bulk
+from blog.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+	help = 'Import posts with their tags and comments from a JSONL or CSV file, resuming from the last checkpoint.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--format', choices=bulk.FORMATS, help='Defaults to csv for *.csv, otherwise jsonl.')
+		parser.add_argument('--batch-size', type=int, default=1000)
+		parser.add_argument('--checkpoint', help='Checkpoint name (default: the absolute input path).')
+		parser.add_argument('--restart', action='store_true', help='Ignore a saved checkpoint and start from the top.')
+
+	def handle(self, *args, **options):
+		path = options['path']
+		if not os.path.exists(path):
+			raise CommandError(f'{path} does not exist.')
+		checkpoint, _ = ImportCheckpoint.objects.get_or_create(key=options['checkpoint'] or os.path.abspath(path))
+		if options['restart']:
+			checkpoint.position = 0
+		if checkpoint.position:
+			self.stdout.write(f'Resuming after record {checkpoint.position}.')
+
+		records = bulk.read_records(path, bulk.detect_format(path, options['format']), skip=checkpoint.position)
+		progress = bulk.Progress(self.stderr if options['verbosity'] else None, 'Imported')
+		posts = comments = 0
+		try:
+			with bulk.keep_timestamps():
+				importer = bulk.Importer()
+				while batch := list(islice(records, options['batch_size'])):
+					with transaction.atomic():
+						created_posts, created_comments = importer.import_batch(batch)
+						checkpoint.position += len(batch)
+						checkpoint.save()
+					posts += created_posts
+					comments += created_comments
+					progress.add(created_posts + created_comments)
+		except ValueError as exc:
+			raise CommandError(f'{path}: {exc}') from exc
+
+		bulk.finalize()
+		self.stdout.write(self.style.SUCCESS(
+			f'Imported {posts} posts and {comments} comments in {progress.elapsed:.1f}s '
+			f'({progress.rate:.0f} rows/sec).'
+		))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import moderation
+from blog.models import CommentSubmission
+
+
+class Command(BaseCommand):
+	help = 'Score pending comment submissions in batches and publish the approved ones.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=moderation.batch_size())
+		parser.add_argument('--loop', action='store_true', help='Keep polling for new submissions until interrupted.')
+		parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+		parser.add_argument(
+			'--approve', type=int, nargs='+', metavar='ID',
+			help='Publish these submissions, e.g. ones rejected by mistake, and exit.',
+		)
+
+	def handle(self, *args, **options):
+		if options['approve']:
+			published = moderation.approve(options['approve'])
+			self.stdout.write(self.style.SUCCESS(f'Published {published} comments.'))
+			return
+		classifiers = moderation.load_classifiers()
+		while True:
+			started = time.monotonic()
+			approved, rejected = moderation.drain(classifiers, options['batch_size'])
+			elapsed = time.monotonic() - started
+			if approved or rejected or not options['loop']:
+				self.stdout.write(self.style.SUCCESS(
+					f'Approved {approved} and rejected {rejected} comments in {elapsed:.1f}s '
+					f'({(approved + rejected) / elapsed if elapsed else 0:.0f} comments/sec); '
+					f'{CommentSubmission.objects.pending().count()} pending.'
+				))
+			if not options['loop']:
+				return
+			time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+
+
+class Command(BaseCommand):
+	help = 'Recompute Post.comment_count, Post.last_commented_at and Tag.post_count.'
+
+	def handle(self, *args, **options):
+		Post.rebuild_counters()
+		self.stdout.write(self.style.SUCCESS('Rebuilt blog counters.'))
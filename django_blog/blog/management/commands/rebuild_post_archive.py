@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import PostArchiveBucket
+
+
+class Command(BaseCommand):
+	help = 'Recompute the PostArchiveBucket monthly rollups from Post.'
+
+	def handle(self, *args, **options):
+		PostArchiveBucket.objects.rebuild()
+		self.stdout.write(self.style.SUCCESS(f'Rebuilt {PostArchiveBucket.objects.count()} archive buckets.'))
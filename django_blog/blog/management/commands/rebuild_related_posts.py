@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import related
+
+
+class Command(BaseCommand):
+	help = "Recompute every post's related posts (needs numpy and scipy)."
+
+	def handle(self, *args, **options):
+		if not related.available():
+			raise CommandError('Related posts need numpy and scipy: pip install numpy scipy')
+		rows = related.rebuild()
+		self.stdout.write(self.style.SUCCESS(f'Stored {rows} related-post rows.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.search import get_search_backend
+
+
+class Command(BaseCommand):
+	help = 'Rebuild the full-text search index for all blog posts.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--database', default='default', help='Database alias to rebuild.')
+
+	def handle(self, *args, **options):
+		backend = get_search_backend(options['database'])
+		backend.rebuild()
+		self.stdout.write(self.style.SUCCESS(f'Rebuilt search index with {type(backend).__name__}.'))
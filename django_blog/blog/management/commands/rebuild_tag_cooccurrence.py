@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog import caching
+from blog.models import TagCooccurrence
+
+
+class Command(BaseCommand):
+	help = 'Recompute the TagCooccurrence pair counts from the post/tag through table.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=2000)
+
+	def handle(self, *args, **options):
+		pairs = TagCooccurrence.objects.rebuild(batch_size=options['batch_size'])
+		caching.bump('tags')
+		self.stdout.write(self.style.SUCCESS(f'Rebuilt {pairs} tag co-occurrence rows.'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import related
+from blog.models import PostSimilarityUpdate
+
+
+class Command(BaseCommand):
+	help = 'Recompute the related posts of queued posts in batches (needs numpy and scipy).'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=related.batch_size())
+		parser.add_argument('--loop', action='store_true', help='Keep polling for queued posts until interrupted.')
+		parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+
+	def handle(self, *args, **options):
+		if not related.available():
+			raise CommandError('Related posts need numpy and scipy: pip install numpy scipy')
+		while True:
+			started = time.monotonic()
+			processed = related.drain(options['batch_size'])
+			elapsed = time.monotonic() - started
+			if processed or not options['loop']:
+				self.stdout.write(self.style.SUCCESS(
+					f'Refreshed {processed} queued posts in {elapsed:.1f}s; '
+					f'{PostSimilarityUpdate.objects.count()} queued.'
+				))
+			if not options['loop']:
+				return
+			time.sleep(options['interval'])
@@ -0,0 +1,67 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from blog import bulk, caching, rendering
+from blog.models import Post
+
+
+class Command(BaseCommand):
+	help = 'Re-render Post.content_html and Post.excerpt for posts made by an older renderer, across a process pool.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--all', action='store_true', help='Re-render every post, not just stale ones.')
+		parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+		parser.add_argument('--chunk-size', type=int, default=500, help='Posts per worker task.')
+
+	def handle(self, *args, **options):
+		posts = Post.objects.all()
+		if not options['all']:
+			posts = posts.exclude(render_version=rendering.RENDERER_VERSION)
+		progress = bulk.Progress(self.stderr if options['verbosity'] else None, 'Rendered')
+		chunks = self._chunks(posts, options['chunk_size'])
+
+		if options['workers'] <= 1:
+			for ids, contents in chunks:
+				progress.add(self._store(ids, rendering.render_batch(contents)))
+		else:
+			# Read, render and write overlap: at most two tasks per worker are in flight.
+			with ProcessPoolExecutor(options['workers']) as pool:
+				pending = deque()
+				for ids, contents in chunks:
+					pending.append((ids, pool.submit(rendering.render_batch, contents)))
+					if len(pending) >= 2 * options['workers']:
+						ids, future = pending.popleft()
+						progress.add(self._store(ids, future.result()))
+				for ids, future in pending:
+					progress.add(self._store(ids, future.result()))
+
+		if progress.rows:
+			caching.bump('posts')
+		self.stdout.write(self.style.SUCCESS(
+			f'Rendered {progress.rows} posts with renderer version {rendering.RENDERER_VERSION} '
+			f'in {progress.elapsed:.1f}s ({progress.rate:.0f} posts/sec).'
+		))
+
+	@staticmethod
+	def _chunks(posts, size):
+		"""Yield ``(ids, contents)`` in primary-key order, one keyset query per chunk."""
+		last = 0
+		while rows := list(posts.filter(pk__gt=last).order_by('pk').values_list('pk', 'content')[:size]):
+			yield [pk for pk, _ in rows], [content for _, content in rows]
+			last = rows[-1][0]
+
+	@staticmethod
+	def _store(ids, results):
+		Post.objects.bulk_update(
+			[
+				Post(pk=pk, content_html=html, excerpt=excerpt, render_version=rendering.RENDERER_VERSION)
+				for pk, (html, excerpt) in zip(ids, results)
+			],
+			['content_html', 'excerpt', 'render_version'],
+			batch_size=500,
+		)
+		caching.bump(*(f'post:{pk}' for pk in ids))
+		return len(ids)
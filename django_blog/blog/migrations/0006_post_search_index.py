@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE blog_post_fts USING fts5(title, content, tags, tokenize='porter unicode61')",
+    """
+    INSERT INTO blog_post_fts (rowid, title, content, tags)
+    SELECT p.id, p.title, p.content, COALESCE((
+        SELECT group_concat(t.name, ' ')
+        FROM blog_post_tags pt JOIN blog_tag t ON t.id = pt.tag_id
+        WHERE pt.post_id = p.id
+    ), '')
+    FROM blog_post p
+    """,
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE blog_post_search (
+        post_id bigint PRIMARY KEY REFERENCES blog_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX blog_post_search_document_gin ON blog_post_search USING gin (document)",
+    """
+    INSERT INTO blog_post_search (post_id, document)
+    SELECT p.id,
+        setweight(to_tsvector('english', p.title), 'A')
+        || setweight(to_tsvector('english', COALESCE((
+            SELECT string_agg(t.name, ' ')
+            FROM blog_post_tags pt JOIN blog_tag t ON t.id = pt.tag_id
+            WHERE pt.post_id = p.id
+        ), '')), 'B')
+        || setweight(to_tsvector('english', p.content), 'D')
+    FROM blog_post p
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_CREATE,
+        'postgresql': POSTGRES_CREATE,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    table = {
+        'sqlite': 'blog_post_fts',
+        'postgresql': 'blog_post_search',
+    }.get(schema_editor.connection.vendor)
+    if table:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_populate_tag_slugs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:00
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_updated(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(updated=F('published_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_comment_parent_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_updated, migrations.RunPython.noop),
+    ]
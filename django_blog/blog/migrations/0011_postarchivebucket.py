@@ -0,0 +1,59 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate_buckets(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    PostArchiveBucket = apps.get_model('blog', 'PostArchiveBucket')
+
+    rows = (
+        Post.objects.annotate(year=ExtractYear('published_date'), month=ExtractMonth('published_date'))
+        .values('author_id', 'year', 'month')
+        .annotate(total=Count('id'), latest=Max('id'))
+        .order_by()
+    )
+    PostArchiveBucket.objects.bulk_create(
+        [
+            PostArchiveBucket(
+                author_id=row['author_id'],
+                year=row['year'],
+                month=row['month'],
+                post_count=row['total'],
+                latest_post_id=row['latest'],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostArchiveBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('latest_post_id', models.IntegerField(blank=True, null=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'month'], name='blog_archive_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('author', 'year', 'month'), name='blog_archive_bucket_unique')],
+            },
+        ),
+        migrations.RunPython(populate_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:00
+
+import itertools
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_cooccurrence(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    TagCooccurrence = apps.get_model('blog', 'TagCooccurrence')
+
+    rows = Post.tags.through.objects.order_by('post_id', 'tag_id').values_list('post_id', 'tag_id')
+    counts = {}
+    for _, group in itertools.groupby(rows.iterator(chunk_size=2000), key=lambda row: row[0]):
+        for a, b in itertools.permutations([tag_id for _, tag_id in group], 2):
+            counts[a, b] = counts.get((a, b), 0) + 1
+    TagCooccurrence.objects.bulk_create(
+        (TagCooccurrence(tag_id=a, other_id=b, count=n) for (a, b), n in counts.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_postarchivebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-post_count', 'name'], name='blog_tag_post_count_idx'),
+        ),
+        migrations.AddField(
+            model_name='tagcooccurrence',
+            name='other',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.tag'),
+        ),
+        migrations.AddField(
+            model_name='tagcooccurrence',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurrences', to='blog.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='tagcooccurrence',
+            index=models.Index(fields=['tag', '-count', 'other'], name='blog_tagcooc_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagcooccurrence',
+            constraint=models.UniqueConstraint(fields=('tag', 'other'), name='blog_tagcooccurrence_unique'),
+        ),
+        migrations.RunPython(populate_cooccurrence, migrations.RunPython.noop),
+    ]
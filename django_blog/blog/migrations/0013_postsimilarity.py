@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_tagcooccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.post')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_posts', to='blog.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['other'], name='blog_postsim_other_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'rank'), name='blog_postsimilarity_rank_unique')],
+            },
+        ),
+    ]
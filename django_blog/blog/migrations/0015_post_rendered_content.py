@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+def render_existing_posts(apps, schema_editor):
+    # Uses the live renderer: whatever version it is, the stored render_version matches it.
+    from blog import rendering
+
+    Post = apps.get_model('blog', 'Post')
+    batch = []
+    for post in Post.objects.only('pk', 'content').iterator(chunk_size=500):
+        post.content_html, post.excerpt = rendering.render(post.content)
+        post.render_version = rendering.RENDERER_VERSION
+        batch.append(post)
+        if len(batch) == 500:
+            Post.objects.bulk_update(batch, ['content_html', 'excerpt', 'render_version'])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ['content_html', 'excerpt', 'render_version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='render_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
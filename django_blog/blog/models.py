@@ -1,40 +1,633 @@
+import datetime
+import itertools
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.signals import m2m_changed
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.utils import timezone
 from django.utils.text import slugify
 
+from . import rendering
+
+
+def slug_base(name):
+	return slugify(name)[:50] or 'tag'
+
+
+class TagQuerySet(models.QuerySet):
+	# Bases per slug query; SQLite caps expression depth at 1000 and each base adds two terms.
+	SLUG_LOOKUP_BATCH = 250
+	RESOLVE_BATCH = 500
+
+	def free_slugs(self, bases):
+		"""
+		Map each base in ``bases`` (duplicates allowed) to a distinct slug that is not
+		taken yet: ``base`` itself, or ``base-N`` past the highest suffix in use.
+		Costs one query per ``SLUG_LOOKUP_BATCH`` distinct bases, independent of how
+		many ``base-N`` slugs already exist.
+		"""
+		unique_bases = list(dict.fromkeys(bases))
+		taken = set()
+		for start in range(0, len(unique_bases), self.SLUG_LOOKUP_BATCH):
+			chunk = unique_bases[start:start + self.SLUG_LOOKUP_BATCH]
+			condition = Q(slug__in=chunk)
+			for base in chunk:
+				condition |= Q(slug__startswith=f'{base}-')
+			taken.update(self.filter(condition).values_list('slug', flat=True))
+
+		# Group the numeric suffixes by base in one pass over the taken slugs.
+		used_suffixes = {}
+		for slug in taken:
+			head, _, tail = slug.rpartition('-')
+			if head and tail.isdigit():
+				used_suffixes.setdefault(head, []).append(int(tail))
+		next_suffix = {base: max(used_suffixes.get(base, ()), default=1) + 1 for base in unique_bases}
+
+		slugs = []
+		for base in bases:
+			slug = base
+			if slug in taken:
+				suffix = next_suffix[base]
+				while f'{base}-{suffix}' in taken:
+					suffix += 1
+				slug = f'{base}-{suffix}'
+				next_suffix[base] = suffix + 1
+			taken.add(slug)
+			slugs.append(slug)
+		return slugs
+
+	def named(self, name):
+		"""Case-insensitive name match that can use the ``Lower('name')`` index."""
+		return self.alias(name_lower=Lower('name')).filter(name_lower=Lower(Value(name)))
+
+	def resolve_names(self, names):
+		"""
+		Return ``Tag`` objects for ``names`` (stripped, de-duplicated, in order),
+		creating the missing ones. Existing tags are found with a single ``IN``
+		lookup and new ones are inserted with a single ``bulk_create`` per
+		``RESOLVE_BATCH`` names.
+		"""
+		names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+		found = {}
+		for start in range(0, len(names), self.RESOLVE_BATCH):
+			found.update(self._resolve_batch(names[start:start + self.RESOLVE_BATCH]))
+		return [found[name] for name in names]
+
+	def _resolve_batch(self, names):
+		found = {tag.name: tag for tag in self.filter(name__in=names)}
+		missing = [name for name in names if name not in found]
+		if missing:
+			slugs = self.free_slugs([slug_base(name) for name in missing])
+			new_tags = [self.model(name=name, slug=slug) for name, slug in zip(missing, slugs)]
+			try:
+				with transaction.atomic(using=self.db):
+					self.bulk_create(new_tags)
+			except IntegrityError:
+				# Another writer created some of these names (or took a slug) first.
+				new_tags = [self.get_or_create(name=name)[0] for name in missing]
+			found.update((tag.name, tag) for tag in new_tags)
+		return found
+
 
 class Tag(models.Model):
+	SLUG_RETRIES = 5
+
 	name = models.CharField(max_length=50, unique=True)
 	slug = models.SlugField(max_length=60, unique=True, blank=True)
+	post_count = models.PositiveIntegerField(default=0, editable=False)
+
+	objects = TagQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# Serves case-insensitive lookups (TagQuerySet.named); the unique
+			# index on ``name`` only helps exact matches.
+			models.Index(Lower('name'), name='blog_tag_name_lower_idx'),
+			# The tag cloud reads the most used tags.
+			models.Index(fields=['-post_count', 'name'], name='blog_tag_post_count_idx'),
+		]
 
 	def save(self, *args, **kwargs):
-		if not self.slug:
-			base = slugify(self.name)[:50] or 'tag'
-			slug = base
-			suffix = 2
-			while Tag.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-				slug = f"{base}-{suffix}"
-				suffix += 1
-			self.slug = slug
-		super().save(*args, **kwargs)
+		if self.slug:
+			return super().save(*args, **kwargs)
+
+		# A concurrent writer can take the slug between the lookup and the INSERT;
+		# the unique constraint catches that and we allocate again.
+		base = slug_base(self.name)
+		using = kwargs.get('using') or router.db_for_write(Tag, instance=self)
+		for attempt in range(self.SLUG_RETRIES):
+			self.slug = Tag.objects.using(using).exclude(pk=self.pk).free_slugs([base])[0]
+			try:
+				with transaction.atomic(using=using):
+					return super().save(*args, **kwargs)
+			except IntegrityError:
+				self.slug = ''
+				name_taken = Tag.objects.using(using).filter(name=self.name).exclude(pk=self.pk).exists()
+				if name_taken or attempt == self.SLUG_RETRIES - 1:
+					raise
 
 	def __str__(self):
 		return self.name
 
 
+class TagCooccurrenceQuerySet(models.QuerySet):
+	def adjust(self, old_ids, new_ids):
+		"""
+		Move the pair counts from a post tagged ``old_ids`` to one tagged
+		``new_ids``. Pairs are stored in both directions, so a tag's related
+		tags are one index range on ``(tag, -count)``.
+		"""
+		old_ids, new_ids = set(old_ids), set(new_ids)
+		added, removed = new_ids - old_ids, old_ids - new_ids
+		if removed and len(old_ids) > 1:
+			self._pairs(removed, old_ids).update(count=F('count') - 1)
+			self._pairs(removed, old_ids).filter(count__lte=0).delete()
+		if added and len(new_ids) > 1:
+			self._increment(added, new_ids)
+
+	def _pairs(self, changed, members):
+		"""Rows for every ordered pair that has one tag in ``changed`` and the other in ``members``."""
+		return self.filter(
+			Q(tag_id__in=changed, other_id__in=members) | Q(tag_id__in=members, other_id__in=changed)
+		).exclude(tag_id=F('other_id'))
+
+	def _increment(self, changed, members):
+		"""
+		Count one more post for every pair, then insert the pairs that had no
+		row yet with ``INSERT ... SELECT`` so a post with many tags still costs
+		a fixed number of queries however many pairs it creates.
+		"""
+		connection = connections[self.db]
+		table = connection.ops.quote_name(self.model._meta.db_table)
+		tags = connection.ops.quote_name(Tag._meta.db_table)
+		changed, members = list(changed), list(members)
+		marks = lambda ids: ', '.join(['%s'] * len(ids))  # noqa: E731
+		sql = (
+			f'INSERT INTO {table} (tag_id, other_id, count) '
+			f'SELECT a.id, b.id, 1 FROM {tags} a, {tags} b '
+			f'WHERE a.id <> b.id AND ('
+			f'(a.id IN ({marks(changed)}) AND b.id IN ({marks(members)})) OR '
+			f'(a.id IN ({marks(members)}) AND b.id IN ({marks(changed)}))'
+			f') AND NOT EXISTS (SELECT 1 FROM {table} c WHERE c.tag_id = a.id AND c.other_id = b.id)'
+		)
+		for attempt in range(2):
+			try:
+				with transaction.atomic(using=self.db):
+					self._pairs(changed, members).update(count=F('count') + 1)
+					with connection.cursor() as cursor:
+						cursor.execute(sql, changed + members + members + changed)
+				return
+			except IntegrityError:
+				# Another post inserted some of these pairs between our UPDATE and
+				# INSERT; both were rolled back, so run them again against its rows.
+				if attempt:
+					raise
+
+	def related(self, tag_id, limit):
+		return self.filter(tag_id=tag_id).order_by('-count', 'other_id')[:limit]
+
+	def rebuild(self, batch_size=2000):
+		"""
+		Recount every pair in one pass over the through table, ordered by post so
+		only one post's tags are held at a time; the pair counts themselves
+		are bounded by the number of distinct tag pairs, not posts.
+		"""
+		counts = {}
+		rows = Post.tags.through.objects.using(self.db).order_by('post_id', 'tag_id').values_list('post_id', 'tag_id')
+		for _, group in itertools.groupby(rows.iterator(chunk_size=batch_size), key=lambda row: row[0]):
+			for a, b in itertools.permutations([tag_id for _, tag_id in group], 2):
+				counts[a, b] = counts.get((a, b), 0) + 1
+		with transaction.atomic(using=self.db):
+			self.all().delete()
+			self.bulk_create(
+				(self.model(tag_id=a, other_id=b, count=n) for (a, b), n in counts.items()),
+				batch_size=batch_size,
+			)
+		return len(counts)
+
+
+class TagCooccurrence(models.Model):
+	"""How many posts carry both ``tag`` and ``other``; each pair is stored in both directions."""
+
+	tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='cooccurrences')
+	other = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='+')
+	count = models.PositiveIntegerField(default=0)
+
+	objects = TagCooccurrenceQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['tag', 'other'], name='blog_tagcooccurrence_unique'),
+		]
+		indexes = [
+			# Top-K related tags: one range scan, already in rank order.
+			models.Index(fields=['tag', '-count', 'other'], name='blog_tagcooc_rank_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.tag_id}~{self.other_id}: {self.count}'
+
+
+class PostQuerySet(models.QuerySet):
+	# Bodies can be tens of kilobytes; listings show ``excerpt`` and the detail page ``content_html``.
+	LISTING_DEFERRED = ('content', 'content_html')
+
+	def for_listing(self):
+		"""
+		Load everything a post card renders (author, tags) in a fixed number of
+		queries, without the body columns.
+		"""
+		return self.select_related('author').prefetch_related('tags').defer(*self.LISTING_DEFERRED)
+
+	def for_detail(self):
+		"""Like ``for_listing()`` but with the rendered body; the Markdown source stays deferred."""
+		return self.select_related('author').prefetch_related('tags').defer('content')
+
+	def tagged(self, tags):
+		"""
+		Posts carrying any tag in the ``tags`` queryset. A correlated EXISTS keeps
+		the listing walking the ``published_date`` index (checking each post
+		against the through table's unique index) instead of collecting the
+		tag's posts and sorting them, and needs no DISTINCT.
+		"""
+		through = Post.tags.through.objects.filter(post_id=OuterRef('pk'), tag__in=tags)
+		return self.filter(Exists(through))
+
+
 class Post(models.Model):
 	title = models.CharField(max_length=200)
 	content = models.TextField()
 	published_date = models.DateTimeField(auto_now_add=True)
+	updated = models.DateTimeField(auto_now=True)
 	author = models.ForeignKey(
 		User,
 		on_delete=models.CASCADE,
 		related_name='posts',
 	)
 	tags = models.ManyToManyField(Tag, related_name='posts', blank=True)
+	comment_count = models.PositiveIntegerField(default=0, editable=False)
+	last_commented_at = models.DateTimeField(null=True, blank=True, editable=False)
+	# ``content`` rendered by blog/rendering.py at save time; see render_content().
+	content_html = models.TextField(default='', editable=False)
+	excerpt = models.CharField(max_length=rendering.EXCERPT_LENGTH, default='', editable=False)
+	render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+	objects = PostQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# Listings order by (-published_date, -id); see KeysetPaginator.
+			models.Index(fields=['-published_date', '-id'], name='blog_post_published_idx'),
+			models.Index(fields=['author', '-published_date', '-id'], name='blog_post_author_pub_idx'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		post = super().from_db(db, field_names, values)
+		# Remember the stored archive bucket so a save that moves the post can fix both buckets.
+		if 'author_id' in field_names and 'published_date' in field_names:
+			post._loaded_archive_key = post.archive_key()
+		return post
+
+	def save(self, *args, **kwargs):
+		update_fields = kwargs.get('update_fields')
+		# A post loaded without its body (see PostQuerySet.for_listing) keeps its stored rendering.
+		content_loaded = 'content' not in self.get_deferred_fields()
+		if content_loaded and (update_fields is None or 'content' in update_fields):
+			self.render_content()
+			if update_fields is not None:
+				kwargs['update_fields'] = {*update_fields, 'content_html', 'excerpt', 'render_version'}
+		super().save(*args, **kwargs)
+
+	def render_content(self):
+		"""Store the HTML and excerpt for ``content`` with the renderer version that made them."""
+		self.content_html, self.excerpt = rendering.render(self.content)
+		self.render_version = rendering.RENDERER_VERSION
+
+	def archive_key(self):
+		"""``(author_id, year, month)`` of the ``PostArchiveBucket`` this post counts towards."""
+		year, month = archive_period(self.published_date)
+		return self.author_id, year, month
+
+	def set_tags(self, tags):
+		"""
+		Replace this post's tags with one through-table diff and adjust
+		``Tag.post_count`` for the difference. Sends ``m2m_changed`` like
+		``post.tags.set()`` so receivers stay in sync.
+		"""
+		through = Post.tags.through
+		old_ids = set(through.objects.filter(post_id=self.pk).values_list('tag_id', flat=True))
+		new_ids = {tag.pk for tag in tags}
+		added, removed = new_ids - old_ids, old_ids - new_ids
+		if hasattr(self, '_prefetched_objects_cache'):
+			self._prefetched_objects_cache.pop('tags', None)
+		if added or removed:
+			TagCooccurrence.objects.using(self._state.db).adjust(old_ids, new_ids)
+
+		if removed:
+			self._send_tags_changed('pre_remove', removed)
+			through.objects.filter(post_id=self.pk, tag_id__in=removed).delete()
+			Tag.objects.filter(pk__in=removed).update(post_count=F('post_count') - 1)
+			self._send_tags_changed('post_remove', removed)
+		if added:
+			self._send_tags_changed('pre_add', added)
+			through.objects.bulk_create([through(post_id=self.pk, tag_id=pk) for pk in added])
+			Tag.objects.filter(pk__in=added).update(post_count=F('post_count') + 1)
+			self._send_tags_changed('post_add', added)
+
+	def _send_tags_changed(self, action, pk_set):
+		m2m_changed.send(
+			sender=Post.tags.through,
+			instance=self,
+			action=action,
+			reverse=False,
+			model=Tag,
+			pk_set=set(pk_set),
+			using=self._state.db,
+		)
+
+	def record_comment_added(self, comment):
+		Post.objects.filter(pk=self.pk).update(
+			comment_count=F('comment_count') + 1,
+			last_commented_at=Greatest(
+				Coalesce('last_commented_at', Value(comment.created_at)),
+				Value(comment.created_at),
+			),
+		)
+
+	def record_comment_removed(self, count=1):
+		"""``count`` is the number of comments deleted: the comment plus any replies under it."""
+		Post.objects.filter(pk=self.pk).update(
+			comment_count=F('comment_count') - count,
+			last_commented_at=Subquery(
+				Comment.objects.filter(post=OuterRef('pk'))
+				.values('post')
+				.annotate(latest=Max('created_at'))
+				.values('latest')
+			),
+		)
+
+	@classmethod
+	def rebuild_counters(cls):
+		"""Recompute every denormalized counter with one UPDATE per table."""
+		comments = Comment.objects.filter(post=OuterRef('pk')).values('post')
+		cls.objects.update(
+			comment_count=Coalesce(Subquery(comments.annotate(n=Count('pk')).values('n')), 0),
+			last_commented_at=Subquery(comments.annotate(latest=Max('created_at')).values('latest')),
+		)
+		through = cls.tags.through.objects.filter(tag=OuterRef('pk')).values('tag')
+		Tag.objects.update(
+			post_count=Coalesce(Subquery(through.annotate(n=Count('pk')).values('n')), 0),
+		)
+
+
+def archive_period(value):
+	"""``(year, month)`` of a datetime in the current time zone, as ``ExtractYear``/``ExtractMonth`` see it."""
+	local = timezone.localtime(value) if timezone.is_aware(value) else value
+	return local.year, local.month
+
+
+def month_bounds(year, month):
+	"""Aware ``[start, end)`` datetimes of a month in the current time zone."""
+	start = datetime.datetime(year, month, 1)
+	end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+	if settings.USE_TZ:
+		start, end = timezone.make_aware(start), timezone.make_aware(end)
+	return start, end
+
+
+class PostArchiveBucketQuerySet(models.QuerySet):
+	# ``latest_post_id`` is the bucket's newest post in archive order:
+	# latest ``published_date``, then highest id.
+
+	def _latest_post(self, author_id, year, month):
+		start, end = month_bounds(year, month)
+		return Subquery(
+			Post.objects.using(self.db)
+			.filter(author_id=author_id, published_date__gte=start, published_date__lt=end)
+			.order_by('-published_date', '-id')
+			.values('id')[:1]
+		)
+
+	def record_added(self, author_id, year, month, post_id):
+		bucket = self.filter(author_id=author_id, year=year, month=month)
+		changed = bucket.update(
+			post_count=F('post_count') + 1,
+			latest_post_id=self._latest_post(author_id, year, month),
+		)
+		if changed:
+			return
+		try:
+			with transaction.atomic(using=self.db):
+				self.create(author_id=author_id, year=year, month=month, post_count=1, latest_post_id=post_id)
+		except IntegrityError:
+			# A concurrent save created the bucket first.
+			bucket.update(
+				post_count=F('post_count') + 1,
+				latest_post_id=self._latest_post(author_id, year, month),
+			)
+
+	def record_removed(self, author_id, year, month):
+		bucket = self.filter(author_id=author_id, year=year, month=month)
+		bucket.update(
+			post_count=F('post_count') - 1,
+			latest_post_id=self._latest_post(author_id, year, month),
+		)
+		bucket.filter(post_count=0).delete()
+
+	def months(self):
+		"""``(year, month, post_count)`` summed across authors, newest first."""
+		return (
+			self.values('year', 'month')
+			.annotate(total=Sum('post_count'))
+			.order_by('-year', '-month')
+		)
+
+	def rebuild(self):
+		"""
+		Recompute every bucket from one pass over ``Post`` in archive order, so
+		the first post seen for a bucket is its latest.
+		"""
+		buckets = {}
+		rows = (
+			Post.objects.using(self.db)
+			.order_by('-published_date', '-id')
+			.values_list('author_id', 'published_date', 'id')
+		)
+		for author_id, published_date, pk in rows.iterator(chunk_size=2000):
+			key = (author_id, *archive_period(published_date))
+			if key in buckets:
+				buckets[key].post_count += 1
+			else:
+				buckets[key] = self.model(
+					author_id=author_id, year=key[1], month=key[2], post_count=1, latest_post_id=pk
+				)
+		with transaction.atomic(using=self.db):
+			self.all().delete()
+			self.bulk_create(buckets.values(), batch_size=500)
+
+
+class PostArchiveBucket(models.Model):
+	"""
+	Posts per author per month, kept up to date by the receivers in
+	``blog/signals.py`` so archive navigation never has to GROUP BY ``blog_post``.
+	"""
+
+	author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archive_buckets')
+	year = models.PositiveSmallIntegerField()
+	month = models.PositiveSmallIntegerField()
+	post_count = models.PositiveIntegerField(default=0)
+	latest_post_id = models.IntegerField(null=True, blank=True)
+
+	objects = PostArchiveBucketQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['author', 'year', 'month'], name='blog_archive_bucket_unique'),
+		]
+		indexes = [
+			models.Index(fields=['year', 'month'], name='blog_archive_month_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.author_id} {self.year}-{self.month:02d}: {self.post_count}'
+
+
+class PostSimilarityQuerySet(models.QuerySet):
+	def for_post(self, post_id):
+		"""A post's stored neighbours, best first: one range on the ``(post, rank)`` constraint."""
+		return (
+			self.filter(post_id=post_id)
+			.order_by('rank')
+			.select_related('other')
+			.only('rank', 'score', 'other__title')
+		)
+
+
+class PostSimilarity(models.Model):
+	"""
+	One of a post's top-N related posts, ranked by ``score``. Written only by
+	``blog/related.py``; every row of a post is replaced together.
+	"""
+
+	post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='similar_posts')
+	other = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+	rank = models.PositiveSmallIntegerField()
+	score = models.FloatField()
+	computed_at = models.DateTimeField(default=timezone.now)
+
+	objects = PostSimilarityQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['post', 'rank'], name='blog_postsimilarity_rank_unique'),
+		]
+		indexes = [
+			models.Index(fields=['other'], name='blog_postsim_other_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.post_id} -> {self.other_id} ({self.score:.3f})'
+
+
+class PostSimilarityUpdate(models.Model):
+	"""
+	A post whose related posts need recomputing. The receivers in
+	``blog/signals.py`` insert these rows in the same transaction as the
+	change; ``blog/related.py`` takes them in batches and deletes them once
+	the new lists are stored. ``post_id`` is not a foreign key because
+	deleted posts are queued too. A ``listed_only`` row names a post that
+	listed a deleted one: only its own list is recomputed.
+	"""
+
+	post_id = models.IntegerField()
+	listed_only = models.BooleanField(default=False)
+	queued_at = models.DateTimeField(default=timezone.now)
+
+	def __str__(self):
+		return f'{self.post_id} queued at {self.queued_at:%Y-%m-%d %H:%M:%S}'
+
+
+class PostStats(models.Model):
+	"""
+	View totals and trending rank for one post, written in batches by
+	``blog/post_stats.py`` rather than on every page view.
+
+	``trending_score`` is the log of the post's exponentially decayed view count,
+	measured against a fixed epoch (see ``post_stats.trending_increment``), so
+	ordering by it ranks posts by current heat without ever rescoring old rows.
+	"""
+
+	post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+	views = models.PositiveBigIntegerField(default=0)
+	trending_score = models.FloatField(default=0.0)
+	last_viewed_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['-trending_score'], name='blog_poststats_trending_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.post_id}: {self.views} views'
+
+
+class ImportCheckpoint(models.Model):
+	"""
+	How many records of an input ``blog_import`` has committed. Saved in the
+	same transaction as each batch, so a resumed import never repeats or
+	skips one.
+	"""
+
+	key = models.CharField(max_length=255, unique=True)
+	position = models.PositiveBigIntegerField(default=0)
+	updated = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f'{self.key}: {self.position}'
+
+
+def path_segment(pk):
+	"""Fixed-width base-36 id so that comparing paths as strings follows id order."""
+	digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+	segment = ''
+	while pk:
+		pk, remainder = divmod(pk, 36)
+		segment = digits[remainder] + segment
+	return segment.rjust(Comment.PATH_STEP - 1, '0') + '/'
+
+
+class CommentQuerySet(models.QuerySet):
+	def top_level(self):
+		return self.filter(parent__isnull=True)
+
+	def with_reply_count(self):
+		"""
+		Annotate ``reply_count`` (direct replies) with a correlated subquery on the
+		``parent`` index rather than a JOIN + GROUP BY, so the outer query can
+		still be read in index order.
+		"""
+		replies = Comment.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+		return self.annotate(reply_count=Coalesce(Subquery(replies.annotate(n=Count('pk')).values('n')), 0))
+
+	def subtree(self, comment):
+		"""
+		All replies below ``comment`` in thread order, as one range scan on ``path``.
+		'/' sorts just before '0', so every descendant path lies between
+		``comment.path`` and the same prefix with its trailing '/' replaced by '0'.
+		"""
+		return self.filter(path__gt=comment.path, path__lt=comment.path[:-1] + '0').order_by('path')
 
 
 class Comment(models.Model):
+	# Each path segment is 7 base-36 digits plus '/', so a path of 255 chars
+	# allows threads 31 levels deep for ids up to 36**7.
+	PATH_STEP = 8
+	MAX_DEPTH = 255 // PATH_STEP
+
 	post = models.ForeignKey(
 		Post,
 		on_delete=models.CASCADE,
@@ -45,6 +638,82 @@ class Comment(models.Model):
 		on_delete=models.CASCADE,
 		related_name='comments',
 	)
+	parent = models.ForeignKey(
+		'self',
+		null=True,
+		blank=True,
+		on_delete=models.CASCADE,
+		related_name='replies',
+	)
+	# Materialized path: the ids from the thread root down to this comment.
+	path = models.CharField(max_length=255, db_index=True, editable=False, default='')
 	content = models.TextField()
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
+
+	objects = CommentQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['post', 'created_at'], name='blog_comment_post_created_idx'),
+			# Threads on the detail page are paged by path within one post.
+			models.Index(fields=['post', 'path'], name='blog_comment_post_path_idx'),
+		]
+
+	@property
+	def depth(self):
+		return len(self.path) // self.PATH_STEP - 1
+
+	def save(self, *args, **kwargs):
+		creating = self._state.adding
+		super().save(*args, **kwargs)
+		if creating or not self.path:
+			# The path needs our own pk, so it can only be set after the INSERT.
+			prefix = self.parent.path if self.parent_id else ''
+			self.path = prefix + path_segment(self.pk)
+			Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+
+class CommentSubmissionQuerySet(models.QuerySet):
+	def pending(self):
+		return self.filter(status=CommentSubmission.PENDING).order_by('pk')
+
+	def rejected(self):
+		return self.filter(status=CommentSubmission.REJECTED)
+
+
+class CommentSubmission(models.Model):
+	"""
+	A comment waiting for moderation. ``blog/moderation.py`` scores pending
+	rows in batches, copies approved ones into ``Comment`` and deletes them;
+	rejected ones stay as the naive Bayes spam examples.
+	"""
+
+	PENDING = 'pending'
+	REJECTED = 'rejected'
+	STATUS_CHOICES = [
+		(PENDING, 'Pending'),
+		(REJECTED, 'Rejected'),
+	]
+
+	post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comment_submissions')
+	author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comment_submissions')
+	parent = models.ForeignKey(Comment, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+	content = models.TextField()
+	submitted_at = models.DateTimeField(default=timezone.now)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+	# For rejected rows: the highest classifier score (0.0 clean to 1.0 spam) and who gave it.
+	score = models.FloatField(null=True, blank=True)
+	flagged_by = models.CharField(max_length=50, blank=True)
+	moderated_at = models.DateTimeField(null=True, blank=True)
+
+	objects = CommentSubmissionQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# The worker takes the oldest pending rows; training reads the newest rejected ones.
+			models.Index(fields=['status', 'id'], name='blog_commentsub_status_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.author_id} on {self.post_id} ({self.status})'
@@ -0,0 +1,367 @@
+"""
+Comment moderation: new comments wait in ``CommentSubmission`` and are scored
+and published in batches.
+
+``submit()`` only inserts the submission, so posting a comment never waits for
+a classifier. ``moderate_batch()`` takes the oldest ``BLOG_MODERATION_BATCH_SIZE``
+pending rows and runs every classifier in ``BLOG_COMMENT_CLASSIFIERS`` over the
+whole batch. A submission is rejected when any classifier scores it at
+``BLOG_COMMENT_SPAM_THRESHOLD`` or more. The batch is then settled with a fixed
+number of queries:
+
+- one ``bulk_create`` of the approved comments
+- one ``executemany`` for their paths
+- one ``executemany`` for their posts' counters
+- one ``executemany`` that marks the rejected submissions
+- one DELETE of the approved submissions
+
+The per-row writes are raw ``executemany`` statements because a ``CASE``
+per row makes ``bulk_update`` cost more than the classifiers themselves.
+
+Moderation is off unless ``BLOG_COMMENT_MODERATION`` is true; until then
+comments are published as they are posted. Once it is on, nothing in the
+web processes moderates by default: run one
+``python manage.py moderate_comments --loop`` process, or run the command
+without ``--loop`` from cron where nothing long-lived is available. On
+databases with ``SKIP LOCKED`` (PostgreSQL, MySQL) overlapping runs take
+different rows; on SQLite run one at a time.
+``BLOG_MODERATION_WORKER = 'thread'`` opts in to a daemon thread in each
+process instead. It is woken when a submission commits and polls every
+``BLOG_MODERATION_POLL_SECONDS`` otherwise; it suits a single long-lived
+process such as ``runserver``.
+
+A classifier is a class with a ``name`` and a ``score(submissions)`` method
+that returns one float per submission, from 0.0 (clean) to 1.0 (spam). A worker
+keeps one instance of each for its lifetime, so classifiers may keep state
+between batches. Built in:
+
+- ``LinkClassifier`` — too many links.
+- ``DuplicateClassifier`` — word shingles shared with recent comments or submissions.
+- ``NaiveBayesClassifier`` — word likelihoods learnt from earlier decisions.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import caching
+from .models import Comment, CommentSubmission, Post, path_segment
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASSIFIERS = [
+	'blog.moderation.LinkClassifier',
+	'blog.moderation.DuplicateClassifier',
+	'blog.moderation.NaiveBayesClassifier',
+]
+LINK_RE = re.compile(r'https?://|www\.', re.IGNORECASE)
+
+
+def enabled():
+	return getattr(settings, 'BLOG_COMMENT_MODERATION', False)
+
+
+def batch_size():
+	return getattr(settings, 'BLOG_MODERATION_BATCH_SIZE', 500)
+
+
+def spam_threshold():
+	return getattr(settings, 'BLOG_COMMENT_SPAM_THRESHOLD', 0.8)
+
+
+class LinkClassifier:
+	"""``links / (BLOG_MODERATION_MAX_LINKS + 1)``: one link over the limit scores 1.0."""
+
+	name = 'links'
+
+	def __init__(self):
+		self.max_links = getattr(settings, 'BLOG_MODERATION_MAX_LINKS', 2)
+
+	def score(self, submissions):
+		return [min(1.0, len(LINK_RE.findall(s.content)) / (self.max_links + 1)) for s in submissions]
+
+
+def shingles(text, size):
+	"""Hashes of the ``size``-word windows of ``text``; empty for shorter texts."""
+	words = tokenize(text)
+	return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+class DuplicateClassifier:
+	"""
+	The highest Jaccard resemblance between a submission's word shingles and
+	those of the last ``BLOG_MODERATION_DUPLICATE_WINDOW`` comments and
+	submissions, earlier ones in the same batch included. An inverted index
+	from shingle to text means a submission is only compared with texts it
+	shares a shingle with. Texts with fewer than ``MIN_SHINGLES`` shingles
+	(under eight words, such as "thanks for sharing this") score 0.0: stock
+	replies that short are posted word for word by different people.
+	"""
+
+	name = 'duplicate'
+	SHINGLE_SIZE = 4
+	MIN_SHINGLES = 5
+
+	def __init__(self):
+		self.window = getattr(settings, 'BLOG_MODERATION_DUPLICATE_WINDOW', 1000)
+		self.texts = {}
+		self.order = deque()
+		self.index = {}
+		self.last_comment = 0
+
+	def add(self, key, text_shingles):
+		if len(text_shingles) < self.MIN_SHINGLES:
+			return
+		self.texts[key] = text_shingles
+		self.order.append(key)
+		for shingle in text_shingles:
+			self.index.setdefault(shingle, set()).add(key)
+		while len(self.order) > self.window:
+			old = self.order.popleft()
+			for shingle in self.texts.pop(old):
+				keys = self.index[shingle]
+				keys.discard(old)
+				if not keys:
+					del self.index[shingle]
+
+	def catch_up(self):
+		"""Index the comments published since the last batch, by any process."""
+		rows = list(
+			Comment.objects.filter(pk__gt=self.last_comment)
+			.order_by('-pk')
+			.values_list('pk', 'content')[:self.window]
+		)
+		for pk, content in reversed(rows):
+			self.add(('comment', pk), shingles(content, self.SHINGLE_SIZE))
+		if rows:
+			self.last_comment = rows[0][0]
+
+	def score(self, submissions):
+		self.catch_up()
+		scores = []
+		for submission in submissions:
+			own = shingles(submission.content, self.SHINGLE_SIZE)
+			if len(own) < self.MIN_SHINGLES:
+				scores.append(0.0)
+				continue
+			shared = Counter(key for shingle in own for key in self.index.get(shingle, ()))
+			scores.append(max(
+				(n / (len(own) + len(self.texts[key]) - n) for key, n in shared.items()),
+				default=0.0,
+			))
+			self.add(('submission', submission.pk), own)
+		return scores
+
+
+class NaiveBayesClassifier:
+	"""
+	Multinomial naive Bayes over words, trained on the newest
+	``BLOG_MODERATION_TRAINING_SIZE`` published comments (ham) and rejected
+	submissions (spam), and retrained every ``RETRAIN_EVERY`` batches. Until
+	both classes have ``MIN_EXAMPLES`` examples it scores everything 0.0.
+	"""
+
+	name = 'bayes'
+	MIN_EXAMPLES = 20
+	RETRAIN_EVERY = 20
+
+	def __init__(self):
+		self.training_size = getattr(settings, 'BLOG_MODERATION_TRAINING_SIZE', 5000)
+		self.batches = 0
+		self.model = None
+
+	@staticmethod
+	def _count(texts):
+		words = Counter()
+		documents = 0
+		for text in texts:
+			documents += 1
+			words.update(tokenize(text))
+		return documents, words
+
+	def train(self):
+		ham_documents, ham = self._count(
+			Comment.objects.order_by('-pk').values_list('content', flat=True)[:self.training_size]
+		)
+		spam_documents, spam = self._count(
+			CommentSubmission.objects.rejected().order_by('-pk').values_list('content', flat=True)[:self.training_size]
+		)
+		if min(ham_documents, spam_documents) < self.MIN_EXAMPLES:
+			self.model = None
+			return
+		vocabulary = ham.keys() | spam.keys()
+		# Laplace smoothing: every word is seen once more in each class.
+		ham_total = sum(ham.values()) + len(vocabulary)
+		spam_total = sum(spam.values()) + len(vocabulary)
+		prior = math.log(spam_documents / ham_documents)
+		weights = {
+			word: math.log((spam[word] + 1) / spam_total) - math.log((ham[word] + 1) / ham_total)
+			for word in vocabulary
+		}
+		self.model = prior, weights
+
+	def score(self, submissions):
+		if self.batches % self.RETRAIN_EVERY == 0:
+			self.train()
+		self.batches += 1
+		if self.model is None:
+			return [0.0] * len(submissions)
+		prior, weights = self.model
+		scores = []
+		for submission in submissions:
+			# Spam log-odds; words never seen in training carry no evidence.
+			log_odds = prior + sum(weights.get(word, 0.0) for word in tokenize(submission.content))
+			scores.append(1 / (1 + math.exp(-max(-50.0, min(50.0, log_odds)))))
+		return scores
+
+
+def load_classifiers():
+	return [import_string(path)() for path in getattr(settings, 'BLOG_COMMENT_CLASSIFIERS', DEFAULT_CLASSIFIERS)]
+
+
+def submit(post, author, content, parent=None):
+	"""Queue a comment for moderation; the worker is woken once the row commits."""
+	submission = CommentSubmission.objects.create(post=post, author=author, parent=parent, content=content)
+	transaction.on_commit(wake_worker)
+	return submission
+
+
+def publish(submissions, using='default'):
+	"""
+	Copy submissions into ``Comment`` and update their posts' counters; the
+	caller deletes the submissions. Returns the affected post ids.
+	"""
+	connection = connections[using]
+	parent_paths = dict(
+		Comment.objects.using(using)
+		.filter(pk__in={s.parent_id for s in submissions if s.parent_id})
+		.values_list('pk', 'path')
+	)
+	comments = Comment.objects.using(using).bulk_create([
+		Comment(post_id=s.post_id, author_id=s.author_id, parent_id=s.parent_id, content=s.content)
+		for s in submissions
+	])
+	counts, latest = Counter(), {}
+	for comment in comments:
+		comment.path = parent_paths.get(comment.parent_id, '') + path_segment(comment.pk)
+		counts[comment.post_id] += 1
+		latest[comment.post_id] = max(latest.get(comment.post_id, comment.created_at), comment.created_at)
+
+	comment_table = connection.ops.quote_name(Comment._meta.db_table)
+	post_table = connection.ops.quote_name(Post._meta.db_table)
+	with connection.cursor() as cursor:
+		cursor.executemany(
+			f'UPDATE {comment_table} SET path = %s WHERE id = %s',
+			[(comment.path, comment.pk) for comment in comments],
+		)
+		cursor.executemany(
+			f'UPDATE {post_table} SET comment_count = comment_count + %s, '
+			f'last_commented_at = CASE WHEN last_commented_at IS NULL OR last_commented_at < %s '
+			f'THEN %s ELSE last_commented_at END WHERE id = %s',
+			[
+				(n, at, at, pk)
+				for pk, n in counts.items()
+				for at in [connection.ops.adapt_datetimefield_value(latest[pk])]
+			],
+		)
+	return list(counts)
+
+
+def moderate_batch(classifiers, size=None, using='default'):
+	"""Decide the oldest pending submissions; return ``(approved, rejected)`` counts."""
+	size = size or batch_size()
+	limit = spam_threshold()
+	connection = connections[using]
+	with transaction.atomic(using=using):
+		batch = list(CommentSubmission.objects.using(using).pending().select_for_update(skip_locked=True)[:size])
+		if not batch:
+			return 0, 0
+		results = [(classifier.name, classifier.score(batch)) for classifier in classifiers]
+		now = connection.ops.adapt_datetimefield_value(timezone.now())
+		approved, rejected = [], []
+		for i, submission in enumerate(batch):
+			score, name = max(((scores[i], name) for name, scores in results), default=(0.0, ''))
+			if score >= limit:
+				rejected.append((CommentSubmission.REJECTED, score, name, now, submission.pk))
+			else:
+				approved.append(submission)
+		post_ids = publish(approved, using) if approved else []
+		if rejected:
+			with connection.cursor() as cursor:
+				cursor.executemany(
+					f'UPDATE {connection.ops.quote_name(CommentSubmission._meta.db_table)} '
+					f'SET status = %s, score = %s, flagged_by = %s, moderated_at = %s WHERE id = %s',
+					rejected,
+				)
+		if approved:
+			CommentSubmission.objects.using(using).filter(pk__in=[s.pk for s in approved]).delete()
+	if post_ids:
+		caching.bump('posts', *(f'post:{pk}' for pk in post_ids), *(f'comments:{pk}' for pk in post_ids))
+	return len(approved), len(rejected)
+
+
+def approve(submission_ids, using='default'):
+	"""Publish submissions regardless of their scores, e.g. ones rejected by mistake."""
+	with transaction.atomic(using=using):
+		submissions = list(CommentSubmission.objects.using(using).filter(pk__in=submission_ids).order_by('pk'))
+		post_ids = publish(submissions, using) if submissions else []
+		CommentSubmission.objects.using(using).filter(pk__in=[s.pk for s in submissions]).delete()
+	if post_ids:
+		caching.bump('posts', *(f'post:{pk}' for pk in post_ids), *(f'comments:{pk}' for pk in post_ids))
+	return len(submissions)
+
+
+def drain(classifiers=None, size=None, using='default'):
+	"""Moderate batches until the queue is empty; return ``(approved, rejected)`` totals."""
+	classifiers = load_classifiers() if classifiers is None else classifiers
+	size = size or batch_size()
+	approved = rejected = 0
+	while True:
+		batch_approved, batch_rejected = moderate_batch(classifiers, size, using)
+		approved += batch_approved
+		rejected += batch_rejected
+		if batch_approved + batch_rejected < size:
+			return approved, rejected
+
+
+class ModerationWorker(threading.Thread):
+	"""Drains the queue whenever it is woken, or every ``BLOG_MODERATION_POLL_SECONDS``."""
+
+	def __init__(self):
+		super().__init__(name='blog-moderation', daemon=True)
+		self.wake = threading.Event()
+
+	def run(self):
+		classifiers = load_classifiers()
+		while True:
+			self.wake.wait(getattr(settings, 'BLOG_MODERATION_POLL_SECONDS', 30))
+			self.wake.clear()
+			try:
+				drain(classifiers)
+			except DatabaseError:
+				# Typically a lock timeout; the rows stay pending for the next round.
+				logger.exception('Comment moderation batch failed')
+			finally:
+				connections.close_all()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def wake_worker():
+	global _worker
+	if getattr(settings, 'BLOG_MODERATION_WORKER', None) != 'thread':
+		return
+	with _worker_lock:
+		if _worker is None or not _worker.is_alive():
+			_worker = ModerationWorker()
+			_worker.start()
+	_worker.wake.set()
@@ -0,0 +1,173 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q
+from django.http import Http404
+
+
+def _json_default(value):
+	# Keep full microsecond precision; DjangoJSONEncoder rounds to milliseconds,
+	# which would make the cursor skip rows that share a millisecond.
+	if isinstance(value, (datetime.datetime, datetime.date)):
+		return value.isoformat()
+	return str(value)
+
+
+def encode_cursor(values, direction='next'):
+	payload = json.dumps({'k': list(values), 'd': direction}, default=_json_default, separators=(',', ':'))
+	return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+	"""Return ``(values, direction)`` for an opaque cursor, or raise ValueError."""
+	try:
+		padded = token + '=' * (-len(token) % 4)
+		payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+		values, direction = payload['k'], payload['d']
+	except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as exc:
+		raise ValueError('Malformed cursor') from exc
+	if direction not in ('next', 'prev') or not isinstance(values, list):
+		raise ValueError('Malformed cursor')
+	return values, direction
+
+
+class KeysetPage:
+	def __init__(self, object_list, next_key=None, previous_key=None):
+		self.object_list = object_list
+		self.next_cursor = encode_cursor(next_key, 'next') if next_key is not None else None
+		self.previous_cursor = encode_cursor(previous_key, 'prev') if previous_key is not None else None
+
+	def __iter__(self):
+		return iter(self.object_list)
+
+	def __len__(self):
+		return len(self.object_list)
+
+	def has_next(self):
+		return self.next_cursor is not None
+
+	def has_previous(self):
+		return self.previous_cursor is not None
+
+	def has_other_pages(self):
+		return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+	"""
+	Paginate a queryset by seeking past the last row seen instead of using OFFSET.
+
+	``ordering`` must be unique across rows (end it with ``id``) so that every
+	row has exactly one position. Each page costs a single indexed range query
+	of ``per_page + 1`` rows and no COUNT(*), however deep the page is.
+
+	Rows are model instances unless ``key`` is given: a function returning a
+	row's values for the ``ordering`` fields, e.g. for ``values_list()`` rows.
+	"""
+
+	def __init__(self, queryset, per_page, ordering=('-published_date', '-id'), key=None):
+		self.queryset = queryset
+		self.per_page = per_page
+		self.ordering = tuple(ordering)
+		self.fields = [name.lstrip('-') for name in self.ordering]
+		self.key = key
+
+	def _key(self, obj):
+		if self.key is not None:
+			return list(self.key(obj))
+		return [getattr(obj, name) for name in self.fields]
+
+	def _parse(self, values):
+		if len(values) != len(self.fields):
+			raise ValueError('Malformed cursor')
+		opts = self.queryset.model._meta
+		try:
+			return [opts.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+		except Exception as exc:
+			raise ValueError('Malformed cursor') from exc
+
+	def _seek(self, values, forward):
+		# (a, b) after (x, y) in "-a, -b" order is: a < x OR (a = x AND b < y).
+		condition = Q()
+		for index, name in enumerate(self.ordering):
+			descending = name.startswith('-')
+			lookup = 'lt' if descending == forward else 'gt'
+			term = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+			for prior, value in zip(self.fields[:index], values[:index]):
+				term &= Q(**{prior: value})
+			condition |= term
+		return condition
+
+	@staticmethod
+	def _reverse(ordering):
+		return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+	def _slice(self, cursor):
+		"""Return ``(queryset, forward)``: the rows to fetch for the page at ``cursor``."""
+		if not cursor:
+			return self.queryset.order_by(*self.ordering)[:self.per_page + 1], True
+		values, direction = decode_cursor(cursor)
+		values = self._parse(values)
+		forward = direction == 'next'
+		ordering = self.ordering if forward else self._reverse(self.ordering)
+		return self.queryset.filter(self._seek(values, forward)).order_by(*ordering)[:self.per_page + 1], forward
+
+	def _page(self, rows, cursor, forward):
+		has_more = len(rows) > self.per_page
+		rows = rows[:self.per_page]
+		if not cursor:
+			return KeysetPage(rows, next_key=self._key(rows[-1]) if has_more else None)
+		if not forward:
+			rows.reverse()
+		if not rows:
+			return KeysetPage(rows)
+
+		if forward:
+			return KeysetPage(
+				rows,
+				next_key=self._key(rows[-1]) if has_more else None,
+				previous_key=self._key(rows[0]),
+			)
+		return KeysetPage(
+			rows,
+			next_key=self._key(rows[-1]),
+			previous_key=self._key(rows[0]) if has_more else None,
+		)
+
+	def page(self, cursor=None):
+		"""Return the page after (or before) ``cursor``; raise ValueError if it is malformed."""
+		queryset, forward = self._slice(cursor)
+		return self._page(list(queryset), cursor, forward)
+
+	async def apage(self, cursor=None):
+		"""Async ``page()``: the rows are fetched with ``aiterator()``."""
+		queryset, forward = self._slice(cursor)
+		rows = [row async for row in queryset.aiterator(chunk_size=self.per_page + 1)]
+		return self._page(rows, cursor, forward)
+
+
+class KeysetPaginationMixin:
+	"""ListView mixin that swaps Django's OFFSET/COUNT paginator for keyset pagination."""
+
+	paginate_by = 10
+	keyset_ordering = ('-published_date', '-id')
+	cursor_kwarg = 'cursor'
+
+	def paginate_queryset(self, queryset, page_size):
+		paginator = KeysetPaginator(queryset, page_size, ordering=self.keyset_ordering)
+		cursor = self.request.GET.get(self.cursor_kwarg)
+		try:
+			page = paginator.page(cursor)
+		except ValueError:
+			raise Http404('Invalid page cursor.')
+		return (paginator, page, page.object_list, page.has_other_pages())
+
+	async def apaginate_queryset(self, queryset, page_size):
+		paginator = KeysetPaginator(queryset, page_size, ordering=self.keyset_ordering)
+		try:
+			page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+		except ValueError:
+			raise Http404('Invalid page cursor.')
+		return (paginator, page, page.object_list, page.has_other_pages())
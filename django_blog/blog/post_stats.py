@@ -0,0 +1,170 @@
+"""
+Write-behind view counts and the trending-posts ranking.
+
+``record_view(post_id)`` only bumps a counter in a per-process buffer. The
+buffer is written to ``PostStats`` in one batch when it is due: once
+``BLOG_VIEW_FLUSH_SECONDS`` have passed since the last flush, or as soon as it
+holds ``BLOG_VIEW_FLUSH_MAX_POSTS`` posts. ``blog/signals.py`` checks after
+every request, once the response has been sent and the request's database
+routing is over. A hot post therefore costs one UPDATE per interval per
+process instead of one per view. Views still in the buffer when a process
+stops are lost; the counts are a popularity signal, not an audit log.
+
+Trending: a view at Unix time ``t`` weighs ``2 ** ((t - EPOCH) / half_life)``,
+so relative to now every view loses half its weight each
+``BLOG_TRENDING_HALF_LIFE`` seconds. A post's score is the log of its summed
+weights. The scale factor is the same for every post, so ordering by score
+ranks posts by their decayed view count, and a flush just log-adds the new
+batch to the stored score. Old rows never need rescoring.
+
+``trending_posts()`` reads the top of the score index and caches the result
+for ``BLOG_TRENDING_CACHE_SECONDS``.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, PositiveBigIntegerField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from . import caching
+from .models import Post, PostStats
+
+# 2024-01-01T00:00:00Z. Scores grow by ln(2) per half-life after it, so they
+# stay small floats for centuries.
+EPOCH = 1704067200
+# Posts per UPDATE statement; each adds three CASE branches.
+WRITE_BATCH = 250
+
+
+def flush_interval():
+	return getattr(settings, 'BLOG_VIEW_FLUSH_SECONDS', 10)
+
+
+def half_life():
+	return getattr(settings, 'BLOG_TRENDING_HALF_LIFE', 24 * 60 * 60)
+
+
+def trending_increment(count, at):
+	"""The score ``count`` views at Unix time ``at`` add, in log space."""
+	return math.log(count) + (at - EPOCH) / half_life() * math.log(2)
+
+
+def heat(score, now=None):
+	"""The decayed view count a stored score stands for at ``now``."""
+	return math.exp(score - trending_increment(1, time.time() if now is None else now))
+
+
+class ViewBuffer:
+	"""Thread-safe ``{post_id: views}`` counts waiting to be written."""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counts = {}
+		self.flushed_at = time.monotonic()
+
+	def add(self, post_id, count=1):
+		with self.lock:
+			self.counts[post_id] = self.counts.get(post_id, 0) + count
+
+	def due(self):
+		with self.lock:
+			if not self.counts:
+				return False
+			return (
+				len(self.counts) >= getattr(settings, 'BLOG_VIEW_FLUSH_MAX_POSTS', 1000)
+				or time.monotonic() - self.flushed_at >= flush_interval()
+			)
+
+	def take(self):
+		"""Return the pending counts and start a new interval."""
+		with self.lock:
+			counts, self.counts = self.counts, {}
+			self.flushed_at = time.monotonic()
+		return counts
+
+
+_buffer = ViewBuffer()
+
+
+def record_view(post_id):
+	_buffer.add(post_id)
+
+
+def flush_due():
+	return _buffer.due()
+
+
+def pending():
+	with _buffer.lock:
+		return dict(_buffer.counts)
+
+
+def reset():
+	"""Drop buffered views without writing them."""
+	_buffer.take()
+
+
+def flush(using='default'):
+	"""Write the buffered views; return how many were written."""
+	counts = _buffer.take()
+	if not counts:
+		return 0
+	return write_views(counts, using=using)
+
+
+def write_views(counts, at=None, using='default'):
+	"""
+	Add ``{post_id: views}`` to ``PostStats`` as seen at Unix time ``at``:
+	one INSERT for posts without a row, then one UPDATE per ``WRITE_BATCH``
+	posts. Posts deleted since their views were counted are skipped.
+	"""
+	at = time.time() if at is None else at
+	now = timezone.now()
+	written = 0
+	with transaction.atomic(using=using):
+		ids = sorted(Post.objects.using(using).filter(pk__in=counts).values_list('pk', flat=True))
+		PostStats.objects.using(using).bulk_create(
+			[PostStats(post_id=pk) for pk in ids], ignore_conflicts=True, batch_size=WRITE_BATCH
+		)
+		for start in range(0, len(ids), WRITE_BATCH):
+			chunk = ids[start:start + WRITE_BATCH]
+			views = Case(
+				*[When(post_id=pk, then=Value(counts[pk])) for pk in chunk],
+				output_field=PositiveBigIntegerField(),
+			)
+			increment = Case(
+				*[When(post_id=pk, then=Value(trending_increment(counts[pk], at))) for pk in chunk],
+				output_field=FloatField(),
+			)
+			score = F('trending_score')
+			# log(e^score + e^increment), without overflowing either exponential.
+			PostStats.objects.using(using).filter(post_id__in=chunk).update(
+				views=F('views') + views,
+				trending_score=Greatest(score, increment) + Ln(Value(1.0) + Exp(-Abs(score - increment))),
+				last_viewed_at=now,
+			)
+			written += sum(counts[pk] for pk in chunk)
+	return written
+
+
+def trending_posts(limit=None):
+	"""
+	``[(post, views, heat), ...]`` for the hottest posts, hottest first. The
+	ranking (ids, views and scores) is cached; posts are loaded per call.
+	"""
+	limit = limit or getattr(settings, 'BLOG_TRENDING_POSTS', 20)
+	cache = caching.get_cache()
+	key = f'blog:trending:{limit}'
+	ranking = cache.get(key)
+	if ranking is None:
+		ranking = list(
+			PostStats.objects.order_by('-trending_score').values_list('post_id', 'views', 'trending_score')[:limit]
+		)
+		cache.set(key, ranking, getattr(settings, 'BLOG_TRENDING_CACHE_SECONDS', 60))
+	posts = Post.objects.for_listing().in_bulk([post_id for post_id, _, _ in ranking])
+	now = time.time()
+	return [(posts[post_id], views, heat(score, now)) for post_id, views, score in ranking if post_id in posts]
@@ -0,0 +1,422 @@
+"""
+Related posts: each post's top-N neighbours by tag overlap and text similarity.
+
+A pair of posts scores
+
+	TAG_WEIGHT * jaccard(tags) + (1 - TAG_WEIGHT) * cosine(tf-idf of title and content)
+
+Both terms come from sparse matrix products over a per-process ``TermMatrix``
+(term counts and tag membership, one row per post), so scoring one post against
+the whole blog is a couple of NumPy/SciPy operations rather than a Python loop.
+The matrix keeps each term's document frequency up to date as rows change, so
+the IDF weights and the row norms they imply are one pass over the nonzeros,
+never a reweighted copy of the corpus. The top ``BLOG_RELATED_POSTS``
+neighbours are stored in ``PostSimilarity`` and the detail page reads them
+with one indexed query.
+
+Requests never score anything. The receivers in ``blog/signals.py`` insert a
+``PostSimilarityUpdate`` row per changed post in the same transaction as the
+change. ``refresh_batch()`` takes up to ``BLOG_RELATED_BATCH_SIZE`` rows,
+replaces just those posts' rows of the matrix and recomputes only the
+neighbour lists that can have moved: the changed posts' own, those that
+listed a changed post, and those a changed post now outranks.
+
+Run one ``python manage.py refresh_related_posts --loop`` process, or the
+command without ``--loop`` from cron. It loads the matrix once and keeps it
+in step with the queue; it reloads only after ``rebuild()``, which bumps the
+``related`` cache version. Keep to one such process: another process's
+matrix would not see the posts this one takes from the queue.
+``BLOG_RELATED_WORKER = 'thread'`` runs the worker as a daemon thread instead,
+woken when a change commits; it suits a single long-lived process such as
+``runserver``.
+
+NumPy and SciPy are optional. Without them ``available()`` is false, nothing is
+queued and the related-posts block stays empty.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, Max, Min
+
+from . import caching
+from .models import Post, PostSimilarity, PostSimilarityUpdate
+from .search import tokenize
+
+try:
+	import numpy as np
+	from scipy import sparse
+except ImportError:  # pragma: no cover - depends on the environment
+	np = sparse = None
+
+# Title terms count this many times as often as body terms.
+TITLE_WEIGHT = 2
+# Rows scored per sparse product during a full rebuild.
+SCORE_CHUNK = 256
+LOAD_CHUNK = 2000
+
+logger = logging.getLogger(__name__)
+
+_matrix_lock = threading.Lock()
+_matrix = None
+
+
+def available():
+	return np is not None
+
+
+def related_count():
+	return getattr(settings, 'BLOG_RELATED_POSTS', 5)
+
+
+def tag_weight():
+	return getattr(settings, 'BLOG_RELATED_TAG_WEIGHT', 0.5)
+
+
+def batch_size():
+	return getattr(settings, 'BLOG_RELATED_BATCH_SIZE', 500)
+
+
+def terms(title, content):
+	return [t for t in tokenize(title) if len(t) > 2] * TITLE_WEIGHT + [t for t in tokenize(content) if len(t) > 2]
+
+
+def splice_rows(matrix, rows, new):
+	"""
+	``matrix`` (CSR) with each row in ``rows`` replaced by the matching row of
+	``new``. The arrays are copied once, in slices; nothing is multiplied.
+	"""
+	order = np.argsort(rows)
+	lengths = np.diff(matrix.indptr)
+	lengths[np.asarray(rows)] = np.diff(new.indptr)
+	data, indices, start = [], [], 0
+	for i in order:
+		row = rows[i]
+		data += [matrix.data[start:matrix.indptr[row]], new.data[new.indptr[i]:new.indptr[i + 1]]]
+		indices += [matrix.indices[start:matrix.indptr[row]], new.indices[new.indptr[i]:new.indptr[i + 1]]]
+		start = matrix.indptr[row + 1]
+	data.append(matrix.data[start:])
+	indices.append(matrix.indices[start:])
+	indptr = np.concatenate([[0], np.cumsum(lengths)])
+	return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=matrix.shape)
+
+
+class TermMatrix:
+	"""
+	Sparse term counts and tag membership for every post, one row per post.
+
+	Rows are never reused: a deleted post's row is zeroed and its id dropped
+	from ``rows``. Columns grow as new terms and tag ids appear.
+	``frequency`` counts the rows each term appears in and is adjusted
+	whenever rows are replaced.
+	"""
+
+	def __init__(self):
+		self.vocabulary = {}
+		self.rows = {}
+		self.post_ids = []
+		self.counts = sparse.csr_matrix((0, 0))
+		self.tags = sparse.csr_matrix((0, 0))
+		self.frequency = np.zeros(0, dtype=np.int64)
+		# Score of each post's last stored neighbour, or 0 while its list is short.
+		self.floor = np.zeros(0)
+		self.version = None
+
+	@classmethod
+	def load(cls, using):
+		matrix = cls()
+		posts = Post.objects.using(using).order_by('pk').values_list('pk', 'title', 'content')
+		tags = Post.tags.through.objects.using(using).order_by('post_id').values_list('post_id', 'tag_id')
+		tag_sets = {}
+		for post_id, tag_id in tags.iterator(chunk_size=LOAD_CHUNK):
+			tag_sets.setdefault(post_id, []).append(tag_id)
+		documents = [
+			(pk, terms(title, content), tag_sets.get(pk, ()))
+			for pk, title, content in posts.iterator(chunk_size=LOAD_CHUNK)
+		]
+		matrix.set_documents(documents)
+		matrix.load_floor(using)
+		return matrix
+
+	def _encode(self, documents):
+		"""Build CSR counts and tags for ``documents`` = ``[(post_id, terms, tag_ids), ...]``."""
+		data, columns, pointers = [], [], [0]
+		tag_columns, tag_pointers = [], [0]
+		for _, words, tag_ids in documents:
+			row = {}
+			for word in words:
+				column = self.vocabulary.setdefault(word, len(self.vocabulary))
+				row[column] = row.get(column, 0) + 1
+			columns.extend(row)
+			data.extend(row.values())
+			pointers.append(len(columns))
+			tag_columns.extend(sorted(set(tag_ids)))
+			tag_pointers.append(len(tag_columns))
+		tag_width = max(tag_columns, default=-1) + 1
+		counts = sparse.csr_matrix(
+			(np.array(data, dtype=np.float64), np.array(columns, dtype=np.int64), np.array(pointers)),
+			shape=(len(documents), len(self.vocabulary)),
+		)
+		tags = sparse.csr_matrix(
+			(np.ones(len(tag_columns)), np.array(tag_columns, dtype=np.int64), np.array(tag_pointers)),
+			shape=(len(documents), tag_width),
+		)
+		return counts, tags
+
+	def _grow(self, rows, terms_width, tags_width):
+		rows = max(rows, self.counts.shape[0])
+		self.counts.resize((rows, max(terms_width, self.counts.shape[1])))
+		self.tags.resize((rows, max(tags_width, self.tags.shape[1])))
+		if self.counts.shape[1] > len(self.frequency):
+			self.frequency = np.concatenate([self.frequency, np.zeros(self.counts.shape[1] - len(self.frequency), dtype=np.int64)])
+		if rows > len(self.floor):
+			self.floor = np.concatenate([self.floor, np.zeros(rows - len(self.floor))])
+
+	def set_documents(self, documents):
+		"""Insert or replace the rows of ``documents``; posts not seen before get new rows."""
+		for post_id, _, _ in documents:
+			if post_id not in self.rows:
+				self.rows[post_id] = len(self.post_ids)
+				self.post_ids.append(post_id)
+		counts, tags = self._encode(documents)
+		self._grow(len(self.post_ids), counts.shape[1], tags.shape[1])
+		counts.resize((counts.shape[0], self.counts.shape[1]))
+		tags.resize((tags.shape[0], self.tags.shape[1]))
+		self._replace([self.rows[post_id] for post_id, _, _ in documents], counts, tags)
+
+	def remove(self, post_ids):
+		rows = [self.rows.pop(pk) for pk in post_ids if pk in self.rows]
+		for row in rows:
+			self.post_ids[row] = None
+		self._replace(
+			rows,
+			sparse.csr_matrix((len(rows), self.counts.shape[1])),
+			sparse.csr_matrix((len(rows), self.tags.shape[1])),
+		)
+		self.floor[rows] = 0
+
+	def _replace(self, rows, counts, tags):
+		if not rows:
+			return
+		width = self.counts.shape[1]
+		old = self.counts[rows]
+		self.frequency -= np.bincount(old.indices[old.data != 0], minlength=width)
+		self.frequency += np.bincount(counts.indices[counts.data != 0], minlength=width)
+		self.counts = splice_rows(self.counts, rows, counts)
+		self.tags = splice_rows(self.tags, rows, tags)
+
+	def load_floor(self, using):
+		limit = related_count()
+		rows = PostSimilarity.objects.using(using).values('post_id').annotate(n=Count('id'), low=Min('score')).order_by()
+		for row in rows:
+			if row['post_id'] in self.rows and row['n'] >= limit:
+				self.floor[self.rows[row['post_id']]] = row['low']
+
+	def weights(self):
+		"""
+		``(idf, scale)``: each term's IDF from the maintained document
+		frequencies, and one over each row's tf-idf norm. One sparse
+		matrix-vector product; the weighted matrix itself is never built.
+		"""
+		documents = len(self.rows) or 1
+		idf = np.log((1 + documents) / (1 + self.frequency)) + 1
+		# Squared counts share the count matrix's structure; only the values are new.
+		squares = sparse.csr_matrix((self.counts.data ** 2, self.counts.indices, self.counts.indptr), shape=self.counts.shape)
+		norms = np.sqrt(squares @ (idf * idf))
+		norms[norms == 0] = 1
+		return idf, 1 / norms
+
+	def scores(self, rows, weights=None):
+		"""Sparse ``len(rows) x n`` combined scores of ``rows`` against every post, self excluded."""
+		rows = np.asarray(rows)
+		idf, scale = self.weights() if weights is None else weights
+		# cosine = (scale_r * counts_r * idf) . (scale_c * counts_c * idf), multiplied
+		# out so that only the few scored rows are ever reweighted.
+		left = sparse.diags(scale[rows]) @ self.counts[rows] @ sparse.diags(idf * idf)
+		cosine = (sparse.diags(scale) @ (self.counts @ left.T)).T.tocoo()
+		shared = (self.tags @ self.tags[rows].T).T.tocoo()
+		sizes = np.asarray(self.tags.sum(axis=1)).ravel()
+		jaccard = shared.data / (sizes[rows[shared.row]] + sizes[shared.col] - shared.data)
+		weight = tag_weight()
+		row = np.concatenate([shared.row, cosine.row])
+		col = np.concatenate([shared.col, cosine.col])
+		data = np.concatenate([weight * jaccard, (1 - weight) * cosine.data])
+		other = rows[row] != col
+		# Duplicate (row, col) entries are summed when the matrix is built.
+		return sparse.csr_matrix((data[other], (row[other], col[other])), shape=(len(rows), self.counts.shape[0]))
+
+	def top(self, scores, limit):
+		"""``[[(other_post_id, score), ...], ...]``: each row's best ``limit`` neighbours, best first."""
+		result = []
+		for i in range(scores.shape[0]):
+			start, end = scores.indptr[i], scores.indptr[i + 1]
+			values, columns = scores.data[start:end], scores.indices[start:end]
+			positive = values > 0
+			values, columns = values[positive], columns[positive]
+			if len(values) > limit:
+				best = np.argpartition(-values, limit - 1)[:limit]
+				values, columns = values[best], columns[best]
+			order = np.lexsort((columns, -values))
+			result.append([(self.post_ids[columns[j]], float(values[j])) for j in order])
+		return result
+
+
+def _current_matrix(using):
+	"""The process's matrix, loaded on first use and again only after a ``rebuild()``."""
+	global _matrix
+	version = caching.get_versions('related')['related']
+	if _matrix is None or _matrix.version != version:
+		_matrix = TermMatrix.load(using)
+		_matrix.version = version
+	return _matrix
+
+
+def _store(matrix, rows, using, weights=None):
+	"""Recompute and replace the neighbour lists of ``rows``; return their post ids."""
+	limit = related_count()
+	weights = matrix.weights() if weights is None else weights
+	post_ids, objects = [], []
+	for offset in range(0, len(rows), SCORE_CHUNK):
+		chunk = rows[offset:offset + SCORE_CHUNK]
+		for row, neighbours in zip(chunk, matrix.top(matrix.scores(chunk, weights), limit)):
+			post_id = matrix.post_ids[row]
+			post_ids.append(post_id)
+			matrix.floor[row] = neighbours[-1][1] if len(neighbours) == limit else 0
+			objects += [
+				PostSimilarity(post_id=post_id, other_id=other, rank=rank, score=score)
+				for rank, (other, score) in enumerate(neighbours)
+			]
+	with transaction.atomic(using=using):
+		PostSimilarity.objects.using(using).filter(post_id__in=post_ids).delete()
+		PostSimilarity.objects.using(using).bulk_create(objects, batch_size=500)
+	return post_ids
+
+
+def refresh(post_ids, using='default', listed_by=()):
+	"""
+	Bring the stored neighbours up to date after ``post_ids`` were created,
+	edited, retagged or deleted. ``listed_by`` names posts that listed a
+	deleted post before the cascade removed those rows.
+	"""
+	with _matrix_lock:
+		matrix = _current_matrix(using)
+		post_ids = set(post_ids)
+		posts = Post.objects.using(using).filter(pk__in=post_ids).prefetch_related('tags')
+		documents = [(p.pk, terms(p.title, p.content), [t.pk for t in p.tags.all()]) for p in posts]
+		matrix.remove(post_ids - {pk for pk, _, _ in documents})
+		matrix.set_documents(documents)
+
+		weights = matrix.weights()
+		changed = [matrix.rows[pk] for pk, _, _ in documents]
+		affected = set(changed)
+		if changed:
+			best = np.asarray(matrix.scores(changed, weights).max(axis=0).todense()).ravel()
+			affected.update(np.flatnonzero(best > matrix.floor).tolist())
+		listing = PostSimilarity.objects.using(using).filter(other_id__in=post_ids).values_list('post_id', flat=True)
+		affected.update(matrix.rows[pk] for pk in {*listing, *listed_by} if pk in matrix.rows)
+
+		stored = _store(matrix, sorted(affected), using, weights) if affected else []
+	if stored:
+		transaction.on_commit(lambda: caching.bump(*(f'post:{pk}' for pk in stored)), using=using)
+	return stored
+
+
+def rebuild(using='default'):
+	"""Recompute every post's neighbours from scratch; return the number of rows stored."""
+	global _matrix
+	with _matrix_lock:
+		# Everything queued so far is covered; later rows stay for the worker.
+		queued = PostSimilarityUpdate.objects.using(using).aggregate(last=Max('pk'))['last']
+		_matrix = matrix = TermMatrix.load(using)
+		PostSimilarity.objects.using(using).all().delete()
+		_store(matrix, sorted(matrix.rows.values()), using)
+		if queued is not None:
+			PostSimilarityUpdate.objects.using(using).filter(pk__lte=queued).delete()
+		# Bumping ``related`` makes any worker's matrix reload.
+		caching.bump('related', 'posts')
+		matrix.version = caching.get_versions('related')['related']
+	return PostSimilarity.objects.using(using).count()
+
+
+def schedule_refresh(post_ids, using='default', listed_by=()):
+	"""Queue posts for the worker, in the caller's transaction; the worker thread, if any, is woken on commit."""
+	if not available() or not related_count() or not (post_ids or listed_by):
+		return
+	PostSimilarityUpdate.objects.using(using).bulk_create(
+		[PostSimilarityUpdate(post_id=pk) for pk in set(post_ids)]
+		+ [PostSimilarityUpdate(post_id=pk, listed_only=True) for pk in set(listed_by)]
+	)
+	transaction.on_commit(wake_worker, using=using)
+
+
+def refresh_batch(size=None, using='default'):
+	"""Refresh the posts of the oldest ``size`` queued rows and delete the rows; return how many there were."""
+	size = size or batch_size()
+	with transaction.atomic(using=using):
+		rows = list(
+			PostSimilarityUpdate.objects.using(using)
+			.select_for_update(skip_locked=True)
+			.order_by('pk')
+			.values_list('pk', 'post_id', 'listed_only')[:size]
+		)
+		if not rows:
+			return 0
+		refresh(
+			{post_id for _, post_id, listed_only in rows if not listed_only}, using,
+			{post_id for _, post_id, listed_only in rows if listed_only},
+		)
+		PostSimilarityUpdate.objects.using(using).filter(pk__in=[pk for pk, _, _ in rows]).delete()
+	return len(rows)
+
+
+def drain(size=None, using='default'):
+	"""Refresh batches until the queue is empty; return the number of rows processed."""
+	size = size or batch_size()
+	total = 0
+	while True:
+		done = refresh_batch(size, using)
+		total += done
+		if done < size:
+			return total
+
+
+class RelatedWorker(threading.Thread):
+	"""Drains the queue whenever it is woken, or every ``BLOG_RELATED_POLL_SECONDS``."""
+
+	def __init__(self):
+		super().__init__(name='blog-related', daemon=True)
+		self.wake = threading.Event()
+
+	def run(self):
+		while True:
+			self.wake.wait(getattr(settings, 'BLOG_RELATED_POLL_SECONDS', 30))
+			self.wake.clear()
+			try:
+				drain()
+			except DatabaseError:
+				# Typically a lock timeout; the rows stay queued for the next round.
+				logger.exception('Related posts refresh failed')
+			finally:
+				connections.close_all()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def wake_worker():
+	global _worker
+	if getattr(settings, 'BLOG_RELATED_WORKER', None) != 'thread':
+		return
+	with _worker_lock:
+		if _worker is None or not _worker.is_alive():
+			_worker = RelatedWorker()
+			_worker.start()
+	_worker.wake.set()
+
+
+def reset():
+	"""Forget the in-process matrix (used by tests)."""
+	global _matrix
+	_matrix = None
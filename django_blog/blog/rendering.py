@@ -0,0 +1,152 @@
+"""
+Markdown rendering for post bodies.
+
+``render(content)`` turns a safe subset of Markdown into HTML and returns it
+with a plain-text excerpt. ``Post.save()`` stores both next to ``content``,
+so pages never render Markdown or truncate full bodies per request.
+
+Supported syntax: paragraphs, ``#`` headings (shifted one level down, below
+the post title), ``-``/``*``/``1.`` lists, ``>`` quotes, fenced code blocks,
+inline code, ``**bold**``, ``*emphasis*`` and ``[text](url)`` links.
+The source is HTML-escaped before any markup is added, so raw HTML in a post is
+shown as text, and links only keep http(s), mailto and relative targets. The
+output needs no separate sanitizer.
+
+This module must stay free of database access: ``rerender_posts`` runs
+``render_batch`` in worker processes.
+
+Bump ``RENDERER_VERSION`` whenever the output for some input changes, then
+run ``python manage.py rerender_posts``.
+"""
+import re
+from html import unescape
+
+from django.utils.html import escape
+
+RENDERER_VERSION = 1
+EXCERPT_LENGTH = 150
+
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+BULLET_RE = re.compile(r'^\s*[-*+]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+
+CODE_SPAN_RE = re.compile(r'`([^`]+)`')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+STRONG_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+EMPHASIS_RE = re.compile(r'\*(?=\S)(.+?)(?<=\S)\*')
+SAFE_URL_RE = re.compile(r'^(https?://|mailto:|/|#|\.{0,2}/)|^[^:/?#]+(?:[/?#]|$)', re.IGNORECASE)
+
+PLAIN_MARKUP_RE = re.compile(r'(\*\*|\*|`)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def render(content):
+	"""Return ``(html, excerpt)`` for a post body."""
+	return to_html(content), excerpt(content)
+
+
+def render_batch(contents):
+	"""``render()`` for many bodies; the unit of work for ``rerender_posts`` workers."""
+	return [render(content) for content in contents]
+
+
+def _safe_url(url):
+	return SAFE_URL_RE.match(unescape(url).strip()) is not None
+
+
+def _link(match):
+	text, url = match.group(1), match.group(2)
+	if not _safe_url(url):
+		return text
+	return f'<a href="{url}" rel="nofollow">{text}</a>'
+
+
+def inline(text):
+	"""Inline markup for one escaped block of text; code spans are left untouched."""
+	parts = CODE_SPAN_RE.split(escape(text))
+	for i in range(0, len(parts), 2):
+		part = LINK_RE.sub(_link, parts[i])
+		part = STRONG_RE.sub(r'<strong>\1</strong>', part)
+		parts[i] = EMPHASIS_RE.sub(r'<em>\1</em>', part)
+	for i in range(1, len(parts), 2):
+		parts[i] = f'<code>{parts[i]}</code>'
+	return ''.join(parts)
+
+
+def to_html(content):
+	lines = (content or '').replace('\r\n', '\n').replace('\r', '\n').split('\n')
+	blocks, paragraph = [], []
+
+	def flush():
+		if paragraph:
+			blocks.append('<p>' + '<br>\n'.join(inline(line) for line in paragraph) + '</p>')
+			paragraph.clear()
+
+	i = 0
+	while i < len(lines):
+		line = lines[i]
+		if FENCE_RE.match(line):
+			flush()
+			fence = FENCE_RE.match(line).group(1)
+			code = []
+			i += 1
+			while i < len(lines) and not lines[i].strip().startswith(fence):
+				code.append(lines[i])
+				i += 1
+			blocks.append(f'<pre><code>{escape(chr(10).join(code))}</code></pre>')
+		elif not line.strip():
+			flush()
+		elif heading := HEADING_RE.match(line):
+			flush()
+			level = min(len(heading.group(1)) + 1, 6)
+			blocks.append(f'<h{level}>{inline(heading.group(2))}</h{level}>')
+		elif QUOTE_RE.match(line):
+			flush()
+			quoted = []
+			while i < len(lines) and (quote := QUOTE_RE.match(lines[i])):
+				quoted.append(quote.group(1))
+				i += 1
+			blocks.append(f'<blockquote>{to_html(chr(10).join(quoted))}</blockquote>')
+			continue
+		elif BULLET_RE.match(line) or NUMBERED_RE.match(line):
+			flush()
+			pattern, tag = (BULLET_RE, 'ul') if BULLET_RE.match(line) else (NUMBERED_RE, 'ol')
+			items = []
+			while i < len(lines) and (item := pattern.match(lines[i])):
+				items.append(f'<li>{inline(item.group(1))}</li>')
+				i += 1
+			blocks.append(f'<{tag}>{"".join(items)}</{tag}>')
+			continue
+		else:
+			paragraph.append(line.strip())
+		i += 1
+	flush()
+	return '\n'.join(blocks)
+
+
+def to_text(content):
+	"""The body as plain text on one line, without Markdown markup."""
+	words = []
+	for line in (content or '').splitlines():
+		if FENCE_RE.match(line):
+			continue
+		for pattern in (HEADING_RE, QUOTE_RE, BULLET_RE, NUMBERED_RE):
+			if match := pattern.match(line):
+				line = match.group(match.lastindex)
+				break
+		line = LINK_RE.sub(r'\1', line)
+		words.append(PLAIN_MARKUP_RE.sub('', line))
+	return WHITESPACE_RE.sub(' ', ' '.join(words)).strip()
+
+
+def excerpt(content, length=EXCERPT_LENGTH):
+	"""At most ``length`` characters of plain text, cut at a word boundary with an ellipsis."""
+	text = to_text(content)
+	if len(text) <= length:
+		return text
+	cut = text[:length - 1]
+	if ' ' in cut:
+		cut = cut.rsplit(' ', 1)[0]
+	return cut.rstrip(' ,.;:') + '…'
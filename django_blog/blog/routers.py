@@ -0,0 +1,103 @@
+"""
+Read-replica routing for the blog.
+
+``ReplicaRouter`` sends reads to a random alias from ``BLOG_REPLICA_DATABASES``,
+but only while a view that opted in with ``replica_reads = True`` is handling
+the request; everything else, and every write, uses ``default``.
+
+``ReplicaRoutingMiddleware`` tracks whether a request wrote to the database and,
+if so, pins that session to the primary for ``BLOG_REPLICA_PIN_SECONDS`` so the
+user reads their own writes despite replication lag.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_SESSION_KEY = 'blog_primary_until'
+
+# Models whose tables live on the replicas and may be read from them.
+REPLICA_APP_LABELS = {'blog', 'auth'}
+
+_request_state = ContextVar('blog_db_routing', default=None)
+
+
+def replica_aliases():
+	return list(getattr(settings, 'BLOG_REPLICA_DATABASES', []))
+
+
+def pin_seconds():
+	return getattr(settings, 'BLOG_REPLICA_PIN_SECONDS', 10)
+
+
+class RoutingState:
+	def __init__(self):
+		self.use_replica = False
+		self.wrote = False
+
+
+class ReplicaRouter:
+	def db_for_read(self, model, **hints):
+		state = _request_state.get()
+		if state is None or not state.use_replica or model._meta.app_label not in REPLICA_APP_LABELS:
+			return None
+		aliases = replica_aliases()
+		return random.choice(aliases) if aliases else None
+
+	def db_for_write(self, model, **hints):
+		state = _request_state.get()
+		if state is not None:
+			state.wrote = True
+		return 'default'
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Replicas hold the same rows as the primary.
+		return True
+
+
+class ReplicaRoutingMiddleware:
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		state = RoutingState()
+		token = _request_state.set(state)
+		try:
+			response = self.get_response(request)
+		finally:
+			_request_state.reset(token)
+		if state.wrote:
+			request.session[PIN_SESSION_KEY] = time.time() + pin_seconds()
+		return response
+
+	async def __acall__(self, request):
+		state = RoutingState()
+		token = _request_state.set(state)
+		try:
+			response = await self.get_response(request)
+		finally:
+			_request_state.reset(token)
+		if state.wrote:
+			await request.session.aset(PIN_SESSION_KEY, time.time() + pin_seconds())
+		return response
+
+	def process_view(self, request, view_func, view_args, view_kwargs):
+		view = getattr(view_func, 'view_class', view_func)
+		if not getattr(view, 'replica_reads', False) or is_pinned(request):
+			return None
+		_request_state.get().use_replica = True
+		return None
+
+
+def is_pinned(request):
+	"""True while ``request``'s session should keep reading from the primary."""
+	return request.session.get(PIN_SESSION_KEY, 0) > time.time()
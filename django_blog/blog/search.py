@@ -0,0 +1,318 @@
+"""
+Full-text search backends for blog posts.
+
+Each backend keeps its own inverted index in a side table next to ``blog_post``
+and ranks matches with BM25-style scoring:
+
+- ``SQLiteFTS5Backend`` — an FTS5 virtual table (``porter unicode61`` tokenizer
+  stems terms; ranking uses FTS5's built-in ``bm25()``).
+- ``PostgresSearchBackend`` — a weighted ``tsvector`` column with a GIN index,
+  ranked with ``ts_rank_cd``.
+- ``BasicSearchBackend`` — the old ``icontains`` scan, used for any other database.
+
+The backend is picked from the connection vendor in ``DATABASES`` unless
+``BLOG_SEARCH_BACKEND`` names a backend class explicitly. The index is kept in
+sync by the receivers in ``blog/signals.py``.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.http import Http404
+from django.utils.module_loading import import_string
+
+from .models import Post
+from .pagination import KeysetPage, decode_cursor
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+	return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class BaseSearchBackend:
+	"""
+	``search()`` returns ``(sort_key, post_id)`` pairs ordered by ascending
+	``sort_key`` (best match first), ties broken by ``post_id``. ``after`` is the
+	``(sort_key, post_id)`` of the last row already shown; with ``backward=True``
+	the rows *before* it are returned, still in ascending order.
+	"""
+
+	def __init__(self, using='default'):
+		self.using = using
+
+	@property
+	def connection(self):
+		return connections[self.using]
+
+	def index_posts(self, post_ids):
+		raise NotImplementedError
+
+	def remove_posts(self, post_ids):
+		raise NotImplementedError
+
+	def search(self, query, limit, after=None, backward=False):
+		raise NotImplementedError
+
+	def rebuild(self):
+		self.clear()
+		ids = Post.objects.using(self.using).values_list('pk', flat=True).order_by('pk')
+		batch = []
+		for pk in ids.iterator(chunk_size=2000):
+			batch.append(pk)
+			if len(batch) == 2000:
+				self.index_posts(batch)
+				batch = []
+		if batch:
+			self.index_posts(batch)
+
+	def clear(self):
+		raise NotImplementedError
+
+	def _documents(self, post_ids):
+		"""Yield ``(id, title, content, tags)`` for posts, with tag names joined by spaces."""
+		posts = (
+			Post.objects.using(self.using)
+			.filter(pk__in=list(post_ids))
+			.prefetch_related('tags')
+			.only('pk', 'title', 'content')
+		)
+		for post in posts:
+			yield post.pk, post.title, post.content, ' '.join(tag.name for tag in post.tags.all())
+
+	def _ranked(self, inner_sql, params, limit, after, backward):
+		"""Wrap ``inner_sql`` (selecting ``post_id, score``) with the keyset seek and limit."""
+		op, direction = ('<', 'DESC') if backward else ('>', 'ASC')
+		sql = f'SELECT post_id, score FROM ({inner_sql}) ranked'
+		params = list(params)
+		if after is not None:
+			score, pk = after
+			sql += f' WHERE score {op} %s OR (score = %s AND post_id {op} %s)'
+			params += [score, score, pk]
+		sql += f' ORDER BY score {direction}, post_id {direction} LIMIT %s'
+		params.append(limit)
+		with self.connection.cursor() as cursor:
+			cursor.execute(sql, params)
+			rows = [(score, pk) for pk, score in cursor.fetchall()]
+		if backward:
+			rows.reverse()
+		return rows
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+	table = 'blog_post_fts'
+	# bm25() column weights for (title, content, tags).
+	weights = (10.0, 1.0, 5.0)
+
+	def index_posts(self, post_ids):
+		post_ids = list(post_ids)
+		if not post_ids:
+			return
+		with self.connection.cursor() as cursor:
+			self._delete(cursor, post_ids)
+			cursor.executemany(
+				f'INSERT INTO {self.table} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)',
+				list(self._documents(post_ids)),
+			)
+
+	def remove_posts(self, post_ids):
+		post_ids = list(post_ids)
+		if post_ids:
+			with self.connection.cursor() as cursor:
+				self._delete(cursor, post_ids)
+
+	def _delete(self, cursor, post_ids):
+		placeholders = ', '.join(['%s'] * len(post_ids))
+		cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', post_ids)
+
+	def clear(self):
+		with self.connection.cursor() as cursor:
+			cursor.execute(f'DELETE FROM {self.table}')
+
+	def search(self, query, limit, after=None, backward=False):
+		tokens = tokenize(query)
+		if not tokens:
+			return []
+		# Quote every token so user input can never be parsed as FTS5 syntax.
+		match = ' '.join('"%s"' % token for token in tokens)
+		weights = ', '.join(str(w) for w in self.weights)
+		inner = (
+			f'SELECT rowid AS post_id, bm25({self.table}, {weights}) AS score '
+			f'FROM {self.table} WHERE {self.table} MATCH %s'
+		)
+		return self._ranked(inner, [match], limit, after, backward)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+	table = 'blog_post_search'
+	config = 'english'
+
+	def index_posts(self, post_ids):
+		post_ids = list(post_ids)
+		if not post_ids:
+			return
+		with self.connection.cursor() as cursor:
+			cursor.executemany(
+				f"""
+				INSERT INTO {self.table} (post_id, document)
+				VALUES (
+					%s,
+					setweight(to_tsvector('{self.config}', %s), 'A')
+					|| setweight(to_tsvector('{self.config}', %s), 'B')
+					|| setweight(to_tsvector('{self.config}', %s), 'D')
+				)
+				ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document
+				""",
+				[(pk, title, tags, content) for pk, title, content, tags in self._documents(post_ids)],
+			)
+
+	def remove_posts(self, post_ids):
+		post_ids = list(post_ids)
+		if post_ids:
+			with self.connection.cursor() as cursor:
+				cursor.execute(f'DELETE FROM {self.table} WHERE post_id = ANY(%s)', [post_ids])
+
+	def clear(self):
+		with self.connection.cursor() as cursor:
+			cursor.execute(f'TRUNCATE {self.table}')
+
+	def search(self, query, limit, after=None, backward=False):
+		if not tokenize(query):
+			return []
+		inner = (
+			f'SELECT post_id, -ts_rank_cd(document, q)::float8 AS score '
+			f"FROM {self.table}, websearch_to_tsquery('{self.config}', %s) q "
+			f'WHERE document @@ q'
+		)
+		return self._ranked(inner, [query], limit, after, backward)
+
+
+class BasicSearchBackend(BaseSearchBackend):
+	"""Unindexed fallback: substring matching, newest first."""
+
+	def index_posts(self, post_ids):
+		pass
+
+	def remove_posts(self, post_ids):
+		pass
+
+	def clear(self):
+		pass
+
+	def search(self, query, limit, after=None, backward=False):
+		query = query.strip()
+		if not query:
+			return []
+		posts = Post.objects.using(self.using).filter(
+			Q(title__icontains=query)
+			| Q(content__icontains=query)
+			| Q(tags__name__icontains=query)
+		)
+		if after is not None:
+			# sort_key is -id, so ascending sort_key means descending id.
+			posts = posts.filter(pk__gt=after[1]) if backward else posts.filter(pk__lt=after[1])
+		ordering = 'pk' if backward else '-pk'
+		ids = list(posts.order_by(ordering).values_list('pk', flat=True).distinct()[:limit])
+		rows = [(-pk, pk) for pk in ids]
+		if backward:
+			rows.reverse()
+		return rows
+
+
+VENDOR_BACKENDS = {
+	'sqlite': SQLiteFTS5Backend,
+	'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using=None):
+	using = using or router.db_for_read(Post) or 'default'
+	path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+	if path:
+		backend_class = import_string(path)
+	else:
+		backend_class = VENDOR_BACKENDS.get(connections[using].vendor, BasicSearchBackend)
+	return backend_class(using=using)
+
+
+class SearchPaginator:
+	"""Keyset pagination over ranked search hits, keyed by ``(sort_key, post_id)``."""
+
+	def __init__(self, queryset, per_page, query, backend=None):
+		self.queryset = queryset
+		self.per_page = per_page
+		self.query = query
+		self.backend = backend or get_search_backend(queryset.db)
+
+	def _position(self, cursor):
+		"""Return ``(after, backward)`` for ``cursor``; raise ValueError if it is malformed."""
+		if not cursor:
+			return None, False
+		values, direction = decode_cursor(cursor)
+		try:
+			after = (float(values[0]), int(values[1]))
+		except (IndexError, TypeError, ValueError) as exc:
+			raise ValueError('Malformed cursor') from exc
+		return after, direction == 'prev'
+
+	def _trim(self, hits, backward):
+		has_more = len(hits) > self.per_page
+		return (hits[-self.per_page:] if backward else hits[:self.per_page]), has_more
+
+	def _page(self, hits, posts, after, backward, has_more):
+		rows = [posts[pk] for _, pk in hits if pk in posts]
+		if not hits:
+			return KeysetPage(rows)
+
+		first, last = list(hits[0]), list(hits[-1])
+		if backward:
+			return KeysetPage(rows, next_key=last, previous_key=first if has_more else None)
+		return KeysetPage(
+			rows,
+			next_key=last if has_more else None,
+			previous_key=first if after is not None else None,
+		)
+
+	def page(self, cursor=None):
+		after, backward = self._position(cursor)
+		hits = self.backend.search(self.query, self.per_page + 1, after=after, backward=backward)
+		hits, has_more = self._trim(hits, backward)
+		posts = self.queryset.in_bulk([pk for _, pk in hits])
+		return self._page(hits, posts, after, backward, has_more)
+
+	async def apage(self, cursor=None):
+		after, backward = self._position(cursor)
+		# Backends run raw SQL through a sync cursor.
+		hits = await sync_to_async(self.backend.search)(self.query, self.per_page + 1, after=after, backward=backward)
+		hits, has_more = self._trim(hits, backward)
+		posts = await self.queryset.ain_bulk([pk for _, pk in hits])
+		return self._page(hits, posts, after, backward, has_more)
+
+
+class SearchPaginationMixin:
+	"""ListView mixin that pages through ``get_search_query()`` hits in rank order."""
+
+	paginate_by = 10
+	cursor_kwarg = 'cursor'
+
+	def get_search_query(self):
+		return (self.request.GET.get('q') or '').strip()
+
+	def paginate_queryset(self, queryset, page_size):
+		paginator = SearchPaginator(queryset, page_size, self.get_search_query())
+		try:
+			page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+		except ValueError:
+			raise Http404('Invalid page cursor.')
+		return (paginator, page, page.object_list, page.has_other_pages())
+
+	async def apaginate_queryset(self, queryset, page_size):
+		paginator = SearchPaginator(queryset, page_size, self.get_search_query())
+		try:
+			page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+		except ValueError:
+			raise Http404('Invalid page cursor.')
+		return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,261 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import caching, post_stats, related, suggest
+from .models import Comment, Post, PostArchiveBucket, PostSimilarity, Tag
+from .search import get_search_backend
+
+
+# Search index.
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, using=None, **kwargs):
+	if not raw:
+		get_search_backend(using).index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, using=None, **kwargs):
+	get_search_backend(using).remove_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	if reverse:
+		# instance is a Tag; post_clear carries no pk_set, so it was captured in pre_clear.
+		post_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_post_ids', ())
+	else:
+		post_ids = [instance.pk]
+	get_search_backend(using).index_posts(post_ids)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def remember_cleared_tag_posts(sender, instance, action, reverse, using=None, **kwargs):
+	if action == 'pre_clear' and reverse:
+		instance._cleared_post_ids = list(instance.posts.using(using).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, raw=False, using=None, **kwargs):
+	if not created and not raw:
+		get_search_backend(using).index_posts(instance.posts.using(using).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_posts(sender, instance, using=None, **kwargs):
+	instance._deleted_post_ids = list(instance.posts.using(using).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag_posts(sender, instance, using=None, **kwargs):
+	get_search_backend(using).index_posts(getattr(instance, '_deleted_post_ids', ()))
+
+
+# Archive rollups: keep PostArchiveBucket in step with each post's (author, month).
+
+@receiver(post_save, sender=Post)
+def update_archive_buckets(sender, instance, created, raw=False, using=None, **kwargs):
+	if raw:
+		return
+	buckets = PostArchiveBucket.objects.using(using)
+	key = instance.archive_key()
+	previous = getattr(instance, '_loaded_archive_key', None)
+	if created:
+		buckets.record_added(*key, instance.pk)
+	elif previous is not None and previous != key:
+		buckets.record_removed(*previous)
+		buckets.record_added(*key, instance.pk)
+	instance._loaded_archive_key = key
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_archive_bucket(sender, instance, using=None, **kwargs):
+	PostArchiveBucket.objects.using(using).record_removed(*instance.archive_key())
+
+
+# Related posts: queue changed posts in the same transaction; a worker refreshes them (blog/related.py).
+
+@receiver(post_save, sender=Post)
+def queue_related_saved_post(sender, instance, raw=False, using=None, **kwargs):
+	if not raw:
+		related.schedule_refresh([instance.pk], using)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def queue_related_post_tags(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	if reverse:
+		post_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_post_ids', ())
+	else:
+		post_ids = [instance.pk]
+	related.schedule_refresh(post_ids, using)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_related_listings(sender, instance, using=None, **kwargs):
+	# The cascade removes rows naming this post before the refresh could see them.
+	if related.available():
+		instance._related_listed_by = list(
+			PostSimilarity.objects.using(using).filter(other=instance).values_list('post_id', flat=True)
+		)
+
+
+@receiver(post_delete, sender=Post)
+def queue_related_deleted_post(sender, instance, using=None, **kwargs):
+	related.schedule_refresh([instance.pk], using, getattr(instance, '_related_listed_by', ()))
+
+
+@receiver(post_delete, sender=Tag)
+def queue_related_deleted_tag(sender, instance, using=None, **kwargs):
+	related.schedule_refresh(getattr(instance, '_deleted_post_ids', ()), using)
+
+
+# Cache invalidation: bump only the version counters a change can affect.
+
+def tag_version_names(slug, name):
+	# Tag pages are reachable by slug (PostByTagListView) and by name (TaggedPostListView).
+	return [f'tag:{slug}', caching.tag_name_version(name)]
+
+
+def _tag_keys(tag_ids, using=None):
+	keys = []
+	for slug, name in Tag.objects.using(using).filter(pk__in=tag_ids).values_list('slug', 'name'):
+		keys += tag_version_names(slug, name)
+	return keys
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, created, raw=False, using=None, **kwargs):
+	if raw:
+		return
+	if created:
+		caching.bump('posts', f'post:{instance.pk}')
+		return
+	tags = _tag_keys(instance.tags.values_list('pk', flat=True), using)
+	# Detail pages that list this post among their related posts show its title.
+	listed_by = PostSimilarity.objects.using(using).filter(other=instance.pk).values_list('post_id', flat=True)
+	caching.bump('posts', f'post:{instance.pk}', *tags, *(f'post:{pk}' for pk in listed_by))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_deleted_post_tags(sender, instance, using=None, **kwargs):
+	instance._deleted_tag_keys = _tag_keys(instance.tags.values_list('pk', flat=True), using)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+	pk = instance.pk
+	caching.bump('posts', 'tags', f'post:{pk}', f'comments:{pk}', *getattr(instance, '_deleted_tag_keys', ()))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_thread(sender, instance, raw=False, **kwargs):
+	if not raw:
+		caching.bump('posts', f'post:{instance.post_id}', f'comments:{instance.post_id}')
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tags(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	# ``tags`` covers everything derived from tag membership: counts, the cloud, related tags.
+	caching.bump('tags')
+	if reverse:
+		post_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_post_ids', ())
+		caching.bump('posts', *tag_version_names(instance.slug, instance.name), *(f'post:{pk}' for pk in post_ids))
+	elif action == 'post_clear':
+		caching.bump('posts', f'post:{instance.pk}', *getattr(instance, '_cleared_tag_keys', ()))
+	else:
+		caching.bump('posts', f'post:{instance.pk}', *_tag_keys(pk_set, using))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def remember_cleared_post_tags(sender, instance, action, reverse, using=None, **kwargs):
+	if action == 'pre_clear' and not reverse:
+		instance._cleared_tag_keys = _tag_keys(instance.tags.values_list('pk', flat=True), using)
+
+
+@receiver(pre_save, sender=Tag)
+def remember_previous_tag_name(sender, instance, raw=False, using=None, **kwargs):
+	if instance.pk and not raw:
+		instance._previous_name = Tag.objects.using(using).filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_saved_tag(sender, instance, created, raw=False, using=None, **kwargs):
+	if created or raw:
+		# A new tag has no posts yet, so no cached page can show it.
+		return
+	previous = getattr(instance, '_previous_name', None) or instance.name
+	caching.bump(
+		'posts',
+		'tags',
+		*tag_version_names(instance.slug, instance.name),
+		*tag_version_names(instance.slug, previous),
+		*(f'post:{pk}' for pk in instance.posts.using(using).values_list('pk', flat=True)),
+	)
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_tag(sender, instance, **kwargs):
+	post_ids = getattr(instance, '_deleted_post_ids', ())
+	caching.bump('posts', 'tags', *tag_version_names(instance.slug, instance.name), *(f'post:{pk}' for pk in post_ids))
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_username(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+	# Logins save only ``last_login``; skip the lookup for those.
+	if instance.pk and not raw and (update_fields is None or 'username' in update_fields):
+		instance._previous_username = (
+			User.objects.using(using).filter(pk=instance.pk).values_list('username', flat=True).first()
+		)
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_author(sender, instance, created, raw=False, using=None, **kwargs):
+	previous = getattr(instance, '_previous_username', None)
+	if created or raw or previous is None or previous == instance.username:
+		return
+	instance._previous_username = instance.username
+	# Bylines appear on the author's posts and in every thread they commented in.
+	posts = Post.objects.using(using).filter(author=instance).values_list('pk', flat=True)
+	threads = Comment.objects.using(using).filter(author=instance).values_list('post_id', flat=True).distinct()
+	caching.bump('posts', *(f'post:{pk}' for pk in posts), *(f'comments:{pk}' for pk in threads))
+
+
+# View counts: write the buffered views once the response is out.
+
+@receiver(request_finished)
+def flush_view_counts(sender, **kwargs):
+	if post_stats.flush_due():
+		post_stats.flush()
+
+
+# Search suggestions: log changes for every process's prefix index.
+
+@receiver(post_save, sender=Post)
+def suggest_saved_post(sender, instance, raw=False, update_fields=None, using='default', **kwargs):
+	if not raw and (update_fields is None or 'title' in update_fields):
+		suggest.post_saved(instance, using)
+
+
+@receiver(post_delete, sender=Post)
+def suggest_deleted_post(sender, instance, using='default', **kwargs):
+	suggest.post_deleted(instance.pk, using)
+
+
+@receiver(post_save, sender=Tag)
+def suggest_saved_tag(sender, instance, raw=False, using='default', **kwargs):
+	if not raw:
+		suggest.tag_saved(instance, using)
+
+
+@receiver(post_delete, sender=Tag)
+def suggest_deleted_tag(sender, instance, using='default', **kwargs):
+	suggest.tag_deleted(instance.pk, using)
@@ -0,0 +1,76 @@
+// Lazy-load comment replies from the JSON endpoint (see blog/views.py: comment_replies).
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('[data-replies-url] button');
+  if (!button) {
+    return;
+  }
+  var container = button.parentElement;
+  var url = container.dataset.next || container.dataset.repliesUrl;
+  button.disabled = true;
+
+  fetch(url, { headers: { Accept: 'application/json' } })
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      var list = container.querySelector('ul') || container.insertBefore(document.createElement('ul'), button);
+      data.results.forEach(function (reply) {
+        var item = document.createElement('li');
+        item.style.marginLeft = (reply.depth - 1) * 1.5 + 'em';
+        var body = document.createElement('p');
+        body.textContent = reply.content;
+        var meta = document.createElement('small');
+        meta.textContent = 'By ' + reply.author + ' on ' + new Date(reply.created_at).toLocaleString();
+        item.appendChild(body);
+        item.appendChild(meta);
+        list.appendChild(item);
+      });
+      if (data.next) {
+        container.dataset.next = container.dataset.repliesUrl + '?cursor=' + encodeURIComponent(data.next);
+        button.textContent = 'Show more replies';
+        button.disabled = false;
+      } else {
+        button.remove();
+      }
+    })
+    .catch(function () {
+      button.disabled = false;
+    });
+});
+
+// Search-as-you-type suggestions from the JSON endpoint (see blog/views.py: post_suggestions).
+document.querySelectorAll('input[data-suggest-url]').forEach(function (input) {
+  var list = document.getElementById(input.dataset.suggestList);
+  var timer = null;
+  var latest = 0;
+
+  function show(label, url) {
+    var item = document.createElement('li');
+    var link = document.createElement('a');
+    link.href = url;
+    link.textContent = label;
+    item.appendChild(link);
+    list.appendChild(item);
+  }
+
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var query = input.value.trim();
+      var request = ++latest;
+      if (!query) {
+        list.replaceChildren();
+        return;
+      }
+      fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(query), { headers: { Accept: 'application/json' } })
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          // Answers can arrive out of order; only the newest keystroke's is shown.
+          if (request !== latest) {
+            return;
+          }
+          list.replaceChildren();
+          data.tags.forEach(function (tag) { show('Tag: ' + tag.name, tag.url); });
+          data.posts.forEach(function (post) { show(post.title, post.url); });
+        });
+    }, 100);
+  });
+});
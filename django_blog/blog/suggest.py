@@ -0,0 +1,431 @@
+"""
+Search-as-you-type suggestions from an in-memory prefix index.
+
+``SuggestionIndex`` holds post titles and tag names. Each word start in a
+text (up to ``WORDS_PER_TEXT`` of them) is one entry: a 64-bit integer packing
+the text's slot and the word's offset, kept in an ``array`` sorted by the
+lower-cased text from that offset on. A lookup is a ``bisect`` over that
+order plus a short forward scan, so "dja" finds "Django" and "Getting started
+with Django" alike. The entries cost 8 bytes each, on top of one string per
+text. Changes are buffered in a short sorted list and merged into the array
+in batches, so saving a post never shifts millions of entries.
+
+Memory is bounded by ``BLOG_SUGGEST_MAX_POSTS`` (default 200,000): the index
+keeps the posts with the highest ids and drops the lowest as new ones arrive.
+Tags are always indexed.
+
+Each process builds its index once, before serving requests: ``warm_up()`` is
+called from ``django_blog/wsgi.py`` and ``asgi.py``. Elsewhere (tests, shells)
+the first lookup builds it in a background thread and returns nothing until
+it is ready. After that the index is only updated, never rebuilt: post and
+tag changes are appended to a change log in the cache when their transaction
+commits, and each process replays the entries it has not seen at most every
+``BLOG_SUGGEST_SYNC_SECONDS``. It rebuilds only if entries it needs have
+expired from the cache, or every ``BLOG_SUGGEST_REFRESH_SECONDS`` if that is
+set (to pick up bulk imports, which send no signals).
+"""
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from heapq import heappop, heappush, merge as merge_sorted
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from . import caching
+from .models import Post, Tag
+
+# Entries pack ``slot * OFFSETS + offset``; titles are at most 200 characters.
+OFFSETS = 256
+WORDS_PER_TEXT = 8
+# Pending and removed entries that trigger a merge into the main array.
+MERGE_THRESHOLD = 2048
+# Entries examined per lookup, so a one-letter prefix stays as cheap as a long one.
+SCAN_LIMIT = 200
+WORD_RE = re.compile(r'\w+')
+# The change log: a counter, and one cache entry per change numbered by it.
+CHANGE_COUNTER = 'blog:suggest:changes'
+CHANGE_PREFIX = 'blog:suggest:change:'
+CHANGE_LOG_SECONDS = 24 * 60 * 60
+# A process further behind than this rebuilds rather than replaying the log.
+MAX_REPLAY = 10_000
+# How long a logged change may stay unreadable (its writer is between the
+# counter and the entry) before it counts as lost.
+MISSING_CHANGE_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+
+def max_posts():
+	return getattr(settings, 'BLOG_SUGGEST_MAX_POSTS', 200_000)
+
+
+def normalize(text):
+	return ' '.join(text.split())
+
+
+def word_starts(text):
+	return [match.start() for match in WORD_RE.finditer(text)][:WORDS_PER_TEXT]
+
+
+class SuggestionIndex:
+	"""
+	Each indexed text has a *slot*: its position in ``texts`` and ``idents``.
+	Entries pack ``slot * OFFSETS + offset``. ``idents`` holds post ids as
+	themselves, tag ids negated, and 0 for a text that has been removed.
+
+	Changes never shift the main ``entries`` array. New entries go to the
+	small sorted ``pending`` list, and a removed text's entries stay where
+	they are, skipped by lookups, with its string kept so they still sort.
+	Once ``MERGE_THRESHOLD`` entries are pending or removed, ``merge()``
+	rewrites the array in one pass. An edit gives the text a new slot.
+
+	Not thread-safe by itself; ``lock`` guards callers.
+	"""
+
+	def __init__(self, posts=(), tags=(), limit=None):
+		self.limit = max_posts() if limit is None else limit
+		self.lock = threading.Lock()
+		posts = sorted(posts)[-self.limit:] if self.limit else []
+		tags = list(tags)
+		self.texts = []
+		self.idents = array('q')
+		self.slots = {}
+		# Indexed post ids, smallest first, to evict the oldest. Ids of posts
+		# removed since are skipped when they come up.
+		self.post_ids = [pk for pk, _ in posts]
+		self.post_count = len(posts)
+		self.slugs = {-pk: slug for pk, _, slug in tags}
+		self.pending = []
+		self.pending_slots = set()
+		self.removed_slots = []
+		self.removed_entries = 0
+		# Sorting every entry at once would hold a key string per entry. Group
+		# the entries by the first two characters of their key instead: groups
+		# in order of those characters are in key order, so each can be sorted
+		# on its own and only one group's keys exist at a time.
+		groups = {}
+		for ident, text in [(pk, title) for pk, title in posts] + [(-pk, name) for pk, name, _ in tags]:
+			text = normalize(text)
+			slot = self._add_slot(ident, text)
+			for offset in word_starts(text):
+				head = text[offset:].lower()[:2]
+				group = groups.get(head)
+				if group is None:
+					group = groups[head] = array('q')
+				group.append(slot * OFFSETS + offset)
+		self.entries = array('q')
+		for head in sorted(groups):
+			self.entries.extend(sorted(groups.pop(head), key=self.key))
+		self.built_at = time.monotonic()
+		# The last change-log entry this index reflects, and when it last looked.
+		self.changes_seen = 0
+		self.synced_at = self.built_at
+		self.missing_since = None
+
+	@classmethod
+	def from_database(cls, using='default'):
+		"""The newest ``BLOG_SUGGEST_MAX_POSTS`` posts and every tag, read in primary-key order."""
+		limit = max_posts()
+		posts = list(Post.objects.using(using).order_by('-pk').values_list('pk', 'title')[:limit])
+		posts.reverse()
+		tags = Tag.objects.using(using).order_by('pk').values_list('pk', 'name', 'slug')
+		return cls(posts, tags, limit)
+
+	def __len__(self):
+		return len(self.entries) + len(self.pending) - self.removed_entries
+
+	def key(self, entry):
+		slot, offset = divmod(entry, OFFSETS)
+		return self.texts[slot][offset:].lower()
+
+	def _add_slot(self, ident, text):
+		slot = len(self.texts)
+		self.texts.append(text)
+		self.idents.append(ident)
+		self.slots[ident] = slot
+		return slot
+
+	def _insert(self, ident, text):
+		slot = self._add_slot(ident, text)
+		for offset in word_starts(text):
+			insort(self.pending, slot * OFFSETS + offset, key=self.key)
+		self.pending_slots.add(slot)
+		self.post_count += ident > 0
+		self._merge_if_due()
+
+	def _remove(self, ident):
+		slot = self.slots.pop(ident, None)
+		if slot is None:
+			return
+		self.idents[slot] = 0
+		self.post_count -= ident > 0
+		if slot in self.pending_slots:
+			for offset in word_starts(self.texts[slot]):
+				entry = slot * OFFSETS + offset
+				i = bisect_left(self.pending, self.key(entry), key=self.key)
+				# Equal keys from other texts may come first.
+				while self.pending[i] != entry:
+					i += 1
+				del self.pending[i]
+			self.pending_slots.discard(slot)
+			self.texts[slot] = None
+		else:
+			self.removed_slots.append(slot)
+			self.removed_entries += len(word_starts(self.texts[slot]))
+			self._merge_if_due()
+
+	def _merge_if_due(self):
+		if len(self.pending) + self.removed_entries >= MERGE_THRESHOLD:
+			self.merge()
+
+	def merge(self):
+		"""Fold ``pending`` into ``entries`` and drop removed texts' entries, copying the array once."""
+		entries = self.entries
+		# (position in entries, 0 to insert before it or 1 to delete it, tie-break, entry)
+		edits = []
+		for slot in self.removed_slots:
+			for offset in word_starts(self.texts[slot]):
+				entry = slot * OFFSETS + offset
+				i = bisect_left(entries, self.key(entry), key=self.key)
+				while entries[i] != entry:
+					i += 1
+				edits.append((i, 1, 0, entry))
+		for n, entry in enumerate(self.pending):
+			edits.append((bisect_left(entries, self.key(entry), key=self.key), 0, n, entry))
+		edits.sort()
+		merged = array('q')
+		start = 0
+		for i, delete, _, entry in edits:
+			merged.extend(entries[start:i])
+			if delete:
+				start = i + 1
+			else:
+				merged.append(entry)
+				start = i
+		merged.extend(entries[start:])
+		self.entries = merged
+		for slot in self.removed_slots:
+			self.texts[slot] = None
+		self.pending = []
+		self.pending_slots = set()
+		self.removed_slots = []
+		self.removed_entries = 0
+		if len(self.post_ids) > 2 * self.post_count:
+			self.post_ids = sorted(ident for ident in self.slots if ident > 0)
+
+	def set_post(self, pk, title):
+		known = pk in self.slots
+		self._remove(pk)
+		if not self.limit:
+			return
+		self._insert(pk, normalize(title))
+		if not known:
+			heappush(self.post_ids, pk)
+		while self.post_count > self.limit:
+			oldest = heappop(self.post_ids)
+			self._remove(oldest)
+
+	def remove_post(self, pk):
+		self._remove(pk)
+
+	def set_tag(self, pk, name, slug):
+		self._remove(-pk)
+		self._insert(-pk, normalize(name))
+		self.slugs[-pk] = slug
+
+	def remove_tag(self, pk):
+		self._remove(-pk)
+		self.slugs.pop(-pk, None)
+
+	def apply(self, change):
+		"""Apply a change-log entry such as ``('set_post', pk, title)``."""
+		method, *args = change
+		getattr(self, method)(*args)
+
+	def _matches(self, entries, prefix):
+		i = bisect_left(entries, prefix, key=self.key)
+		for entry in entries[i:i + SCAN_LIMIT]:
+			if not self.key(entry).startswith(prefix):
+				return
+			yield entry
+
+	def suggest(self, query, limit=8):
+		"""``(tags, posts)``: up to ``limit`` ``(slug, name)`` and ``(pk, title)`` pairs with a word starting with ``query``."""
+		prefix = normalize(query).lower()
+		tags, posts, seen = [], [], set()
+		if not prefix:
+			return tags, posts
+		matches = merge_sorted(self._matches(self.entries, prefix), self._matches(self.pending, prefix), key=self.key)
+		for entry in matches:
+			slot = entry // OFFSETS
+			ident = self.idents[slot]
+			if not ident or ident in seen:
+				continue
+			seen.add(ident)
+			if ident < 0 and len(tags) < limit:
+				tags.append((self.slugs[ident], self.texts[slot]))
+			elif ident > 0 and len(posts) < limit:
+				posts.append((ident, self.texts[slot]))
+			if len(tags) == len(posts) == limit:
+				break
+		return tags, posts
+
+
+_index = None
+_lock = threading.Lock()
+_rebuilding = False
+
+
+def refresh_seconds():
+	return getattr(settings, 'BLOG_SUGGEST_REFRESH_SECONDS', None)
+
+
+def sync_seconds():
+	return getattr(settings, 'BLOG_SUGGEST_SYNC_SECONDS', 5)
+
+
+def get_index():
+	"""
+	This process's index, or ``None`` until its first build has finished.
+	Starts a build in a background thread when there is none (or, with
+	``BLOG_SUGGEST_REFRESH_SECONDS``, when it is stale), and replays the
+	change log when ``BLOG_SUGGEST_SYNC_SECONDS`` have passed.
+	"""
+	index = _index
+	if index is None:
+		_start_rebuild()
+		return None
+	now = time.monotonic()
+	refresh = refresh_seconds()
+	if refresh is not None and now - index.built_at >= refresh:
+		_start_rebuild()
+	if now - index.synced_at >= sync_seconds():
+		_sync(index)
+	return index
+
+
+def warm_up():
+	"""Build this process's index before it serves requests."""
+	try:
+		build()
+	except DatabaseError:
+		logger.exception('Search suggestion index not built; the first lookup will retry')
+
+
+def build():
+	"""Build the index in this thread and make it current."""
+	global _index
+	# Read the log position first: changes committed while the posts are read
+	# are replayed on top, which is harmless for ones the build already saw.
+	changes_seen = _last_change()
+	index = SuggestionIndex.from_database()
+	index.changes_seen = changes_seen
+	with _lock:
+		_index = index
+	_sync(index)
+	return index
+
+
+def _start_rebuild():
+	global _rebuilding
+	with _lock:
+		if _rebuilding:
+			return
+		_rebuilding = True
+	threading.Thread(target=_rebuild, name='blog-suggest', daemon=True).start()
+
+
+def _rebuild():
+	global _rebuilding
+	try:
+		build()
+	finally:
+		_rebuilding = False
+		connections.close_all()
+
+
+def _last_change():
+	return caching.get_cache().get(CHANGE_COUNTER, 0)
+
+
+def _log_change(change):
+	cache = caching.get_cache()
+	try:
+		number = cache.incr(CHANGE_COUNTER)
+	except ValueError:
+		# If add() loses a race, the counter exists now.
+		number = 1 if cache.add(CHANGE_COUNTER, 1, timeout=None) else cache.incr(CHANGE_COUNTER)
+	cache.set(CHANGE_PREFIX + str(number), change, timeout=CHANGE_LOG_SECONDS)
+
+
+def _sync(index):
+	"""Replay the change-log entries ``index`` has not seen, in order."""
+	with index.lock:
+		now = time.monotonic()
+		index.synced_at = now
+		last = _last_change()
+		if last <= index.changes_seen:
+			return
+		if last - index.changes_seen > MAX_REPLAY:
+			_start_rebuild()
+			return
+		numbers = range(index.changes_seen + 1, last + 1)
+		stored = caching.get_cache().get_many([CHANGE_PREFIX + str(number) for number in numbers])
+		for number in numbers:
+			change = stored.get(CHANGE_PREFIX + str(number))
+			if change is None:
+				if index.missing_since is None:
+					index.missing_since = now
+				elif now - index.missing_since >= MISSING_CHANGE_SECONDS:
+					# Evicted or never written: only a rebuild can catch up.
+					_start_rebuild()
+				return
+			index.apply(change)
+			index.changes_seen = number
+			index.missing_since = None
+
+
+def suggest(query, limit=8):
+	index = get_index()
+	if index is None:
+		return [], []
+	with index.lock:
+		return index.suggest(query, limit)
+
+
+def _record(change, using):
+	def log_and_apply():
+		_log_change(change)
+		# Apply this process's own change at once rather than at the next sync.
+		index = _index
+		if index is not None:
+			_sync(index)
+
+	transaction.on_commit(log_and_apply, using=using)
+
+
+def post_saved(post, using='default'):
+	_record(('set_post', post.pk, post.title), using)
+
+
+def post_deleted(pk, using='default'):
+	_record(('remove_post', pk), using)
+
+
+def tag_saved(tag, using='default'):
+	_record(('set_tag', tag.pk, tag.name, tag.slug), using)
+
+
+def tag_deleted(pk, using='default'):
+	_record(('remove_tag', pk), using)
+
+
+def reset():
+	"""Forget this process's index; the next lookup builds a fresh one."""
+	global _index
+	with _lock:
+		_index = None
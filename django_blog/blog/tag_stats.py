@@ -0,0 +1,65 @@
+"""
+Related tags and the tag cloud.
+
+Both read precomputed data: related tags come from ``TagCooccurrence`` (top-K
+per tag is a single index range on ``(tag, -count)``) and the cloud from
+``Tag.post_count``. Results are memoized per process in an LRU keyed on the
+``tags`` cache version, which ``blog/signals.py`` bumps whenever a post's tags
+change, so every process drops stale entries without coordination.
+"""
+import functools
+import math
+import time
+
+from . import caching
+from .models import Tag, TagCooccurrence
+
+RELATED_TAGS = 10
+CLOUD_SIZE = 50
+CLOUD_LEVELS = 5
+
+
+@functools.lru_cache(maxsize=1024)
+def _related_tags(tag_id, limit, version):
+	rows = TagCooccurrence.objects.related(tag_id, limit).select_related('other')
+	return tuple((row.other, row.count) for row in rows)
+
+
+@functools.lru_cache(maxsize=16)
+def _tag_cloud(limit, version):
+	tags = list(Tag.objects.filter(post_count__gt=0).order_by('-post_count', 'name')[:limit])
+	if not tags:
+		return ()
+	low, high = math.log(tags[-1].post_count), math.log(tags[0].post_count)
+	spread = (high - low) or 1
+	return tuple(
+		(tag, 1 + round((CLOUD_LEVELS - 1) * (math.log(tag.post_count) - low) / spread))
+		for tag in sorted(tags, key=lambda tag: tag.name.lower())
+	)
+
+
+def _version():
+	# A flushed cache restarts the counter, which would revive LRU entries from
+	# before the flush; pairing it with an epoch stored next to it prevents that.
+	cache = caching.get_cache()
+	epoch_key = caching.VERSION_PREFIX + 'tags:epoch'
+	epoch = cache.get(epoch_key)
+	if epoch is None:
+		cache.add(epoch_key, time.time_ns(), timeout=None)
+		epoch = cache.get(epoch_key)
+	return epoch, caching.get_versions('tags')['tags']
+
+
+def related_tags(tag, limit=RELATED_TAGS):
+	"""``[(tag, shared_post_count), ...]`` for the tags most often used with ``tag``."""
+	return list(_related_tags(tag.pk, limit, _version()))
+
+
+def tag_cloud(limit=CLOUD_SIZE):
+	"""The ``limit`` most used tags as ``[(tag, level), ...]`` in name order; ``level`` runs 1..5."""
+	return list(_tag_cloud(limit, _version()))
+
+
+def clear_lru():
+	_related_tags.cache_clear()
+	_tag_cloud.cache_clear()
@@ -1,8 +1,72 @@
+import datetime
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
-from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import api, async_views, bulk, caching, moderation, post_stats, related, rendering, routers, suggest, tag_stats, views
+from .forms import PostForm
+from .models import (
+	Comment,
+	CommentSubmission,
+	ImportCheckpoint,
+	Post,
+	PostArchiveBucket,
+	PostSimilarity,
+	PostSimilarityUpdate,
+	PostStats,
+	Tag,
+	TagCooccurrence,
+	TagQuerySet,
+)
+
+
+# Detail-page hits buffer view counts, and whichever later request finds the
+# buffer due writes it, which would add queries to unrelated query-count tests.
+# ViewCountTests flushes explicitly.
+_no_view_flush = override_settings(BLOG_VIEW_FLUSH_SECONDS=float('inf'))
+
+
+def setUpModule():
+	_no_view_flush.enable()
 
-from .models import Comment, Post, Tag
+
+def tearDownModule():
+	_no_view_flush.disable()
+	post_stats.reset()
+
+
+class QueryCountAssertionsMixin:
+	def assertQueryCountConstant(self, url, add_rows, data=None, rows=3):
+		"""
+		Fail if rendering ``url`` costs more queries after ``add_rows(rows)``
+		adds more rows, i.e. if the view has an N+1 query pattern.
+		"""
+		add_rows(1)
+		with CaptureQueriesContext(connection) as small:
+			self.assertEqual(self.client.get(url, data).status_code, 200)
+		add_rows(rows)
+		with CaptureQueriesContext(connection) as large:
+			self.assertEqual(self.client.get(url, data).status_code, 200)
+		self.assertEqual(
+			len(small), len(large),
+			f'{url} ran {len(small)} queries for 1 row but {len(large)} for {rows + 1} rows:\n'
+			+ '\n'.join(q['sql'] for q in large.captured_queries),
+		)
 
 
 class AuthenticationTests(TestCase):
@@ -180,3 +244,1764 @@ class CommentCrudTests(TestCase):
 		)
 		self.assertEqual(response.status_code, 403)
 		self.assertTrue(Comment.objects.filter(pk=self.comment.pk).exists())
+
+
+class KeysetPaginationTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.posts = [
+			Post.objects.create(title=f'Post {i:02d}', content='Body', author=self.author)
+			for i in range(25)
+		]
+
+	def test_pages_walk_forward_and_back_without_gaps(self):
+		url = reverse('post-list')
+		seen = []
+		cursors = []
+		response = self.client.get(url)
+		while True:
+			page = response.context['page_obj']
+			seen.extend(post.pk for post in page)
+			if not page.has_next():
+				break
+			cursors.append(page.next_cursor)
+			response = self.client.get(url, {'cursor': page.next_cursor})
+
+		expected = sorted((p.pk for p in self.posts), reverse=True)
+		self.assertEqual(seen, expected)
+
+		previous = response.context['page_obj'].previous_cursor
+		response = self.client.get(url, {'cursor': previous})
+		self.assertEqual([p.pk for p in response.context['page_obj']], expected[10:20])
+
+	def test_page_queries_use_no_offset_or_count(self):
+		first = self.client.get(reverse('post-list')).context['page_obj']
+		with CaptureQueriesContext(connection) as ctx:
+			self.client.get(reverse('post-list'), {'cursor': first.next_cursor})
+		sql = ' '.join(q['sql'].upper() for q in ctx.captured_queries)
+		self.assertNotIn('OFFSET', sql)
+		self.assertNotIn('COUNT(', sql)
+
+	def test_malformed_cursor_returns_404(self):
+		response = self.client.get(reverse('post-list'), {'cursor': 'not-a-cursor'})
+		self.assertEqual(response.status_code, 404)
+
+	def test_search_keeps_query_in_page_links(self):
+		response = self.client.get(reverse('post-search'), {'q': 'Post'})
+		self.assertContains(response, 'q=Post&amp;cursor=')
+
+
+class SearchIndexTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+
+	def search(self, query):
+		response = self.client.get(reverse('post-search'), {'q': query})
+		self.assertEqual(response.status_code, 200)
+		return [post.title for post in response.context['posts']]
+
+	def test_title_matches_rank_above_body_matches(self):
+		Post.objects.create(title='Notes', content='Some words about django here', author=self.author)
+		Post.objects.create(title='Django tips', content='Short', author=self.author)
+		self.assertEqual(self.search('django'), ['Django tips', 'Notes'])
+
+	def test_search_matches_stemmed_terms(self):
+		Post.objects.create(title='Running Django', content='Body', author=self.author)
+		self.assertEqual(self.search('runs'), ['Running Django'])
+
+	def test_index_follows_edits_tags_and_deletes(self):
+		post = Post.objects.create(title='Hello', content='World', author=self.author)
+		tag = Tag.objects.create(name='python')
+		post.tags.add(tag)
+		self.assertEqual(self.search('python'), ['Hello'])
+
+		tag.name = 'rust'
+		tag.save()
+		self.assertEqual(self.search('python'), [])
+		self.assertEqual(self.search('rust'), ['Hello'])
+
+		post.title = 'Goodbye'
+		post.save()
+		self.assertEqual(self.search('goodbye'), ['Goodbye'])
+
+		post.delete()
+		self.assertEqual(self.search('goodbye'), [])
+
+	def test_ranked_results_paginate_with_cursors(self):
+		for i in range(15):
+			Post.objects.create(title=f'Django {i}', content='Body', author=self.author)
+		first = self.client.get(reverse('post-search'), {'q': 'django'}).context['page_obj']
+		second = self.client.get(
+			reverse('post-search'), {'q': 'django', 'cursor': first.next_cursor}
+		).context['page_obj']
+		self.assertEqual(len(first) + len(second), 15)
+		self.assertFalse({p.pk for p in first} & {p.pk for p in second})
+		back = self.client.get(
+			reverse('post-search'), {'q': 'django', 'cursor': second.previous_cursor}
+		).context['page_obj']
+		self.assertEqual([p.pk for p in back], [p.pk for p in first])
+
+	def test_fts_syntax_in_query_is_treated_as_text(self):
+		Post.objects.create(title='Quotes', content='Body', author=self.author)
+		self.assertEqual(self.search('"quotes" OR NEAR('), [])
+
+
+class ListingQueryCountTests(QueryCountAssertionsMixin, TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.tag = Tag.objects.create(name='django')
+
+	def add_posts(self, count):
+		for _ in range(count):
+			author = User.objects.create(username=f'user{User.objects.count()}')
+			post = Post.objects.create(title='Django post', content='Body', author=author)
+			post.tags.add(self.tag, Tag.objects.create(name=f'tag{Tag.objects.count()}'))
+
+	def test_post_list_query_count_is_constant(self):
+		self.assertQueryCountConstant(reverse('post-list'), self.add_posts)
+
+	def test_tag_listings_query_count_is_constant(self):
+		self.assertQueryCountConstant(reverse('post-by-tag', kwargs={'tag_slug': 'django'}), self.add_posts)
+		self.assertQueryCountConstant(reverse('tag-posts', kwargs={'tag_name': 'django'}), self.add_posts)
+
+	def test_search_query_count_is_constant(self):
+		self.assertQueryCountConstant(reverse('post-search'), self.add_posts, data={'q': 'django'})
+
+
+class CounterTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.client.login(username='author', password='StrongPass123!@#')
+
+	def test_comment_views_maintain_post_counters(self):
+		post = Post.objects.create(title='Post', content='Body', author=self.author)
+		url = reverse('comment-create', kwargs={'post_id': post.pk})
+		self.client.post(url, {'content': 'One'})
+		self.client.post(url, {'content': 'Two'})
+		post.refresh_from_db()
+		first, second = post.comments.order_by('pk')
+		self.assertEqual(post.comment_count, 2)
+		self.assertEqual(post.last_commented_at, second.created_at)
+
+		self.client.post(reverse('comment-delete', kwargs={'pk': second.pk}))
+		post.refresh_from_db()
+		self.assertEqual(post.comment_count, 1)
+		self.assertEqual(post.last_commented_at, first.created_at)
+
+	def test_post_form_and_delete_maintain_tag_counters(self):
+		self.client.post(reverse('post-create'), {'title': 'A', 'content': 'x', 'tags': 'django, python'})
+		post = Post.objects.get(title='A')
+		self.client.post(reverse('post-update', kwargs={'pk': post.pk}), {'title': 'A', 'content': 'x', 'tags': 'python, web'})
+		counts = dict(Tag.objects.values_list('name', 'post_count'))
+		self.assertEqual(counts, {'django': 0, 'python': 1, 'web': 1})
+
+		self.client.post(reverse('post-delete', kwargs={'pk': post.pk}))
+		self.assertFalse(Tag.objects.filter(post_count__gt=0).exists())
+
+	def test_rebuild_counters_command(self):
+		post = Post.objects.create(title='Post', content='Body', author=self.author)
+		post.tags.add(Tag.objects.create(name='django'))
+		Comment.objects.create(post=post, author=self.author, content='Hi')
+		call_command('rebuild_blog_counters', stdout=StringIO())
+		post.refresh_from_db()
+		self.assertEqual(post.comment_count, 1)
+		self.assertEqual(Tag.objects.get(name='django').post_count, 1)
+
+
+class TagResolutionTests(TestCase):
+	def test_resolve_names_reuses_existing_and_creates_missing_in_bulk(self):
+		existing = Tag.objects.create(name='django')
+		Tag.objects.create(name='Python')  # takes the "python" slug
+		# IN lookup, slug lookup, and one INSERT wrapped in a savepoint.
+		with self.assertNumQueries(5):
+			tags = Tag.objects.resolve_names(['django', ' python ', 'web', 'python', ''])
+		self.assertEqual([t.name for t in tags], ['django', 'python', 'web'])
+		self.assertEqual(tags[0].pk, existing.pk)
+		self.assertEqual([t.slug for t in tags[1:]], ['python-2', 'web'])
+		self.assertTrue(all(t.pk for t in tags))
+
+	def test_post_form_tag_changes_cost_constant_queries(self):
+		author = User.objects.create_user(username='author', password='StrongPass123!@#')
+
+		def save_with_tags(count, prefix):
+			post = Post.objects.create(title='Post', content='Body', author=author)
+			names = ', '.join(f'{prefix}{i}' for i in range(count))
+			form = PostForm({'title': 'Post', 'content': 'Body', 'tags': names}, instance=post)
+			self.assertTrue(form.is_valid())
+			with CaptureQueriesContext(connection) as ctx:
+				form.save()
+			self.assertEqual(post.tags.count(), count)
+			return len(ctx)
+
+		self.assertEqual(save_with_tags(2, 'few'), save_with_tags(20, 'many'))
+		self.assertEqual(set(Tag.objects.values_list('post_count', flat=True)), {1})
+
+	def test_tag_save_allocates_next_suffix_in_one_lookup(self):
+		Tag.objects.bulk_create(
+			[Tag(name='python', slug='python')]
+			+ [Tag(name=f'python {i}', slug=f'python-{i}') for i in range(2, 40)]
+		)
+		tag = Tag(name='Python!')
+		# slug lookup, then INSERT inside a savepoint.
+		with self.assertNumQueries(4):
+			tag.save()
+		self.assertEqual(tag.slug, 'python-40')
+
+	def test_free_slugs_keeps_suffixes_of_numbered_bases_apart(self):
+		Tag.objects.bulk_create([
+			Tag(name='python', slug='python'),
+			Tag(name='python 3', slug='python-3'),
+			Tag(name='Python 3!', slug='python-3-2'),
+		])
+		self.assertEqual(
+			Tag.objects.free_slugs(['python', 'python-3', 'python', 'web']),
+			['python-4', 'python-3-3', 'python-5', 'web'],
+		)
+
+	def test_tag_save_retries_when_slug_is_taken_concurrently(self):
+		Tag.objects.create(name='web')
+		with mock.patch.object(TagQuerySet, 'free_slugs', side_effect=[['web'], ['web-2']]):
+			tag = Tag.objects.create(name='Web')
+		self.assertEqual(tag.slug, 'web-2')
+
+
+class CachingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Cached', content='Body', author=self.author)
+		self.tag = Tag.objects.create(name='django')
+		self.post.tags.add(self.tag)
+
+	def test_anonymous_pages_are_served_from_cache(self):
+		for url in (
+			reverse('post-list'),
+			reverse('post-detail', kwargs={'pk': self.post.pk}),
+			reverse('post-by-tag', kwargs={'tag_slug': 'django'}),
+		):
+			first = self.client.get(url)
+			# Only the ETag/Last-Modified validator query runs; nothing is rendered.
+			with self.assertNumQueries(1):
+				second = self.client.get(url)
+			self.assertEqual(first.content, second.content)
+		self.assertEqual(caching.metrics()['page'], {'hits': 3, 'misses': 3})
+
+	def test_edits_invalidate_affected_pages(self):
+		detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+		tag_page = reverse('post-by-tag', kwargs={'tag_slug': 'django'})
+		self.client.get(reverse('post-list'))
+		self.client.get(detail)
+		self.client.get(tag_page)
+
+		self.post.title = 'Renamed'
+		self.post.save()
+		self.assertContains(self.client.get(reverse('post-list')), 'Renamed')
+		self.assertContains(self.client.get(tag_page), 'Renamed')
+
+		Comment.objects.create(post=self.post, author=self.author, content='Fresh comment')
+		self.assertContains(self.client.get(detail), 'Fresh comment')
+
+		# The slug stays; the page shows the new name, while /tags/django/ no longer matches.
+		self.tag.name = 'web'
+		self.tag.save()
+		self.assertContains(self.client.get(tag_page), 'Posts tagged: web')
+		self.assertContains(self.client.get(reverse('tag-posts', kwargs={'tag_name': 'django'})), 'No posts found for this tag.')
+		self.assertContains(self.client.get(reverse('tag-posts', kwargs={'tag_name': 'web'})), 'Renamed')
+
+	def test_tag_name_pages_use_hashed_version_keys(self):
+		spaced = Tag.objects.create(name='Django ORM')
+		self.post.tags.add(spaced)
+		url = reverse('tag-posts', kwargs={'tag_name': 'django orm'})
+		key = caching.tag_name_version('DJANGO ORM')
+		self.assertEqual(key, caching.tag_name_version('django orm'))
+		self.assertRegex(key, r'^tag-name:[0-9a-f]{32}$')
+		self.assertEqual(len(caching.tag_name_version('x' * 1000)), 41)
+
+		self.assertContains(self.client.get(url), 'Cached')
+		self.post.title = 'Retitled'
+		self.post.save()
+		self.assertContains(self.client.get(url), 'Retitled')
+
+	def test_post_cards_are_reused_across_pages(self):
+		other = Post.objects.create(title='Other', content='Body', author=self.author)
+		self.client.get(reverse('post-list'))
+		other.title = 'Other edited'
+		other.save()
+		self.client.get(reverse('post-list'))
+		# Only the edited post's card is re-rendered.
+		self.assertEqual(caching.metrics()['post_card'], {'hits': 1, 'misses': 3})
+
+	def test_logged_in_users_bypass_page_cache(self):
+		self.client.login(username='author', password='StrongPass123!@#')
+		self.client.get(reverse('post-list'))
+		self.assertEqual(caching.metrics()['page'], {'hits': 0, 'misses': 0})
+
+
+class ThreadedCommentTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Post', content='Body', author=self.author)
+
+	def comment(self, content, parent=None):
+		return Comment.objects.create(post=self.post, author=self.author, content=content, parent=parent)
+
+	def test_subtree_is_one_range_query_in_thread_order(self):
+		root = self.comment('root')
+		other = self.comment('other root')
+		a = self.comment('a', root)
+		b = self.comment('b', root)
+		a1 = self.comment('a1', a)
+		self.comment('other reply', other)
+
+		with self.assertNumQueries(1):
+			subtree = list(Comment.objects.subtree(root))
+		self.assertEqual(subtree, [a, a1, b])
+		self.assertEqual([c.depth for c in subtree], [1, 2, 1])
+
+	def test_reply_via_create_view_and_delete_cascades_counters(self):
+		root = self.comment('root')
+		self.post.record_comment_added(root)
+		self.client.login(username='author', password='StrongPass123!@#')
+		url = reverse('comment-create', kwargs={'post_id': self.post.pk})
+		self.client.post(url, {'content': 'reply', 'parent': root.pk})
+		reply = Comment.objects.get(content='reply')
+		self.assertEqual(reply.parent, root)
+		self.assertTrue(reply.path.startswith(root.path))
+
+		self.client.post(reverse('comment-delete', kwargs={'pk': root.pk}))
+		self.post.refresh_from_db()
+		self.assertEqual(self.post.comment_count, 0)
+		self.assertFalse(Comment.objects.exists())
+
+	def test_reply_to_comment_on_another_post_is_rejected(self):
+		other_post = Post.objects.create(title='Other', content='Body', author=self.author)
+		foreign = Comment.objects.create(post=other_post, author=self.author, content='x')
+		self.client.login(username='author', password='StrongPass123!@#')
+		url = reverse('comment-create', kwargs={'post_id': self.post.pk})
+		response = self.client.post(url, {'content': 'reply', 'parent': foreign.pk})
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse(Comment.objects.filter(content='reply').exists())
+
+	def test_detail_page_shows_first_page_of_threads(self):
+		for i in range(25):
+			self.comment(f'thread {i:02d}')
+		response = self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+		self.assertContains(response, 'thread 19')
+		self.assertNotContains(response, 'thread 20')
+		self.assertContains(response, 'More comments')
+
+	def test_json_endpoints_page_threads_and_replies(self):
+		root = self.comment('root')
+		for i in range(3):
+			self.comment(f'reply {i}', self.comment(f'child {i}', root))
+
+		threads = self.client.get(reverse('comment-threads', kwargs={'pk': self.post.pk})).json()
+		self.assertEqual(threads['results'][0]['reply_count'], 3)
+
+		replies = self.client.get(reverse('comment-replies', kwargs={'pk': root.pk})).json()
+		self.assertEqual(
+			[(r['content'], r['depth']) for r in replies['results']],
+			[('child 0', 1), ('reply 0', 2), ('child 1', 1), ('reply 1', 2), ('child 2', 1), ('reply 2', 2)],
+		)
+		self.assertIsNone(replies['next'])
+
+
+class ConditionalGetTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Post', content='Body', author=self.author)
+
+	def test_matching_etag_returns_304_without_rendering(self):
+		for url in (reverse('post-list'), reverse('post-detail', kwargs={'pk': self.post.pk})):
+			etag = self.client.get(url)['ETag']
+			with self.assertNumQueries(1), self.assertTemplateNotUsed('blog/base.html'):
+				response = self.client.get(url, headers={'if-none-match': etag})
+			self.assertEqual(response.status_code, 304)
+
+	def test_if_modified_since_returns_304(self):
+		url = reverse('post-detail', kwargs={'pk': self.post.pk})
+		last_modified = self.client.get(url)['Last-Modified']
+		response = self.client.get(url, headers={'if-modified-since': last_modified})
+		self.assertEqual(response.status_code, 304)
+
+	def test_etag_changes_when_post_or_comments_change(self):
+		detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+		listing = reverse('post-list')
+		detail_etag = self.client.get(detail)['ETag']
+		list_etag = self.client.get(listing)['ETag']
+
+		comment = Comment.objects.create(post=self.post, author=self.author, content='Hi')
+		self.post.record_comment_added(comment)
+		self.assertEqual(self.client.get(detail, headers={'if-none-match': detail_etag}).status_code, 200)
+
+		detail_etag = self.client.get(detail)['ETag']
+		comment.delete()
+		self.post.record_comment_removed()
+		self.assertEqual(self.client.get(detail, headers={'if-none-match': detail_etag}).status_code, 200)
+
+		self.post.title = 'Edited'
+		self.post.save()
+		self.assertEqual(self.client.get(listing, headers={'if-none-match': list_etag}).status_code, 200)
+
+	def test_etag_follows_tag_author_and_sidebar_changes(self):
+		tag = Tag.objects.create(name='django')
+		self.post.set_tags([tag])
+		detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+		tag_page = reverse('post-by-tag', kwargs={'tag_slug': tag.slug})
+
+		def changed(url, change):
+			first = self.client.get(url)
+			change()
+			stale_etag = self.client.get(url, headers={'if-none-match': first['ETag']})
+			stale_date = self.client.get(url, headers={'if-modified-since': first['Last-Modified']})
+			return stale_etag.status_code == stale_date.status_code == 200
+
+		def rename_tag():
+			tag.name = 'python'
+			tag.save()
+
+		def rename_author():
+			self.author.username = 'writer'
+			self.author.save()
+
+		def add_tagged_post():
+			Post.objects.create(title='Another', content='Body', author=self.author).set_tags([tag])
+
+		# Space the bumps out so Last-Modified moves past the first response's second.
+		with mock.patch.object(caching, 'time') as clock:
+			clock.time.side_effect = itertools.count(2_000_000_000, 10)
+			self.assertTrue(changed(tag_page, add_tagged_post))
+			self.assertTrue(changed(detail, rename_tag))
+			self.assertTrue(changed(detail, rename_author))
+		self.assertContains(self.client.get(detail), 'python')
+
+	def test_related_post_titles_invalidate_their_listers(self):
+		other = Post.objects.create(title='Neighbour', content='Body', author=self.author)
+		PostSimilarity.objects.create(post=self.post, other=other, rank=1, score=0.5)
+		detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+		etag = self.client.get(detail)['ETag']
+		other.title = 'Renamed neighbour'
+		other.save()
+		response = self.client.get(detail, headers={'if-none-match': etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'Renamed neighbour')
+
+	def test_evicted_bump_time_drops_last_modified(self):
+		url = reverse('post-list')
+		self.post.save()
+		cache.delete(caching.BUMPED_PREFIX + 'posts')
+		response = self.client.get(url)
+		self.assertIn('ETag', response)
+		self.assertNotIn('Last-Modified', response)
+
+	def test_etag_differs_for_logged_in_viewer(self):
+		url = reverse('post-list')
+		anonymous = self.client.get(url)['ETag']
+		self.client.login(username='author', password='StrongPass123!@#')
+		self.assertNotEqual(self.client.get(url)['ETag'], anonymous)
+
+
+class FeedTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.other = User.objects.create_user(username='other', password='StrongPass123!@#')
+		self.tag = Tag.objects.create(name='Django')
+		for i in range(3):
+			post = Post.objects.create(title=f'Post {i} & more', content='<b>Body</b>', author=self.author)
+			post.set_tags([self.tag])
+		Post.objects.create(title='Elsewhere', content='Other', author=self.other)
+
+	def content(self, response):
+		return b''.join(response.streaming_content).decode()
+
+	def test_formats_are_streamed_and_escaped(self):
+		atom = self.client.get(reverse('post-feed', kwargs={'fmt': 'atom'}))
+		self.assertTrue(atom.streaming)
+		self.assertEqual(atom['Content-Type'], 'application/atom+xml; charset=utf-8')
+		body = self.content(atom)
+		self.assertEqual(body.count('<entry>'), 4)
+		self.assertIn('Post 2 &amp; more', body)
+		self.assertIn('&lt;b&gt;Body&lt;/b&gt;', body)
+
+		rss = self.content(self.client.get(reverse('post-feed', kwargs={'fmt': 'rss'})))
+		self.assertEqual(rss.count('<item>'), 4)
+
+		feed = json.loads(self.content(self.client.get(reverse('post-feed', kwargs={'fmt': 'json'}))))
+		self.assertEqual([item['title'] for item in feed['items']][0], 'Elsewhere')
+		self.assertEqual(feed['items'][1]['tags'], ['Django'])
+
+	def test_tag_and_author_feeds_are_scoped(self):
+		tagged = json.loads(self.content(self.client.get(
+			reverse('tag-feed', kwargs={'tag_slug': self.tag.slug, 'fmt': 'json'})
+		)))
+		self.assertEqual(len(tagged['items']), 3)
+		by_author = json.loads(self.content(self.client.get(
+			reverse('author-feed', kwargs={'username': 'other', 'fmt': 'json'})
+		)))
+		self.assertEqual([item['title'] for item in by_author['items']], ['Elsewhere'])
+		self.assertEqual(self.client.get(reverse('post-feed', kwargs={'fmt': 'xml'})).status_code, 404)
+		self.assertEqual(
+			self.client.get(reverse('author-feed', kwargs={'username': 'nobody', 'fmt': 'rss'})).status_code, 404
+		)
+
+	@override_settings(BLOG_FEED_ENTRIES=2)
+	def test_entry_limit_and_archive(self):
+		url = reverse('post-feed', kwargs={'fmt': 'json'})
+		self.assertEqual(len(json.loads(self.content(self.client.get(url)))['items']), 2)
+		self.assertEqual(len(json.loads(self.content(self.client.get(url, {'archive': 1})))['items']), 4)
+
+	def test_conditional_get_and_cached_entries(self):
+		url = reverse('post-feed', kwargs={'fmt': 'atom'})
+		first = self.client.get(url)
+		self.content(first)
+		self.assertEqual(self.client.get(url, headers={'if-none-match': first['ETag']}).status_code, 304)
+
+		self.content(self.client.get(url))
+		self.assertEqual(caching.metrics()['feed_entry']['hits'], 4)
+
+		self.tag.name = 'Python'
+		self.tag.save()
+		response = self.client.get(url, headers={'if-none-match': first['ETag']})
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('term="Python"', self.content(response))
+
+
+@skipIf(settings.DATABASES['replica'].get('TEST', {}).get('MIRROR'), 'replica mirrors default under test')
+@override_settings(BLOG_REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+	databases = {'default', 'replica'}
+
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.primary_post = Post.objects.create(title='On primary', content='Body', author=self.author)
+		# The replica is a separate SQLite file; rows only written there prove where a read went.
+		replica_author = User.objects.db_manager('replica').create_user(username='lagging', password='StrongPass123!@#')
+		self.replica_post = Post.objects.using('replica').create(title='On replica', content='Body', author=replica_author)
+
+	def test_listing_detail_and_search_read_from_replica(self):
+		response = self.client.get(reverse('post-list'))
+		self.assertContains(response, 'On replica')
+		self.assertNotContains(response, 'On primary')
+		detail = self.client.get(reverse('post-detail', kwargs={'pk': self.replica_post.pk}))
+		self.assertContains(detail, 'On replica')
+		self.assertContains(self.client.get(reverse('post-search'), {'q': 'replica'}), 'On replica')
+
+	def test_writes_go_to_primary_and_pin_the_session(self):
+		self.client.force_login(self.author)
+		response = self.client.post(
+			reverse('post-create'), {'title': 'Fresh', 'content': 'Body', 'tags': ''}
+		)
+		self.assertEqual(response.status_code, 302)
+		self.assertTrue(Post.objects.using('default').filter(title='Fresh').exists())
+		self.assertFalse(Post.objects.using('replica').filter(title='Fresh').exists())
+
+		# Pinned: the author sees their new post even though the replica lacks it.
+		self.assertContains(self.client.get(reverse('post-list')), 'Fresh')
+
+		session = self.client.session
+		session[routers.PIN_SESSION_KEY] = 0
+		session.save()
+		self.assertNotContains(self.client.get(reverse('post-list')), 'Fresh')
+
+	@override_settings(BLOG_REPLICA_DATABASES=[])
+	def test_without_replicas_everything_reads_primary(self):
+		self.assertContains(self.client.get(reverse('post-list')), 'On primary')
+
+
+class AsyncReadViewTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.tag = Tag.objects.create(name='Django')
+		for i in range(12):
+			post = Post.objects.create(title=f'Async post {i}', content='Body text', author=self.author)
+			post.set_tags([self.tag])
+		self.post = post
+		comment = Comment.objects.create(post=post, author=self.author, content='First!')
+		post.record_comment_added(comment)
+
+	async def test_listings_match_sync_views(self):
+		for sync_name, async_name, kwargs in [
+			('post-list', 'async-post-list', {}),
+			('tag-posts', 'async-tag-posts', {'tag_name': 'django'}),
+		]:
+			sync_response = await self.async_client.get(reverse(sync_name, kwargs=kwargs))
+			async_response = await self.async_client.get(reverse(async_name, kwargs=kwargs))
+			self.assertEqual(async_response.status_code, 200)
+			for i in range(2, 12):
+				self.assertEqual(
+					f'Async post {i}' in async_response.content.decode(),
+					f'Async post {i}' in sync_response.content.decode(),
+				)
+
+		page = await self.async_client.get(reverse('async-post-list'))
+		self.assertContains(page, 'Async post 11')
+		self.assertNotContains(page, 'Async post 1<')
+		self.assertContains(page, '?cursor=')
+
+	async def test_tag_slug_route_reaches_the_slug_view(self):
+		tag = await Tag.objects.acreate(name='Async Views')
+		url = reverse('async-post-by-tag', kwargs={'tag_slug': tag.slug})
+		self.assertEqual(resolve(url).func.view_class, async_views.AsyncPostByTagListView)
+		response = await self.async_client.get(url)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context['tag'], tag)
+
+	async def test_search_and_detail(self):
+		search = await self.async_client.get(reverse('async-post-search'), {'q': 'async'})
+		self.assertContains(search, 'Async post 0')
+
+		detail = await self.async_client.get(reverse('async-post-detail', kwargs={'pk': self.post.pk}))
+		self.assertContains(detail, 'First!')
+		missing = await self.async_client.get(reverse('async-post-detail', kwargs={'pk': 999999}))
+		self.assertEqual(missing.status_code, 404)
+
+		await self.async_client.aforce_login(self.author)
+		detail = await self.async_client.get(reverse('async-post-detail', kwargs={'pk': self.post.pk}))
+		self.assertContains(detail, 'First!')
+		self.assertContains(detail, 'Edit')
+
+	async def test_conditional_get_and_page_cache(self):
+		url = reverse('async-post-detail', kwargs={'pk': self.post.pk})
+		first = await self.async_client.get(url)
+		not_modified = await self.async_client.get(url, headers={'if-none-match': first['ETag']})
+		self.assertEqual(not_modified.status_code, 304)
+		await self.async_client.get(url)
+		self.assertGreaterEqual(caching.metrics()['page']['hits'], 1)
+
+
+class QueryPlanTests(TestCase):
+	"""
+	EXPLAIN every SELECT the public read views run and fail on a full table scan
+	or an explicit sort. Search is left out: ranking sorts by a computed score.
+	"""
+
+	SQLITE_SORT = re.compile(r'USE TEMP B-TREE')
+	POSTGRES_BAD = re.compile(r'Seq Scan|\bSort\b')
+
+	@classmethod
+	def setUpTestData(cls):
+		author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		tag = Tag.objects.create(name='Django')
+		for i in range(15):
+			post = Post.objects.create(title=f'Post {i}', content='Body', author=author)
+			post.set_tags([tag])
+		root = Comment.objects.create(post=post, author=author, content='Root')
+		Comment.objects.create(post=post, author=author, content='Reply', parent=root)
+		cls.post, cls.root, cls.tag = post, root, tag
+
+	def setUp(self):
+		cache.clear()
+
+	def urls(self):
+		second_page = self.client.get(reverse('post-list')).context['page_obj'].next_cursor
+		return [
+			reverse('post-list'),
+			reverse('post-list') + f'?cursor={second_page}',
+			reverse('post-detail', kwargs={'pk': self.post.pk}),
+			reverse('tag-posts', kwargs={'tag_name': 'django'}),
+			reverse('author-posts', kwargs={'username': 'author'}),
+			reverse('post-archive-month', kwargs={'year': self.post.published_date.year, 'month': self.post.published_date.month}),
+			reverse('comment-threads', kwargs={'pk': self.post.pk}),
+			reverse('comment-replies', kwargs={'pk': self.root.pk}),
+			reverse('tag-feed', kwargs={'tag_slug': self.tag.slug, 'fmt': 'json'}),
+			reverse('author-feed', kwargs={'username': 'author', 'fmt': 'json'}),
+		]
+
+	def captured_selects(self, url):
+		cache.clear()
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+			if response.streaming:
+				b''.join(response.streaming_content)
+		self.assertEqual(response.status_code, 200, url)
+		return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+
+	def sqlite_problems(self, sql):
+		with connection.cursor() as cursor:
+			cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+			details = [row[-1] for row in cursor.fetchall()]
+		# Scans of a subquery's own result rows are fine; scans of tables are not.
+		coroutines = {d.split()[-1] for d in details if d.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+		problems = [d for d in details if self.SQLITE_SORT.search(d)]
+		for detail in details:
+			match = re.match(r'SCAN (\S+)', detail)
+			if match and 'USING' not in detail and match.group(1) not in coroutines | {'CONSTANT'}:
+				problems.append(detail)
+		return problems
+
+	def postgres_problems(self, sql):
+		with connection.cursor() as cursor:
+			# Tiny test tables make a seq scan cheapest; disabling it checks that an index path exists.
+			cursor.execute('SET LOCAL enable_seqscan = off')
+			cursor.execute('SET LOCAL enable_sort = off')
+			cursor.execute('EXPLAIN ' + sql)
+			return [row[0] for row in cursor.fetchall() if self.POSTGRES_BAD.search(row[0])]
+
+	def assertIndexedPlans(self, problems_for):
+		for url in self.urls():
+			for sql in self.captured_selects(url):
+				with self.subTest(url=url, sql=sql[:120]):
+					self.assertEqual(problems_for(sql), [])
+
+	@skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+	def test_sqlite_plans_use_indexes(self):
+		self.assertIndexedPlans(self.sqlite_problems)
+
+	@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+	def test_postgres_plans_use_indexes(self):
+		self.assertIndexedPlans(self.postgres_problems)
+
+	def test_tag_name_lookup_is_case_insensitive(self):
+		self.assertEqual(list(Tag.objects.named('DJANGO')), [self.tag])
+		self.assertEqual(Post.objects.tagged(Tag.objects.named('django')).count(), 15)
+
+
+class ArchiveTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.other = User.objects.create_user(username='other', password='StrongPass123!@#')
+		self.march = [self.create_post(self.author, 2024, 3, i) for i in range(3)]
+		self.april = self.create_post(self.author, 2024, 4, 0)
+		self.other_march = self.create_post(self.other, 2024, 3, 9)
+
+	def create_post(self, author, year, month, day_offset):
+		post = Post.objects.create(title=f'{author.username} {year}-{month} #{day_offset}', content='Body', author=author)
+		published = timezone.make_aware(datetime.datetime(year, month, 1 + day_offset, 12))
+		# published_date is auto_now_add; move the post through save() so the buckets follow.
+		post = Post.objects.get(pk=post.pk)
+		post.published_date = published
+		post.save()
+		return post
+
+	def buckets(self):
+		return {
+			(b.author.username, b.year, b.month): (b.post_count, b.latest_post_id)
+			for b in PostArchiveBucket.objects.select_related('author')
+		}
+
+	def test_buckets_follow_saves_moves_and_deletes(self):
+		self.assertEqual(self.buckets(), {
+			('author', 2024, 3): (3, self.march[-1].pk),
+			('author', 2024, 4): (1, self.april.pk),
+			('other', 2024, 3): (1, self.other_march.pk),
+		})
+
+		# The highest id but not the newest: the bucket keeps pointing at the newest post.
+		backdated = self.create_post(self.author, 2024, 3, 0)
+		self.assertEqual(self.buckets()[('author', 2024, 3)], (4, self.march[-1].pk))
+		backdated.delete()
+
+		self.march[-1].delete()
+		self.assertEqual(self.buckets()[('author', 2024, 3)], (2, self.march[1].pk))
+		self.april.delete()
+		self.assertNotIn(('author', 2024, 4), self.buckets())
+
+		expected = self.buckets()
+		PostArchiveBucket.objects.all().delete()
+		call_command('rebuild_post_archive', stdout=StringIO())
+		self.assertEqual(self.buckets(), expected)
+
+	def test_author_page_lists_posts_and_monthly_sidebar(self):
+		url = reverse('author-posts', kwargs={'username': 'author'})
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertContains(response, 'author 2024-4 #0')
+		self.assertNotContains(response, 'other 2024-3')
+		self.assertContains(response, 'March 2024</a> (3)')
+		self.assertContains(response, '?author=author')
+		self.assertFalse(any('GROUP BY' in q['sql'] for q in queries.captured_queries))
+		self.assertEqual(self.client.get(reverse('author-posts', kwargs={'username': 'nobody'})).status_code, 404)
+
+	def test_sidebar_links_encode_the_username(self):
+		plus = User.objects.create_user(username='a+b@example.com', password='StrongPass123!@#')
+		self.create_post(plus, 2024, 3, 5)
+		response = self.client.get(reverse('author-posts', kwargs={'username': plus.username}))
+		url = reverse('post-archive-month', kwargs={'year': 2024, 'month': 3}) + '?author=a%2Bb%40example.com'
+		self.assertEqual([link['url'] for link in response.context['archive_links']], [url])
+		narrowed = self.client.get(url)
+		self.assertEqual(narrowed.context['author'], plus)
+		self.assertContains(narrowed, 'a+b@example.com 2024-3 #5')
+		self.assertNotContains(narrowed, 'author 2024-3')
+
+	def test_month_archive(self):
+		url = reverse('post-archive-month', kwargs={'year': 2024, 'month': 3})
+		response = self.client.get(url)
+		self.assertContains(response, 'other 2024-3 #9')
+		self.assertContains(response, 'author 2024-3 #2')
+		self.assertNotContains(response, 'author 2024-4')
+		self.assertContains(response, 'March 2024</a> (4)')
+
+		narrowed = self.client.get(url, {'author': 'other'})
+		self.assertContains(narrowed, 'other 2024-3 #9')
+		self.assertNotContains(narrowed, 'author 2024-3')
+		self.assertEqual(
+			self.client.get(reverse('post-archive-month', kwargs={'year': 2024, 'month': 13})).status_code, 404
+		)
+
+
+class TagCooccurrenceTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		tag_stats.clear_lru()
+		self.user = User.objects.create_user(username='tagger', password='StrongPass123!@#')
+		self.python, self.django, self.web = Tag.objects.resolve_names(['python', 'django', 'web'])
+
+	def create_post(self, tags):
+		post = Post.objects.create(title='Tagged', content='Body', author=self.user)
+		post.set_tags(tags)
+		return post
+
+	def pairs(self):
+		return {
+			(row.tag.name, row.other.name): row.count
+			for row in TagCooccurrence.objects.select_related('tag', 'other')
+		}
+
+	def test_counts_follow_tag_edits_and_deletes(self):
+		first = self.create_post([self.python, self.django])
+		second = self.create_post([self.python, self.django, self.web])
+		self.assertEqual(self.pairs(), {
+			('python', 'django'): 2, ('django', 'python'): 2,
+			('python', 'web'): 1, ('web', 'python'): 1,
+			('django', 'web'): 1, ('web', 'django'): 1,
+		})
+
+		second.set_tags([self.python, self.web])
+		self.assertEqual(self.pairs(), {
+			('python', 'django'): 1, ('django', 'python'): 1,
+			('python', 'web'): 1, ('web', 'python'): 1,
+		})
+
+		self.client.login(username='tagger', password='StrongPass123!@#')
+		self.client.post(reverse('post-delete', kwargs={'pk': first.pk}))
+		self.assertEqual(self.pairs(), {('python', 'web'): 1, ('web', 'python'): 1})
+
+	def test_rebuild_matches_incremental_counts(self):
+		self.create_post([self.python, self.django])
+		self.create_post([self.python, self.django, self.web])
+		self.create_post([self.web]).set_tags([self.web, self.django])
+		expected = self.pairs()
+
+		TagCooccurrence.objects.all().delete()
+		call_command('rebuild_tag_cooccurrence', '--batch-size', '2', stdout=StringIO())
+		self.assertEqual(self.pairs(), expected)
+
+	def test_related_tags_and_cloud(self):
+		for _ in range(3):
+			self.create_post([self.python, self.django])
+		self.create_post([self.python, self.web])
+
+		self.assertEqual(
+			[(tag.name, count) for tag, count in tag_stats.related_tags(self.python)],
+			[('django', 3), ('web', 1)],
+		)
+		cloud = dict((tag.name, level) for tag, level in tag_stats.tag_cloud())
+		self.assertEqual(list(cloud), ['django', 'python', 'web'])
+		self.assertEqual((cloud['python'], cloud['web']), (5, 1))
+
+		# A new pairing bumps the ``tags`` version, so the memoized answer is replaced.
+		self.create_post([self.python, self.web])
+		self.create_post([self.python, self.web])
+		self.assertEqual(
+			[(tag.name, count) for tag, count in tag_stats.related_tags(self.python)],
+			[('django', 3), ('web', 3)],
+		)
+		with self.assertNumQueries(0):
+			tag_stats.related_tags(self.python)
+
+	def test_tag_page_shows_related_tags_and_cloud(self):
+		self.create_post([self.python, self.django])
+		response = self.client.get(reverse('post-by-tag', kwargs={'tag_slug': self.python.slug}))
+		self.assertContains(response, 'Related tags')
+		self.assertContains(response, 'django</a> (1)')
+		self.assertContains(response, 'class="tag-cloud"')
+
+		self.create_post([self.python, self.web])
+		response = self.client.get(reverse('post-by-tag', kwargs={'tag_slug': self.python.slug}))
+		self.assertContains(response, 'web</a> (1)')
+
+
+@skipUnless(related.available(), 'related posts need numpy and scipy')
+class RelatedPostsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		related.reset()
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.python, self.django, self.cooking = Tag.objects.resolve_names(['python', 'django', 'cooking'])
+
+	def create_post(self, title, content, tags):
+		post = Post.objects.create(title=title, content=content, author=self.author)
+		post.set_tags(tags)
+		related.drain()
+		return post
+
+	def neighbours(self, post):
+		return [row.other.title for row in PostSimilarity.objects.for_post(post.pk)]
+
+	def create_corpus(self):
+		self.orm = self.create_post('Django ORM tips', 'querysets select_related prefetch', [self.python, self.django])
+		self.views = self.create_post('Django class views', 'querysets templates mixins', [self.python, self.django])
+		self.asyncio = self.create_post('Python asyncio', 'event loop coroutines', [self.python])
+		self.bread = self.create_post('Sourdough bread', 'flour starter oven', [self.cooking])
+
+	def test_neighbours_rank_by_tags_and_text(self):
+		self.create_corpus()
+		self.assertEqual(self.neighbours(self.orm), ['Django class views', 'Python asyncio'])
+		self.assertEqual(self.neighbours(self.asyncio), ['Django ORM tips', 'Django class views'])
+		self.assertEqual(self.neighbours(self.bread), [])
+
+	def test_edits_and_deletes_refresh_affected_posts(self):
+		self.create_corpus()
+		self.bread.title = 'Django bread'
+		self.bread.content = 'querysets select_related prefetch'
+		self.bread.save()
+		self.bread.set_tags([self.django])
+		related.drain()
+		self.assertIn('Django bread', self.neighbours(self.orm))
+		self.assertEqual(self.neighbours(self.bread)[0], 'Django ORM tips')
+
+		self.views.delete()
+		related.drain()
+		self.assertNotIn('Django class views', self.neighbours(self.orm))
+		self.assertEqual(self.neighbours(self.asyncio), ['Django ORM tips'])
+
+	def test_saving_only_queues_the_post(self):
+		self.create_corpus()
+		related.reset()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.bread.set_tags([self.python, self.django])
+		self.assertIsNone(related._matrix)
+		self.assertEqual(set(PostSimilarityUpdate.objects.values_list('post_id', flat=True)), {self.bread.pk})
+		self.assertNotIn('Sourdough bread', self.neighbours(self.asyncio))
+
+		call_command('refresh_related_posts', stdout=StringIO())
+		self.assertFalse(PostSimilarityUpdate.objects.exists())
+		self.assertIn('Sourdough bread', self.neighbours(self.asyncio))
+
+	def test_refresh_keeps_the_matrix_and_its_frequencies(self):
+		self.create_corpus()
+		with mock.patch.object(related.TermMatrix, 'load') as load:
+			self.bread.content = 'coroutines and querysets'
+			self.bread.save()
+			self.views.delete()
+			related.drain()
+		load.assert_not_called()
+		matrix = related._matrix
+		self.assertEqual(matrix.frequency.tolist(), related.np.asarray((matrix.counts > 0).sum(axis=0)).ravel().tolist())
+
+	def test_incremental_refresh_matches_rebuild(self):
+		self.create_corpus()
+		self.asyncio.set_tags([self.python, self.django])
+		related.drain()
+		incremental = {post.pk: self.neighbours(post) for post in Post.objects.all()}
+
+		related.reset()
+		call_command('rebuild_related_posts', stdout=StringIO())
+		self.assertEqual({post.pk: self.neighbours(post) for post in Post.objects.all()}, incremental)
+
+	def test_detail_page_lists_related_posts(self):
+		self.create_corpus()
+		response = self.client.get(reverse('post-detail', kwargs={'pk': self.orm.pk}))
+		self.assertContains(response, 'Related posts')
+		self.assertContains(response, f'<a href="{reverse("post-detail", args=[self.views.pk])}">Django class views</a>')
+		self.assertEqual(
+			[row.other.title for row in response.context['related_posts']],
+			['Django class views', 'Python asyncio'],
+		)
+
+
+class BulkImportExportTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.reader = User.objects.create_user(username='reader', password='StrongPass123!@#')
+
+	def path(self, name):
+		return os.path.join(self.directory.name, name)
+
+	def create_posts(self, count):
+		for i in range(count):
+			post = Post.objects.create(title=f'Post {i}', content=f'Body {i}', author=self.author)
+			post.set_tags(Tag.objects.resolve_names(['django', f'tag{i % 3}']))
+			root = Comment.objects.create(post=post, author=self.reader, content=f'Root {i}')
+			Comment.objects.create(post=post, author=self.author, parent=root, content=f'Reply {i}')
+		Post.objects.update(published_date=timezone.make_aware(datetime.datetime(2023, 5, 17, 9)))
+		Post.rebuild_counters()
+
+	def snapshot(self):
+		return sorted(
+			(
+				post.title,
+				post.author.username,
+				post.published_date,
+				sorted(tag.name for tag in post.tags.all()),
+				post.comment_count,
+				[(c.content, c.author.username, c.depth) for c in post.comments.select_related('author').order_by('path')],
+			)
+			for post in Post.objects.select_related('author').prefetch_related('tags')
+		)
+
+	def test_round_trip_in_both_formats(self):
+		self.create_posts(5)
+		expected = self.snapshot()
+		for name in ('posts.jsonl', 'posts.csv'):
+			with self.subTest(name=name):
+				call_command('blog_export', self.path(name), verbosity=0, stdout=StringIO())
+				Post.objects.all().delete()
+				Tag.objects.update(post_count=0)
+				call_command('blog_import', self.path(name), '--batch-size', '2', verbosity=0, stdout=StringIO())
+				self.assertEqual(self.snapshot(), expected)
+				self.assertEqual(PostArchiveBucket.objects.get().post_count, 5)
+				self.assertEqual(Tag.objects.get(name='django').post_count, 5)
+				self.assertEqual(TagCooccurrence.objects.get(tag__name='django', other__name='tag0').count, 2)
+				self.assertContains(self.client.get(reverse('post-search'), {'q': 'tag1'}), 'Post 1')
+
+	def test_import_queries_do_not_grow_with_batch_size(self):
+		self.create_posts(20)
+		call_command('blog_export', self.path('posts.jsonl'), verbosity=0, stdout=StringIO())
+		with open(self.path('posts.jsonl')) as handle:
+			records = [bulk.clean_record(json.loads(line)) for line in handle]
+		Post.objects.all().delete()
+
+		def queries_for(batch):
+			with bulk.keep_timestamps(), CaptureQueriesContext(connection) as queries:
+				bulk.Importer().import_batch(batch)
+			return len(queries)
+
+		self.assertEqual(queries_for(records[:2]), queries_for(records[2:]))
+
+	def test_import_rejects_threads_deeper_than_replies_allow(self):
+		def record(depth):
+			comments = [{'id': 0, 'parent': None, 'author': 'bob', 'content': 'Root'}]
+			comments += [{'id': i, 'parent': i - 1, 'author': 'bob', 'content': f'Reply {i}'} for i in range(1, depth + 1)]
+			return {'title': 'Deep', 'content': 'Body', 'author': 'alice', 'comments': comments}
+
+		bulk.clean_record(record(Comment.MAX_DEPTH - 1))
+		with self.assertRaisesMessage(ValueError, f'nested deeper than {Comment.MAX_DEPTH} levels'):
+			bulk.clean_record(record(Comment.MAX_DEPTH))
+
+		with open(self.path('deep.jsonl'), 'w') as handle:
+			handle.write(json.dumps(record(Comment.MAX_DEPTH)) + '\n')
+		with self.assertRaisesMessage(CommandError, 'record 1: comment'):
+			call_command('blog_import', self.path('deep.jsonl'), verbosity=0, stdout=StringIO())
+		self.assertFalse(Post.objects.exists())
+
+	def test_import_resumes_from_checkpoint(self):
+		self.create_posts(5)
+		call_command('blog_export', self.path('posts.jsonl'), verbosity=0, stdout=StringIO())
+		expected = self.snapshot()
+		Post.objects.all().delete()
+
+		original = bulk.Importer.import_batch
+		calls = []
+
+		def fail_second_batch(importer, records):
+			calls.append(len(records))
+			if len(calls) == 2:
+				raise RuntimeError('interrupted')
+			return original(importer, records)
+
+		with mock.patch.object(bulk.Importer, 'import_batch', fail_second_batch):
+			with self.assertRaises(RuntimeError):
+				call_command('blog_import', self.path('posts.jsonl'), '--batch-size', '2', verbosity=0)
+		self.assertEqual(Post.objects.count(), 2)
+		self.assertEqual(ImportCheckpoint.objects.get().position, 2)
+
+		out = StringIO()
+		call_command('blog_import', self.path('posts.jsonl'), '--batch-size', '2', verbosity=0, stdout=out)
+		self.assertIn('Resuming after record 2', out.getvalue())
+		self.assertEqual(self.snapshot(), expected)
+
+	def test_export_resumes_without_duplicates(self):
+		self.create_posts(5)
+		call_command('blog_export', self.path('full.jsonl'), verbosity=0, stdout=StringIO())
+
+		original = bulk.export_records
+
+		def interrupted(after, batch_size):
+			for number, item in enumerate(original(after, batch_size)):
+				if number == 3:
+					raise RuntimeError('interrupted')
+				yield item
+
+		with mock.patch.object(bulk, 'export_records', interrupted):
+			with self.assertRaises(RuntimeError):
+				call_command('blog_export', self.path('partial.jsonl'), '--batch-size', '2', verbosity=0)
+		call_command('blog_export', self.path('partial.jsonl'), '--resume', verbosity=0, stdout=StringIO())
+
+		with open(self.path('full.jsonl')) as full, open(self.path('partial.jsonl')) as partial:
+			self.assertEqual(partial.read(), full.read())
+		self.assertFalse(os.path.exists(self.path('partial.jsonl.checkpoint')))
+
+	def test_invalid_record_reports_its_number(self):
+		with open(self.path('bad.jsonl'), 'w') as handle:
+			handle.write(json.dumps({'title': 'Fine', 'content': 'Body', 'author': 'writer'}) + '\n')
+			handle.write(json.dumps({'title': 'No author', 'content': 'Body'}) + '\n')
+		with self.assertRaisesMessage(CommandError, 'record 2: missing author'):
+			call_command('blog_import', self.path('bad.jsonl'), verbosity=0, stdout=StringIO())
+
+
+class RenderingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+
+	def test_markdown_subset(self):
+		html = rendering.to_html(
+			'# Title\n\nSome **bold** and *em* text with `x < y`.\n\n'
+			'- one\n- [two](https://example.com/?a=1&b=2)\n\n1. first\n\n> quoted\n\n```\n<b>code</b>\n```'
+		)
+		self.assertIn('<h2>Title</h2>', html)
+		self.assertIn('<p>Some <strong>bold</strong> and <em>em</em> text with <code>x &lt; y</code>.</p>', html)
+		self.assertIn(
+			'<ul><li>one</li><li><a href="https://example.com/?a=1&amp;b=2" rel="nofollow">two</a></li></ul>', html
+		)
+		self.assertIn('<ol><li>first</li></ol>', html)
+		self.assertIn('<blockquote><p>quoted</p></blockquote>', html)
+		self.assertIn('<pre><code>&lt;b&gt;code&lt;/b&gt;</code></pre>', html)
+
+	def test_html_and_unsafe_links_are_neutralized(self):
+		html = rendering.to_html(
+			'<script>alert(1)</script> [click](javascript:alert(1)) [data](data:text/html,x) '
+			'<img src=x onerror=alert(1)> [ok](/posts/1/) "quoted"'
+		)
+		self.assertNotIn('<script', html)
+		self.assertNotIn('<img', html)
+		self.assertNotIn('href="javascript', html)
+		self.assertNotIn('href="data', html)
+		self.assertIn('<a href="/posts/1/" rel="nofollow">ok</a>', html)
+		self.assertIn('&quot;quoted&quot;', html)
+
+	def test_excerpt_is_plain_text_cut_at_a_word(self):
+		self.assertEqual(rendering.excerpt('## Hello **world**\n\n- [a link](/x/)'), 'Hello world a link')
+		long = rendering.excerpt('word ' * 100)
+		self.assertLessEqual(len(long), rendering.EXCERPT_LENGTH)
+		self.assertTrue(long.endswith('word…'))
+
+	def test_save_stores_rendered_content(self):
+		post = Post.objects.create(title='Rendered', content='Some *markdown*', author=self.author)
+		self.assertEqual(post.content_html, '<p>Some <em>markdown</em></p>')
+		self.assertEqual(post.excerpt, 'Some markdown')
+		self.assertEqual(post.render_version, rendering.RENDERER_VERSION)
+
+		post.content = '**Changed**'
+		post.save(update_fields=['content'])
+		post.refresh_from_db()
+		self.assertEqual(post.content_html, '<p><strong>Changed</strong></p>')
+
+		response = self.client.get(reverse('post-detail', kwargs={'pk': post.pk}))
+		self.assertContains(response, '<strong>Changed</strong>', html=False)
+		self.assertContains(self.client.get(reverse('post-list')), 'Changed')
+
+	def test_rerender_command_updates_stale_posts(self):
+		posts = [Post.objects.create(title=f'Post {i}', content=f'*body {i}*', author=self.author) for i in range(5)]
+		Post.objects.filter(pk__in=[p.pk for p in posts[:3]]).update(content_html='old', excerpt='old', render_version=0)
+		for workers in ('1', '2'):
+			with self.subTest(workers=workers):
+				Post.objects.update(render_version=0)
+				out = StringIO()
+				call_command('rerender_posts', '--workers', workers, '--chunk-size', '2', verbosity=0, stdout=out)
+				self.assertIn('Rendered 5 posts', out.getvalue())
+				self.assertEqual(
+					sorted(Post.objects.values_list('content_html', flat=True)),
+					[f'<p><em>body {i}</em></p>' for i in range(5)],
+				)
+				self.assertFalse(Post.objects.exclude(render_version=rendering.RENDERER_VERSION).exists())
+
+		out = StringIO()
+		call_command('rerender_posts', '--workers', '1', verbosity=0, stdout=out)
+		self.assertIn('Rendered 0 posts', out.getvalue())
+
+
+class ListingColumnTests(TestCase):
+	BODY_COLUMN = re.compile(r'"blog_post"\."content"(?!_)')
+	HTML_COLUMN = re.compile(r'"blog_post"\."content_html"')
+
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Long read', content='Long body ' * 5000, author=self.author)
+		self.post.set_tags(Tag.objects.resolve_names(['django']))
+
+	def selects(self, url, data=None):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url, data)
+		self.assertEqual(response.status_code, 200)
+		return response, [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+
+	def test_listings_read_excerpt_not_bodies(self):
+		month = self.post.published_date
+		for url, data in [
+			(reverse('post-list'), None),
+			(reverse('tag-posts', kwargs={'tag_name': 'django'}), None),
+			(reverse('author-posts', kwargs={'username': 'writer'}), None),
+			(reverse('post-archive-month', kwargs={'year': month.year, 'month': month.month}), None),
+			(reverse('post-search'), {'q': 'long'}),
+			(reverse('async-post-list'), None),
+		]:
+			with self.subTest(url=url):
+				response, selects = self.selects(url, data)
+				self.assertContains(response, self.post.excerpt)
+				self.assertFalse([sql for sql in selects if self.BODY_COLUMN.search(sql) or self.HTML_COLUMN.search(sql)])
+
+	def test_detail_reads_rendered_body_only(self):
+		response, selects = self.selects(reverse('post-detail', kwargs={'pk': self.post.pk}))
+		self.assertContains(response, 'Long body Long body')
+		self.assertFalse([sql for sql in selects if self.BODY_COLUMN.search(sql)])
+		self.assertTrue([sql for sql in selects if self.HTML_COLUMN.search(sql)])
+
+	def test_saving_a_listed_post_keeps_its_rendering(self):
+		post = Post.objects.for_listing().get(pk=self.post.pk)
+		post.title = 'Renamed'
+		post.save()
+		post = Post.objects.get(pk=self.post.pk)
+		self.assertEqual(post.title, 'Renamed')
+		self.assertEqual(post.content_html, self.post.content_html)
+
+
+class ViewCountTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		post_stats.reset()
+		self.addCleanup(post_stats.reset)
+		self.author = User.objects.create_user(username='writer', password='StrongPass123!@#')
+		self.posts = [
+			Post.objects.create(title=f'Counted post {i}', content='Body', author=self.author) for i in range(3)
+		]
+
+	def test_views_are_buffered_then_written_in_one_batch(self):
+		url = reverse('post-detail', kwargs={'pk': self.posts[0].pk})
+		first = self.client.get(url)
+		self.client.get(url)
+		self.client.get(url, headers={'if-none-match': first['ETag']})
+		self.client.get(reverse('async-post-detail', kwargs={'pk': self.posts[1].pk}))
+		self.client.get(reverse('post-detail', kwargs={'pk': 999999}))
+		self.assertEqual(post_stats.pending(), {self.posts[0].pk: 3, self.posts[1].pk: 1})
+		self.assertFalse(PostStats.objects.exists())
+
+		with self.assertNumQueries(5):
+			# Savepoint, existing posts, insert missing rows, one update, release.
+			self.assertEqual(post_stats.flush(), 4)
+		self.assertEqual(post_stats.pending(), {})
+		self.assertEqual(
+			dict(PostStats.objects.values_list('post_id', 'views')),
+			{self.posts[0].pk: 3, self.posts[1].pk: 1},
+		)
+
+		post_stats.record_view(self.posts[0].pk)
+		post_stats.flush()
+		self.assertEqual(PostStats.objects.get(post=self.posts[0]).views, 4)
+
+	def test_flush_is_due_after_the_interval(self):
+		post_stats.record_view(self.posts[0].pk)
+		self.assertFalse(post_stats.flush_due())
+		with override_settings(BLOG_VIEW_FLUSH_SECONDS=0):
+			self.assertTrue(post_stats.flush_due())
+			self.client.get(reverse('post-list'))
+		self.assertEqual(PostStats.objects.get(post=self.posts[0]).views, 1)
+
+	def test_flush_skips_deleted_posts(self):
+		post_stats.record_view(self.posts[0].pk)
+		post_stats.record_view(self.posts[1].pk)
+		self.posts[1].delete()
+		self.assertEqual(post_stats.flush(), 1)
+		self.assertEqual(list(PostStats.objects.values_list('post_id', flat=True)), [self.posts[0].pk])
+
+	def test_trending_prefers_recent_views(self):
+		now = 1800000000
+		day = 24 * 60 * 60
+		old, recent, quiet = self.posts
+		post_stats.write_views({old.pk: 10}, at=now - 3 * day)
+		post_stats.write_views({recent.pk: 3}, at=now)
+		post_stats.write_views({quiet.pk: 1}, at=now - day)
+		post_stats.write_views({quiet.pk: 1}, at=now)
+
+		trending = post_stats.trending_posts()
+		self.assertEqual([post for post, _, _ in trending], [recent, quiet, old])
+		self.assertEqual([views for _, views, _ in trending], [3, 2, 10])
+		scores = dict(PostStats.objects.values_list('post_id', 'trending_score'))
+		self.assertAlmostEqual(post_stats.heat(scores[old.pk], now), 10 / 8)
+		self.assertAlmostEqual(post_stats.heat(scores[quiet.pk], now), 1.5)
+
+	def test_trending_page_is_cached(self):
+		post_stats.write_views({self.posts[2].pk: 5})
+		response = self.client.get(reverse('post-trending'))
+		self.assertContains(response, 'Counted post 2')
+		self.assertNotContains(response, 'Counted post 0')
+
+		post_stats.write_views({self.posts[0].pk: 50})
+		self.assertNotContains(self.client.get(reverse('post-trending')), 'Counted post 0')
+		cache.clear()
+		self.assertContains(self.client.get(reverse('post-trending')), 'Counted post 0')
+
+
+class OwnerPermissionTests(TestCase):
+	"""Edit and delete views fetch their object once, with the ownership check in the same query."""
+
+	def setUp(self):
+		cache.clear()
+		self.owner = User.objects.create_user(username='owner', password='StrongPass123!@#')
+		self.other = User.objects.create_user(username='other', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Owned', content='Body', author=self.owner)
+		self.comment = Comment.objects.create(post=self.post, author=self.owner, content='Mine')
+		self.post.record_comment_added(self.comment)
+
+	def urls(self):
+		return [
+			('post-update', self.post.pk, 'blog_post', {'title': 'Edited', 'content': 'Body', 'tags': ''}),
+			('post-delete', self.post.pk, 'blog_post', {}),
+			('comment-update', self.comment.pk, 'blog_comment', {'content': 'Edited'}),
+			('comment-delete', self.comment.pk, 'blog_comment', {}),
+		]
+
+	def lookups(self, method, url, table, data=None):
+		"""The response and how many queries selected ``table`` rows by primary key."""
+		by_pk = re.compile(rf'^SELECT .* FROM "{table}" WHERE .*"{table}"\."id" = ')
+		with CaptureQueriesContext(connection) as queries:
+			response = getattr(self.client, method)(url, data)
+		return response, len([q for q in queries.captured_queries if by_pk.search(q['sql'])])
+
+	def test_owner_object_is_fetched_once(self):
+		self.client.force_login(self.owner)
+		for name, pk, table, data in self.urls():
+			url = reverse(name, kwargs={'pk': pk})
+			with self.subTest(name=name):
+				response, lookups = self.lookups('get', url, table)
+				self.assertEqual(response.status_code, 200)
+				self.assertEqual(lookups, 1)
+
+		# Delete the comment before its post so every view still has an object.
+		for name, pk, table, data in [self.urls()[i] for i in (2, 3, 0, 1)]:
+			url = reverse(name, kwargs={'pk': pk})
+			with self.subTest(name=name, method='post'):
+				response, lookups = self.lookups('post', url, table, data)
+				self.assertEqual(response.status_code, 302)
+				self.assertEqual(lookups, 1)
+		self.assertFalse(Post.objects.exists())
+
+	def test_non_owner_is_forbidden_and_missing_is_not_found(self):
+		self.client.force_login(self.other)
+		for name, pk, table, data in self.urls():
+			with self.subTest(name=name):
+				with self.assertNumQueries(4):
+					# Session, user, the owner-filtered lookup and the existence check.
+					response = self.client.get(reverse(name, kwargs={'pk': pk}))
+				self.assertEqual(response.status_code, 403)
+				self.assertEqual(self.client.post(reverse(name, kwargs={'pk': pk}), data).status_code, 403)
+				self.assertEqual(self.client.get(reverse(name, kwargs={'pk': 999999})).status_code, 404)
+		self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Owned')
+		self.assertEqual(Comment.objects.get(pk=self.comment.pk).content, 'Mine')
+
+	def test_owner_check_without_queryset_filter(self):
+		self.client.force_login(self.other)
+		with mock.patch.object(views.PostUpdateView, 'owner_in_queryset', False):
+			url = reverse('post-update', kwargs={'pk': self.post.pk})
+			with self.assertNumQueries(3):
+				self.assertEqual(self.client.get(url).status_code, 403)
+			self.client.force_login(self.owner)
+			response, lookups = self.lookups('get', url, 'blog_post')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(lookups, 1)
+
+
+@override_settings(BLOG_COMMENT_MODERATION=True)
+class CommentModerationTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.reader = User.objects.create_user(username='reader', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Moderated', content='Body', author=self.author)
+
+	def submit(self, content, post=None, author=None):
+		return CommentSubmission.objects.create(post=post or self.post, author=author or self.reader, content=content)
+
+	def test_worker_thread_is_opt_in(self):
+		with mock.patch.object(moderation, 'ModerationWorker') as worker:
+			moderation.wake_worker()
+			worker.assert_not_called()
+			with self.settings(BLOG_MODERATION_WORKER='thread'), mock.patch.object(moderation, '_worker', None):
+				moderation.wake_worker()
+			worker.return_value.start.assert_called_once_with()
+			worker.return_value.wake.set.assert_called_once_with()
+
+	def test_new_comments_wait_for_moderation(self):
+		self.client.login(username='reader', password='StrongPass123!@#')
+		detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+		response = self.client.post(
+			reverse('comment-create', kwargs={'post_id': self.post.pk}), {'content': 'Nice write-up'}, follow=True
+		)
+		self.assertContains(response, 'will appear once it has been checked')
+		self.assertFalse(Comment.objects.exists())
+		self.assertEqual(CommentSubmission.objects.pending().count(), 1)
+
+		self.assertEqual(moderation.drain(), (1, 0))
+		self.assertFalse(CommentSubmission.objects.exists())
+		comment = Comment.objects.get()
+		self.assertEqual((comment.content, comment.author, comment.post), ('Nice write-up', self.reader, self.post))
+		self.post.refresh_from_db()
+		self.assertEqual(self.post.comment_count, 1)
+		self.assertEqual(self.post.last_commented_at, comment.created_at)
+		self.assertContains(self.client.get(detail), 'Nice write-up')
+
+	def test_classifiers_reject_spam(self):
+		links = self.submit('Buy now http://a.example http://b.example http://c.example')
+		original = self.submit('I think the section on indexes could use an example with EXPLAIN output')
+		copy = self.submit('I think the section on indexes could use an example with EXPLAIN output!')
+		thanks = [self.submit('Thanks!'), self.submit('Thanks!')]
+		self.assertEqual(moderation.drain(), (3, 2))
+
+		self.assertEqual(
+			dict(CommentSubmission.objects.rejected().values_list('pk', 'flagged_by')),
+			{links.pk: 'links', copy.pk: 'duplicate'},
+		)
+		self.assertEqual(
+			sorted(Comment.objects.values_list('content', flat=True)),
+			sorted([original.content] + [t.content for t in thanks]),
+		)
+		self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 3)
+
+		# A mistaken rejection can be published by hand.
+		self.assertEqual(moderation.approve([copy.pk]), 1)
+		self.assertTrue(Comment.objects.filter(content=copy.content).exists())
+		self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 4)
+
+		# Published comments are remembered by later workers too.
+		again = self.submit('i think the section on INDEXES could use an example with explain output')
+		moderation.drain()
+		again.refresh_from_db()
+		self.assertEqual(again.flagged_by, 'duplicate')
+
+	def test_short_stock_replies_are_not_duplicates(self):
+		other = User.objects.create_user(username='other', password='StrongPass123!@#')
+		for author in (self.reader, other, self.author):
+			self.submit('Thanks for sharing this', author=author)
+			self.submit('Great post, thank you!', author=author)
+		self.assertEqual(moderation.drain(), (6, 0))
+		self.assertEqual(Comment.objects.filter(content='Thanks for sharing this').count(), 3)
+
+	def test_naive_bayes_learns_from_decisions(self):
+		Comment.objects.bulk_create([
+			Comment(post=self.post, author=self.reader, content=f'great explanation of query plans {i}')
+			for i in range(20)
+		])
+		CommentSubmission.objects.bulk_create([
+			CommentSubmission(
+				post=self.post, author=self.reader, content=f'cheap pills casino bonus offer {i}',
+				status=CommentSubmission.REJECTED,
+			)
+			for i in range(20)
+		])
+		classifier = moderation.NaiveBayesClassifier()
+		spam, ham = classifier.score([
+			CommentSubmission(content='casino bonus pills'),
+			CommentSubmission(content='the query plans explanation helped'),
+		])
+		self.assertGreater(spam, 0.99)
+		self.assertLess(ham, 0.01)
+
+		untrained = moderation.NaiveBayesClassifier()
+		untrained.MIN_EXAMPLES = 21
+		self.assertEqual(untrained.score([CommentSubmission(content='casino bonus pills')]), [0.0])
+
+	def test_batch_costs_constant_queries(self):
+		posts = [Post.objects.create(title=f'Post {i}', content='Body', author=self.author) for i in range(20)]
+		root = Comment.objects.create(post=posts[0], author=self.author, content='root')
+
+		def moderate(count):
+			for i in range(count):
+				submission = self.submit(f'comment {i}', post=posts[i % len(posts)])
+				if i % 3 == 0 and submission.post_id == root.post_id:
+					CommentSubmission.objects.filter(pk=submission.pk).update(parent=root)
+			with CaptureQueriesContext(connection) as queries:
+				self.assertEqual(moderation.moderate_batch([moderation.LinkClassifier()]), (count, 0))
+			return len(queries)
+
+		self.assertEqual(moderate(2), moderate(40))
+		replies = Comment.objects.filter(parent=root)
+		self.assertTrue(replies.exists())
+		self.assertTrue(all(reply.path.startswith(root.path) for reply in replies))
+		posts[1].refresh_from_db()
+		self.assertEqual(posts[1].comment_count, 3)
+
+
+class CommentParentPostTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.post = Post.objects.create(title='Parent', content='Body ' * 1000, author=self.author)
+		self.client.login(username='author', password='StrongPass123!@#')
+
+	def post_selects(self, method, url, data=None):
+		with CaptureQueriesContext(connection) as queries:
+			response = getattr(self.client, method)(url, data)
+		return response, [q['sql'] for q in queries.captured_queries if re.match(r'SELECT .* FROM "blog_post"', q['sql'])]
+
+	def test_both_routes_accept_comments(self):
+		for name, kwargs in [
+			('comment-create', {'post_id': self.post.pk}),
+			('comment-create-legacy', {'pk': self.post.pk}),
+		]:
+			with self.subTest(name=name):
+				url = reverse(name, kwargs=kwargs)
+				response, selects = self.post_selects('get', url)
+				self.assertEqual(response.status_code, 200)
+				self.assertEqual(len(selects), 1)
+				self.assertNotIn('"blog_post"."content"', selects[0])
+				response = self.client.post(url, {'content': f'Via {name}'})
+				self.assertRedirects(response, reverse('post-detail', kwargs={'pk': self.post.pk}))
+		self.assertEqual(Comment.objects.filter(post=self.post).count(), 2)
+
+	def test_unknown_post_is_not_found(self):
+		for name, kwargs in [('comment-create', {'post_id': 999999}), ('comment-create-legacy', {'pk': 999999})]:
+			with self.subTest(name=name):
+				self.assertEqual(self.client.get(reverse(name, kwargs=kwargs)).status_code, 404)
+				self.assertEqual(self.client.post(reverse(name, kwargs=kwargs), {'content': 'x'}).status_code, 404)
+		self.assertFalse(CommentSubmission.objects.exists())
+
+	def test_anonymous_users_are_redirected_before_any_lookup(self):
+		self.client.logout()
+		response, selects = self.post_selects('get', reverse('comment-create', kwargs={'post_id': 999999}))
+		self.assertEqual(response.status_code, 302)
+		self.assertEqual(selects, [])
+
+
+class SuggestionTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user(username='author', password='StrongPass123!@#')
+		self.django = Post.objects.create(title='Django  query plans', content='Body', author=self.author)
+		self.intro = Post.objects.create(title='Getting started with django', content='Body', author=self.author)
+		self.other = Post.objects.create(title='Cooking for one', content='Body', author=self.author)
+		self.tag = Tag.objects.create(name='Django ORM')
+		suggest.build()
+		self.addCleanup(suggest.reset)
+
+	def test_prefix_of_any_word_matches(self):
+		tags, posts = suggest.suggest('DJA')
+		self.assertEqual(tags, [(self.tag.slug, 'Django ORM')])
+		self.assertEqual(sorted(posts), [(self.django.pk, 'Django query plans'), (self.intro.pk, 'Getting started with django')])
+		self.assertEqual(suggest.suggest('query   pl')[1], [(self.django.pk, 'Django query plans')])
+		self.assertEqual(suggest.suggest('ango'), ([], []))
+		self.assertEqual(suggest.suggest('  '), ([], []))
+
+	def test_index_follows_saves_and_deletes(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			post = Post.objects.create(title='Djangonauts unite', content='Body', author=self.author)
+		self.assertIn((post.pk, 'Djangonauts unite'), suggest.suggest('djangon')[1])
+
+		post.title = 'Pythonistas unite'
+		with self.captureOnCommitCallbacks(execute=True):
+			post.save()
+		self.assertEqual(suggest.suggest('djangon'), ([], []))
+		self.assertEqual(suggest.suggest('pyth')[1], [(post.pk, 'Pythonistas unite')])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			post.delete()
+		self.assertEqual(suggest.suggest('unite'), ([], []))
+
+		self.tag.name = 'Flask'
+		with self.captureOnCommitCallbacks(execute=True):
+			self.tag.save()
+		self.assertEqual(suggest.suggest('flask')[0], [(self.tag.slug, 'Flask')])
+		with self.captureOnCommitCallbacks(execute=True):
+			self.tag.delete()
+		self.assertEqual(suggest.suggest('flask'), ([], []))
+
+	def test_changes_wait_for_commit(self):
+		with self.captureOnCommitCallbacks() as callbacks:
+			Post.objects.create(title='Uncommitted idea', content='Body', author=self.author)
+		self.assertEqual(suggest.suggest('uncommitted'), ([], []))
+		for callback in callbacks:
+			callback()
+		self.assertEqual(len(suggest.suggest('uncommitted')[1]), 1)
+
+	def test_changes_from_other_processes_are_replayed(self):
+		# Another process logs a change; this one sees it at its next sync.
+		suggest._log_change(('set_post', 10_000, 'Remote rocket science'))
+		self.assertEqual(suggest.suggest('rocket'), ([], []))
+		with self.settings(BLOG_SUGGEST_SYNC_SECONDS=0):
+			self.assertEqual(suggest.suggest('rocket')[1], [(10_000, 'Remote rocket science')])
+
+		# A logged change that cannot be read (evicted) eventually forces a rebuild.
+		suggest._log_change(('remove_post', 10_000))
+		caching.get_cache().delete(suggest.CHANGE_PREFIX + str(suggest._last_change()))
+		index = suggest.get_index()
+		with self.settings(BLOG_SUGGEST_SYNC_SECONDS=0), mock.patch.object(suggest, '_start_rebuild') as rebuild:
+			suggest.suggest('rocket')
+			rebuild.assert_not_called()
+			index.missing_since -= suggest.MISSING_CHANGE_SECONDS
+			suggest.suggest('rocket')
+			rebuild.assert_called_once()
+
+	def test_index_is_not_rebuilt_periodically_by_default(self):
+		index = suggest.get_index()
+		index.built_at -= 24 * 60 * 60
+		with mock.patch.object(suggest, '_start_rebuild') as rebuild:
+			suggest.suggest('django')
+		rebuild.assert_not_called()
+
+	def test_build_sorts_entries_group_by_group(self):
+		titles = [(pk, f'{word} {pk}') for pk, word in enumerate(['b', 'a', 'Ab', 'aB c', 'Éclair', 'éa', 'a-b', 'zz top', 'b'], start=1)]
+		index = suggest.SuggestionIndex(titles, [(1, 'A', 'a')], limit=100)
+		self.assertEqual(list(index.entries), sorted(index.entries, key=index.key))
+
+	def test_index_keeps_the_newest_posts(self):
+		index = suggest.SuggestionIndex([(1, 'alpha one'), (2, 'alpha two'), (3, 'alpha three')], [], limit=2)
+		self.assertEqual(sorted(index.suggest('alpha')[1]), [(2, 'alpha two'), (3, 'alpha three')])
+		index.set_post(4, 'alpha four')
+		self.assertEqual(sorted(index.suggest('alpha')[1]), [(3, 'alpha three'), (4, 'alpha four')])
+		self.assertEqual(index.post_count, 2)
+		# Editing a post does not make it newer: the lowest id still goes first.
+		index.set_post(3, 'alpha three, edited')
+		index.set_post(5, 'alpha five')
+		self.assertEqual(sorted(index.suggest('alpha')[1]), [(4, 'alpha four'), (5, 'alpha five')])
+		# A post older than everything indexed is dropped again straight away.
+		index.set_post(1, 'alpha one, edited')
+		self.assertEqual(sorted(index.suggest('alpha')[1]), [(4, 'alpha four'), (5, 'alpha five')])
+
+	def test_buffered_changes_match_a_fresh_build(self):
+		rng = random.Random(0)
+		words = ['ab', 'abc', 'Abd', 'b', 'ba', 'bab', 'c', 'ca', 'Éa']
+		titles = {pk: ' '.join(rng.choices(words, k=3)) for pk in range(1, 40)}
+		tags = {1: 'ab', 2: 'ba'}
+		index = suggest.SuggestionIndex(titles.items(), [(pk, name, f'tag-{pk}') for pk, name in tags.items()], limit=100)
+		with mock.patch.object(suggest, 'MERGE_THRESHOLD', 7):
+			for _ in range(300):
+				pk = rng.randrange(1, 60)
+				if rng.random() < 0.3:
+					titles.pop(pk, None)
+					index.remove_post(pk)
+				else:
+					titles[pk] = ' '.join(rng.choices(words, k=3))
+					index.set_post(pk, titles[pk])
+				if rng.random() < 0.1:
+					tags[pk] = rng.choice(words)
+					index.set_tag(pk, tags[pk], f'tag-{pk}')
+				fresh = suggest.SuggestionIndex(titles.items(), [(pk, name, f'tag-{pk}') for pk, name in tags.items()], limit=100)
+				for prefix in ('a', 'ab', 'b', 'c', 'é', 'ab b'):
+					found, expected = index.suggest(prefix, 100), fresh.suggest(prefix, 100)
+					self.assertEqual((sorted(found[0]), sorted(found[1])), (sorted(expected[0]), sorted(expected[1])))
+				self.assertEqual(len(index), len(fresh))
+		self.assertEqual(list(index.entries), sorted(index.entries, key=index.key))
+
+	def test_suggested_tag_links_open_the_tag_page(self):
+		tag = Tag.objects.create(name='Python 3')
+		post = Post.objects.create(title='Porting to py3', content='Body', author=self.author)
+		post.set_tags([tag])
+		suggest.build()
+		url = self.client.get(reverse('post-suggest'), {'q': 'python'}).json()['tags'][0]['url']
+		self.assertEqual(url, '/tags/slug/python-3/')
+		response = self.client.get(url)
+		self.assertEqual(response.context['tag'], tag)
+		self.assertContains(response, 'Porting to py3')
+
+	def test_endpoint_returns_tags_and_posts(self):
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('post-suggest'), {'q': 'django q'})
+		self.assertEqual(response.json(), {
+			'tags': [],
+			'posts': [{'title': 'Django query plans', 'url': reverse('post-detail', kwargs={'pk': self.django.pk})}],
+		})
+		data = self.client.get(reverse('post-suggest'), {'q': 'dj'}).json()
+		self.assertEqual(data['tags'], [{'name': 'Django ORM', 'url': reverse('post-by-tag', kwargs={'tag_slug': self.tag.slug})}])
+		self.assertEqual(len(data['posts']), 2)
+
+
+class JsonApiTests(TestCase):
+	def setUp(self):
+		self.alice = User.objects.create_user(username='alice', password='StrongPass123!@#')
+		self.bob = User.objects.create_user(username='bob', password='StrongPass123!@#')
+		now = timezone.now()
+		self.posts = []
+		for i in range(5):
+			post = Post.objects.create(title=f'Post {i}', content=f'Body **{i}**', author=self.alice if i % 2 else self.bob)
+			Post.objects.filter(pk=post.pk).update(published_date=now - datetime.timedelta(hours=i))
+			self.posts.append(post)
+		django, orm = Tag.objects.create(name='django'), Tag.objects.create(name='orm')
+		self.posts[0].set_tags([django, orm])
+		self.posts[3].set_tags([django])
+		self.root = Comment.objects.create(post=self.posts[0], author=self.bob, content='First')
+		self.reply = Comment.objects.create(post=self.posts[0], author=self.alice, content='Reply', parent=self.root)
+		self.second = Comment.objects.create(post=self.posts[0], author=self.alice, content='Second')
+		for comment in (self.root, self.reply, self.second):
+			self.posts[0].record_comment_added(comment)
+
+	def get(self, name, params=None, **kwargs):
+		return self.client.get(reverse(name, kwargs=kwargs or None), params or {})
+
+	def test_post_list_pages_with_cursors(self):
+		with self.assertNumQueries(2):
+			response = self.get('api-post-list', {'limit': 2})
+		data = response.json()
+		first = data['results'][0]
+		self.assertEqual(set(first), {'id', 'title', 'author', 'published_date', 'updated', 'excerpt', 'comment_count', 'tags'})
+		self.assertEqual((first['id'], first['author'], first['tags'], first['comment_count']), (self.posts[0].pk, 'bob', ['django', 'orm'], 3))
+		self.assertIsNone(data['previous'])
+
+		seen = [row['id'] for row in data['results']]
+		while data['next']:
+			data = self.get('api-post-list', {'limit': 2, 'cursor': data['next']}).json()
+			seen += [row['id'] for row in data['results']]
+		self.assertEqual(seen, [post.pk for post in self.posts])
+
+		back = self.get('api-post-list', {'limit': 2, 'cursor': data['previous']}).json()
+		self.assertEqual([row['id'] for row in back['results']], [self.posts[2].pk, self.posts[3].pk])
+
+	def test_fields_limit_columns_and_skip_model_instances(self):
+		with CaptureQueriesContext(connection) as queries, mock.patch.object(Post, 'from_db', side_effect=AssertionError):
+			data = self.get('api-post-list', {'fields': 'title, title,author', 'limit': 1}).json()
+		self.assertEqual(data['results'], [{'title': 'Post 0', 'author': 'bob'}])
+		self.assertEqual(len(queries), 1)
+		self.assertNotIn('"content"', queries[0]['sql'])
+		self.assertNotIn('content_html', queries[0]['sql'])
+
+	def test_filters_and_detail(self):
+		data = self.get('api-post-list', {'tag': 'django', 'fields': 'id'}).json()
+		self.assertEqual(data['results'], [{'id': self.posts[0].pk}, {'id': self.posts[3].pk}])
+		data = self.get('api-post-list', {'author': 'alice', 'fields': 'id'}).json()
+		self.assertEqual(data['results'], [{'id': self.posts[1].pk}, {'id': self.posts[3].pk}])
+
+		data = self.get('api-post-detail', pk=self.posts[1].pk).json()
+		self.assertEqual(data['content_html'], '<p>Body <strong>1</strong></p>')
+		self.assertEqual(data['tags'], [])
+		self.assertEqual(self.get('api-post-detail', {'fields': 'content'}, pk=self.posts[1].pk).json(), {'content': 'Body **1**'})
+
+	def test_errors_are_json(self):
+		for params in ({'fields': 'title,secret'}, {'fields': ','}, {'limit': '0'}, {'limit': 'many'}, {'cursor': 'nonsense'}):
+			response = self.get('api-post-list', params)
+			self.assertEqual(response.status_code, 400, params)
+			self.assertIn('error', response.json())
+		response = self.get('api-post-detail', pk=10**6)
+		self.assertEqual((response.status_code, response.json()), (404, {'error': 'No post found matching the query.'}))
+		self.assertEqual(self.get('api-comment-list', post_id=10**6).status_code, 404)
+		self.assertEqual(self.client.post(reverse('api-post-list')).status_code, 405)
+
+	def test_comments_in_thread_order_and_tags(self):
+		data = self.get('api-comment-list', {'fields': 'id,parent,author'}, post_id=self.posts[0].pk).json()
+		self.assertEqual(data['results'], [
+			{'id': self.root.pk, 'parent': None, 'author': 'bob'},
+			{'id': self.reply.pk, 'parent': self.root.pk, 'author': 'alice'},
+			{'id': self.second.pk, 'parent': None, 'author': 'alice'},
+		])
+		data = self.get('api-tag-list', {'fields': 'name,post_count'}).json()
+		self.assertEqual(data['results'], [{'name': 'django', 'post_count': 2}, {'name': 'orm', 'post_count': 1}])
+
+	def test_exports_stream_json_lines_in_chunks(self):
+		with mock.patch.object(api, 'EXPORT_CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+			response = self.get('api-post-export', {'fields': 'id,tags'})
+			lines = b''.join(response.streaming_content).decode().splitlines()
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+		records = [json.loads(line) for line in lines]
+		self.assertEqual([record['id'] for record in records], sorted(post.pk for post in self.posts))
+		self.assertEqual(records[0]['tags'], ['django', 'orm'])
+		# Three chunks of rows and their tags, then the empty read that ends the stream.
+		self.assertEqual(len(queries), 7)
+
+		response = self.get('api-comment-export', {'post': self.posts[0].pk, 'fields': 'content'})
+		self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), ['{"content": "First"}', '{"content": "Reply"}', '{"content": "Second"}'])
+		self.assertEqual(self.get('api-comment-export', {'post': 'x'}).status_code, 400)
@@ -1,7 +1,7 @@
 from django.contrib.auth import views as auth_views
 from django.urls import path
 
-from . import views
+from . import api, async_views, feeds, views
 
 urlpatterns = [
     path(
@@ -23,15 +23,67 @@ urlpatterns = [
     path("posts/<int:pk>/edit/", views.PostUpdateView.as_view(), name="post-update"),
     path("posts/<int:pk>/delete/", views.PostDeleteView.as_view(), name="post-delete"),
 
+    path("authors/<str:username>/", views.AuthorPostListView.as_view(), name="author-posts"),
+    path(
+        "archive/<int:year>/<int:month>/",
+        views.PostMonthArchiveView.as_view(),
+        name="post-archive-month",
+    ),
+
+    path("trending/", views.TrendingPostListView.as_view(), name="post-trending"),
     path("search/", views.PostSearchView.as_view(), name="post-search"),
+    path("search/suggest/", views.post_suggestions, name="post-suggest"),
     path("tags/<str:tag_name>/", views.TaggedPostListView.as_view(), name="tag-posts"),
-    path("tags/<slug:tag_slug>/", views.PostByTagListView.as_view(), name="post-by-tag"),
+    # Its own prefix: "tags/<str:tag_name>/" above matches every slug too.
+    path("tags/slug/<slug:tag_slug>/", views.PostByTagListView.as_view(), name="post-by-tag"),
+
+    path("feeds/<str:fmt>/", feeds.PostFeedView.as_view(), name="post-feed"),
+    path("feeds/tags/<slug:tag_slug>/<str:fmt>/", feeds.TagFeedView.as_view(), name="tag-feed"),
+    path(
+        "feeds/authors/<str:username>/<str:fmt>/",
+        feeds.AuthorFeedView.as_view(),
+        name="author-feed",
+    ),
+
+    # Read-only JSON API (see blog/api.py)
+    path("api/posts/", api.PostListView.as_view(), name="api-post-list"),
+    path("api/posts/export/", api.PostExportView.as_view(), name="api-post-export"),
+    path("api/posts/<int:pk>/", api.PostDetailView.as_view(), name="api-post-detail"),
+    path("api/posts/<int:post_id>/comments/", api.CommentListView.as_view(), name="api-comment-list"),
+    path("api/comments/export/", api.CommentExportView.as_view(), name="api-comment-export"),
+    path("api/tags/", api.TagListView.as_view(), name="api-tag-list"),
+
+    # ASGI-native read views (see blog/async_views.py)
+    path("async/posts/", async_views.AsyncPostListView.as_view(), name="async-post-list"),
+    path("async/posts/<int:pk>/", async_views.AsyncPostDetailView.as_view(), name="async-post-detail"),
+    path("async/search/", async_views.AsyncPostSearchView.as_view(), name="async-post-search"),
+    path(
+        "async/tags/<str:tag_name>/",
+        async_views.AsyncTaggedPostListView.as_view(),
+        name="async-tag-posts",
+    ),
+    # Its own prefix: "async/tags/<str:tag_name>/" above matches every slug too.
+    path(
+        "async/tags/slug/<slug:tag_slug>/",
+        async_views.AsyncPostByTagListView.as_view(),
+        name="async-post-by-tag",
+    ),
 
     path(
         "posts/<int:post_id>/comments/new/",
         views.CommentCreateView.as_view(),
         name="comment-create",
     ),
+    path(
+        "posts/<int:pk>/comments/",
+        views.comment_threads,
+        name="comment-threads",
+    ),
+    path(
+        "comments/<int:pk>/replies/",
+        views.comment_replies,
+        name="comment-replies",
+    ),
     path(
         "comments/<int:pk>/edit/",
         views.CommentUpdateView.as_view(),
@@ -1,14 +1,28 @@
+import datetime
+
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Q
-from django.shortcuts import redirect, render
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+from django.views.generic import CreateView, DeleteView, DetailView, ListView, TemplateView, UpdateView
 
+from . import moderation, post_stats, suggest
+from .caching import AnonymousPageCacheMixin, render_comment_thread, render_post_cards, tag_name_version
+from .conditional import ConditionalDetailMixin, ConditionalListMixin
 from .forms import CommentForm, PostForm, UserRegistrationForm, UserUpdateForm
-from .models import Comment, Post, Tag
+from .models import Comment, Post, PostArchiveBucket, PostSimilarity, Tag, TagCooccurrence, month_bounds
+from .pagination import KeysetPaginationMixin, KeysetPaginator
+from .search import SearchPaginationMixin
+from .tag_stats import related_tags, tag_cloud
 
 
 def register(request):
@@ -41,21 +55,159 @@ def profile(request):
 	return render(request, 'blog/profile.html', {'form': form})
 
 
-class PostListView(ListView):
+class PostListView(ConditionalListMixin, AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
 	model = Post
+	replica_reads = True
 	context_object_name = 'posts'
-	ordering = ['-published_date']
 	template_name = 'blog/post_list.html'
 
+	def get_page_cache_versions(self):
+		return ['posts']
+
+	def get_queryset(self):
+		return Post.objects.for_listing()
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['post_cards'] = render_post_cards(context['posts'])
+		return context
+
+
+COMMENT_THREADS_PER_PAGE = 20
+COMMENT_REPLIES_PER_PAGE = 50
+
+
+def _comment_threads_paginator(post):
+	threads = (
+		Comment.objects.filter(post=post)
+		.top_level()
+		.select_related('author')
+		.with_reply_count()
+	)
+	return KeysetPaginator(threads, COMMENT_THREADS_PER_PAGE, ordering=('path',))
+
+
+def comment_thread_context(post, cursor=None):
+	"""One page of ``post``'s top-level comments, each with its direct reply count."""
+	try:
+		page = _comment_threads_paginator(post).page(cursor)
+	except ValueError:
+		raise Http404('Invalid page cursor.')
+	return {'comments': page.object_list, 'comment_page': page, 'post': post}
+
 
-class PostDetailView(DetailView):
+async def acomment_thread_context(post, cursor=None):
+	try:
+		page = await _comment_threads_paginator(post).apage(cursor)
+	except ValueError:
+		raise Http404('Invalid page cursor.')
+	return {'comments': page.object_list, 'comment_page': page, 'post': post}
+
+
+def _comment_json(comment, base_depth=0):
+	return {
+		'id': comment.pk,
+		'parent': comment.parent_id,
+		'depth': comment.depth - base_depth,
+		'author': comment.author.username,
+		'content': comment.content,
+		'created_at': comment.created_at.isoformat(),
+		'reply_count': getattr(comment, 'reply_count', None),
+	}
+
+
+def comment_threads(request, pk):
+	post = get_object_or_404(Post.objects.only('pk'), pk=pk)
+	page = comment_thread_context(post, request.GET.get('cursor'))['comment_page']
+	return JsonResponse({
+		'results': [_comment_json(comment) for comment in page],
+		'next': page.next_cursor,
+	})
+
+
+SUGGESTIONS = 8
+
+
+def post_suggestions(request):
+	"""Post titles and tag names with a word starting with ``?q=``, for the search box."""
+	tags, posts = suggest.suggest(request.GET.get('q', '')[:100], SUGGESTIONS)
+	return JsonResponse({
+		'tags': [{'name': name, 'url': reverse('post-by-tag', kwargs={'tag_slug': slug})} for slug, name in tags],
+		'posts': [{'title': title, 'url': reverse('post-detail', kwargs={'pk': pk})} for pk, title in posts],
+	})
+
+
+def comment_replies(request, pk):
+	comment = get_object_or_404(Comment.objects.only('pk', 'path'), pk=pk)
+	replies = Comment.objects.subtree(comment).select_related('author')
+	try:
+		page = KeysetPaginator(replies, COMMENT_REPLIES_PER_PAGE, ordering=('path',)).page(request.GET.get('cursor'))
+	except ValueError:
+		raise Http404('Invalid page cursor.')
+	return JsonResponse({
+		'results': [_comment_json(reply, base_depth=comment.depth) for reply in page],
+		'next': page.next_cursor,
+	})
+
+
+class ViewCountMixin:
+	"""
+	Count successful GETs of the post in ``post_stats``, including ones served
+	from the page cache or as 304s. Goes first in the bases so it sees them all.
+	"""
+
+	def dispatch(self, request, *args, **kwargs):
+		if self.view_is_async:
+			return self._count_adispatch(request, *args, **kwargs)
+		return self._count(request, super().dispatch(request, *args, **kwargs))
+
+	async def _count_adispatch(self, request, *args, **kwargs):
+		return self._count(request, await super().dispatch(request, *args, **kwargs))
+
+	def _count(self, request, response):
+		if request.method == 'GET' and response.status_code in (200, 304):
+			post_stats.record_view(int(self.kwargs['pk']))
+		return response
+
+
+class PostDetailView(ViewCountMixin, ConditionalDetailMixin, AnonymousPageCacheMixin, DetailView):
 	model = Post
+	replica_reads = True
 	template_name = 'blog/post_detail.html'
 
+	def get_page_cache_versions(self):
+		pk = self.kwargs['pk']
+		return [f'post:{pk}', f'comments:{pk}']
+
+	def get_queryset(self):
+		return Post.objects.for_detail()
+
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
-		context['comments'] = self.object.comments.select_related('author').order_by('created_at')
+		cursor = self.request.GET.get('comments')
+		if self.request.user.is_authenticated:
+			# Edit/delete links depend on the viewer, so only the anonymous thread is shared.
+			context.update(comment_thread_context(self.object, cursor))
+		else:
+			context['comment_thread'] = render_comment_thread(
+				self.object,
+				lambda: comment_thread_context(self.object, cursor),
+				variant=cursor or '',
+			)
 		context['comment_form'] = CommentForm()
+		context['related_posts'] = list(PostSimilarity.objects.for_post(self.object.pk))
+		return context
+
+
+class TrendingPostListView(TemplateView):
+	replica_reads = True
+	template_name = 'blog/trending.html'
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['trending'] = post_stats.trending_posts()
+		context['posts'] = [post for post, _, _ in context['trending']]
+		context['post_cards'] = render_post_cards(context['posts'])
 		return context
 
 
@@ -72,93 +224,183 @@ class PostCreateView(LoginRequiredMixin, CreateView):
 		return reverse('post-detail', kwargs={'pk': self.object.pk})
 
 
-class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class OwnerRequiredMixin(LoginRequiredMixin):
+	"""
+	Let only the object's owner use an edit or delete view (403 for anyone else).
+
+	``get_object()`` is cached for the request, so ``get``/``post`` and
+	``form_valid`` share one fetch. With ``owner_in_queryset`` the ownership
+	check is part of that fetch (``filter(author=request.user)``); only a miss
+	costs a second query, to tell a foreign object (403) from a missing one
+	(404). Otherwise the object is fetched by primary key and its
+	``<owner_field>_id`` compared with the user's, without loading the owner.
+	"""
+
+	owner_field = 'author'
+	owner_in_queryset = True
+	raise_exception = True
+
+	def get_queryset(self):
+		queryset = super().get_queryset()
+		if self.owner_in_queryset:
+			queryset = queryset.filter(**{self.owner_field: self.request.user})
+		return queryset
+
+	def get_object(self, queryset=None):
+		if queryset is not None:
+			return super().get_object(queryset)
+		if not hasattr(self, '_owned_object'):
+			self._owned_object = self._get_owned_object()
+		return self._owned_object
+
+	def _get_owned_object(self):
+		if not self.owner_in_queryset:
+			obj = super().get_object()
+			if getattr(obj, f'{self.owner_field}_id') != self.request.user.pk:
+				raise PermissionDenied
+			return obj
+		try:
+			return super().get_object()
+		except Http404:
+			if self.model._default_manager.filter(pk=self.kwargs.get(self.pk_url_kwarg)).exists():
+				raise PermissionDenied
+			raise
+
+
+class PostUpdateView(OwnerRequiredMixin, UpdateView):
 	model = Post
 	form_class = PostForm
-	raise_exception = True
 	template_name = 'blog/post_form.html'
 
-	def test_func(self):
-		post = self.get_object()
-		return post.author == self.request.user
-
-	def form_valid(self, form):
-		form.instance.author = self.get_object().author
-		return super().form_valid(form)
-
 	def get_success_url(self):
 		return reverse('post-detail', kwargs={'pk': self.object.pk})
 
 
-class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class PostDeleteView(OwnerRequiredMixin, DeleteView):
 	model = Post
 	success_url = reverse_lazy('post-list')
-	raise_exception = True
 	template_name = 'blog/post_confirm_delete.html'
 
-	def test_func(self):
-		post = self.get_object()
-		return post.author == self.request.user
+	def form_valid(self, form):
+		with transaction.atomic():
+			tag_ids = list(self.object.tags.values_list('pk', flat=True))
+			response = super().form_valid(form)
+			Tag.objects.filter(pk__in=tag_ids).update(post_count=F('post_count') - 1)
+			TagCooccurrence.objects.adjust(tag_ids, [])
+		return response
+
 
+class ParentPostMixin:
+	"""
+	``parent_post`` for views nested under a post, from either URL form:
+	``post_id`` or the legacy routes' ``pk``. Only the primary key is loaded,
+	on first use (after the login check), and an unknown id is a 404.
+	"""
 
-class CommentCreateView(LoginRequiredMixin, CreateView):
+	parent_post_kwargs = ('post_id', 'pk')
+
+	@cached_property
+	def parent_post(self):
+		for kwarg in self.parent_post_kwargs:
+			if kwarg in self.kwargs:
+				return get_object_or_404(Post.objects.only('pk'), pk=self.kwargs[kwarg])
+		raise Http404('No post given.')
+
+
+class CommentCreateView(LoginRequiredMixin, ParentPostMixin, CreateView):
 	model = Comment
 	form_class = CommentForm
 
-	def dispatch(self, request, *args, **kwargs):
-		self.parent_post = Post.objects.get(pk=kwargs['post_id'])
-		return super().dispatch(request, *args, **kwargs)
+	def get_initial(self):
+		return {'parent': self.request.GET.get('parent')}
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['post'] = self.parent_post
+		return context
 
 	def form_valid(self, form):
+		parent_id = form.cleaned_data.get('parent')
+		parent = None
+		if parent_id:
+			parent = Comment.objects.filter(pk=parent_id, post=self.parent_post).only('pk', 'path').first()
+			if parent is None:
+				form.add_error(None, 'The comment you are replying to does not exist.')
+				return self.form_invalid(form)
+			if parent.depth + 1 >= Comment.MAX_DEPTH:
+				form.add_error(None, 'This thread is too deep to reply to.')
+				return self.form_invalid(form)
+		if moderation.enabled():
+			moderation.submit(self.parent_post, self.request.user, form.cleaned_data['content'], parent)
+			messages.info(self.request, 'Thanks! Your comment will appear once it has been checked.')
+			return redirect(self.get_success_url())
+		form.instance.parent = parent
 		form.instance.post = self.parent_post
 		form.instance.author = self.request.user
-		return super().form_valid(form)
+		with transaction.atomic():
+			response = super().form_valid(form)
+			self.parent_post.record_comment_added(self.object)
+		return response
 
 	def get_success_url(self):
 		return reverse('post-detail', kwargs={'pk': self.parent_post.pk})
 
 
-class CommentUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class CommentUpdateView(OwnerRequiredMixin, UpdateView):
 	model = Comment
 	form_class = CommentForm
-	raise_exception = True
 	template_name = 'blog/comment_form.html'
 
-	def test_func(self):
-		comment = self.get_object()
-		return comment.author == self.request.user
-
 	def get_success_url(self):
-		return reverse('post-detail', kwargs={'pk': self.object.post.pk})
+		return reverse('post-detail', kwargs={'pk': self.object.post_id})
 
 
-class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class CommentDeleteView(OwnerRequiredMixin, DeleteView):
 	model = Comment
-	raise_exception = True
 	template_name = 'blog/comment_confirm_delete.html'
 
-	def test_func(self):
-		comment = self.get_object()
-		return comment.author == self.request.user
-
 	def get_success_url(self):
-		return reverse('post-detail', kwargs={'pk': self.object.post.pk})
+		return reverse('post-detail', kwargs={'pk': self.object.post_id})
+
+	def form_valid(self, form):
+		with transaction.atomic():
+			# Replies are deleted with the comment (CASCADE), so count them first.
+			removed = 1 + Comment.objects.subtree(self.object).count()
+			response = super().form_valid(form)
+			self.object.post.record_comment_removed(removed)
+		return response
+
+
+class TagSidebarMixin:
+	"""Adds the tag cloud and the current tag's related tags to a tag listing."""
+
+	def get_tag(self):
+		raise NotImplementedError
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		tag = self.get_tag()
+		context['related_tags'] = related_tags(tag) if tag else []
+		context['tag_cloud'] = tag_cloud()
+		return context
 
 
-class TaggedPostListView(ListView):
+class TaggedPostListView(
+	ConditionalListMixin, AnonymousPageCacheMixin, TagSidebarMixin, KeysetPaginationMixin, ListView
+):
 	model = Post
+	replica_reads = True
 	context_object_name = 'posts'
 	template_name = 'blog/tag_posts.html'
 
+	def get_page_cache_versions(self):
+		return [tag_name_version(self.kwargs['tag_name']), 'tags']
+
 	def get_queryset(self):
-		tag_name = self.kwargs['tag_name']
-		return (
-			Post.objects.filter(tags__name__iexact=tag_name)
-			.select_related('author')
-			.prefetch_related('tags')
-			.order_by('-published_date')
-			.distinct()
-		)
+		return Post.objects.tagged(Tag.objects.named(self.kwargs['tag_name'])).for_listing()
+
+	def get_tag(self):
+		return Tag.objects.named(self.kwargs['tag_name']).first()
 
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
@@ -166,53 +408,124 @@ class TaggedPostListView(ListView):
 		return context
 
 
-class PostByTagListView(ListView):
+class PostByTagListView(
+	ConditionalListMixin, AnonymousPageCacheMixin, TagSidebarMixin, KeysetPaginationMixin, ListView
+):
 	model = Post
+	replica_reads = True
 	context_object_name = 'posts'
 	template_name = 'blog/tag_posts.html'
 
+	def get_page_cache_versions(self):
+		return [f"tag:{self.kwargs['tag_slug']}", 'tags']
+
 	def get_queryset(self):
-		tag_slug = self.kwargs['tag_slug']
-		return (
-			Post.objects.filter(tags__slug=tag_slug)
-			.select_related('author')
-			.prefetch_related('tags')
-			.order_by('-published_date')
-			.distinct()
-		)
+		return Post.objects.tagged(Tag.objects.filter(slug=self.kwargs['tag_slug'])).for_listing()
+
+	def get_tag(self):
+		if not hasattr(self, 'tag'):
+			self.tag = Tag.objects.filter(slug=self.kwargs['tag_slug']).first()
+		return self.tag
 
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
-		tag_slug = self.kwargs['tag_slug']
-		tag = Tag.objects.filter(slug=tag_slug).first()
+		tag = self.get_tag()
 		context['tag'] = tag
-		context['tag_name'] = tag.name if tag else tag_slug
+		context['tag_name'] = tag.name if tag else self.kwargs['tag_slug']
 		return context
 
 
-class PostSearchView(ListView):
+def archive_links(rows, author=None):
+	"""Sidebar entries (``date``, ``total``, ``url``) for rows of ``year``/``month``/``total``."""
+	links = []
+	for row in rows:
+		url = reverse('post-archive-month', kwargs={'year': row['year'], 'month': row['month']})
+		if author is not None:
+			url += '?' + urlencode({'author': author.username})
+		links.append({'date': datetime.date(row['year'], row['month'], 1), 'total': row['total'], 'url': url})
+	return links
+
+
+class AuthorPostListView(ConditionalListMixin, AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
 	model = Post
+	replica_reads = True
+	context_object_name = 'posts'
+	template_name = 'blog/author_posts.html'
+
+	def get_page_cache_versions(self):
+		return ['posts']
+
+	def get_author(self):
+		if not hasattr(self, 'author'):
+			self.author = get_object_or_404(User, username=self.kwargs['username'])
+		return self.author
+
+	def get_queryset(self):
+		return Post.objects.filter(author=self.get_author()).for_listing()
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['author'] = self.author
+		context['post_cards'] = render_post_cards(context['posts'])
+		months = self.author.archive_buckets.order_by('-year', '-month').values('year', 'month', total=F('post_count'))
+		context['archive_links'] = archive_links(months, author=self.author)
+		return context
+
+
+class PostMonthArchiveView(ConditionalListMixin, AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
+	"""One month of posts, optionally narrowed to ``?author=<username>``."""
+
+	model = Post
+	replica_reads = True
+	context_object_name = 'posts'
+	template_name = 'blog/month_archive.html'
+
+	def get_page_cache_versions(self):
+		return ['posts']
+
+	def get_author(self):
+		if not hasattr(self, 'author'):
+			username = self.request.GET.get('author')
+			self.author = get_object_or_404(User, username=username) if username else None
+		return self.author
+
+	def get_queryset(self):
+		year, month = self.kwargs['year'], self.kwargs['month']
+		if not 1 <= month <= 12 or not 1 <= year <= 9998:
+			raise Http404('No such month.')
+		start, end = month_bounds(year, month)
+		posts = Post.objects.filter(published_date__gte=start, published_date__lt=end)
+		if self.get_author() is not None:
+			posts = posts.filter(author=self.author)
+		return posts.for_listing()
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['month_start'] = datetime.date(self.kwargs['year'], self.kwargs['month'], 1)
+		context['author'] = self.author
+		context['post_cards'] = render_post_cards(context['posts'])
+		if self.author is not None:
+			months = self.author.archive_buckets.order_by('-year', '-month').values('year', 'month', total=F('post_count'))
+		else:
+			months = PostArchiveBucket.objects.months()
+		context['archive_links'] = archive_links(months, author=self.author)
+		return context
+
+
+class PostSearchView(SearchPaginationMixin, ListView):
+	model = Post
+	replica_reads = True
 	context_object_name = 'posts'
 	template_name = 'blog/search_results.html'
 
 	def get_queryset(self):
-		query = (self.request.GET.get('q') or '').strip()
-		if not query:
+		if not self.get_search_query():
 			return Post.objects.none()
-
-		return (
-			Post.objects.filter(
-				Q(title__icontains=query)
-				| Q(content__icontains=query)
-				| Q(tags__name__icontains=query)
-			)
-			.select_related('author')
-			.prefetch_related('tags')
-			.order_by('-published_date')
-			.distinct()
-		)
+		# Matching and ranking happen in the search backend; this queryset only
+		# loads the posts for the current page of hits.
+		return Post.objects.for_listing()
 
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
-		context['query'] = (self.request.GET.get('q') or '').strip()
+		context['query'] = self.get_search_query()
 		return context
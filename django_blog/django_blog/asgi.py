@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_blog.settings')
 
 application = get_asgi_application()
+
+# Build the search-suggestion index before the first request rather than during it.
+from blog import suggest  # noqa: E402
+
+suggest.warm_up()
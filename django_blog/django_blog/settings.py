@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blog.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,24 +77,122 @@ WSGI_APPLICATION = 'django_blog.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+#
+# Reads from the blog's listing and detail views go to the aliases in
+# BLOG_REPLICA_DATABASES (see blog/routers.py); writes always go to 'default'.
+# A user who just wrote reads from 'default' for BLOG_REPLICA_PIN_SECONDS.
+
 if os.environ.get('USE_POSTGRES') == '1':
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.environ.get('POSTGRES_DB', 'django_blog'),
-            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
-            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
-            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
-            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
-        }
+    _postgres = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'django_blog'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
     }
+    DATABASES = {'default': _postgres}
+    # POSTGRES_REPLICA_HOSTS is a comma-separated list of streaming replicas.
+    _replica_hosts = [host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+    for _index, _host in enumerate(_replica_hosts, start=1):
+        DATABASES['replica' if _index == 1 else f'replica_{_index}'] = {
+            **_postgres,
+            'HOST': _host,
+            'TEST': {'MIRROR': 'default'},
+        }
+    BLOG_REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
-        }
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        },
+        # Point SQLITE_REPLICA_PATH at a copy of db.sqlite3 to read from it.
+        # Tests get their own file so routing can be checked against real data.
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_REPLICA_PATH', os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3')),
+            'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+        },
     }
+    BLOG_REPLICA_DATABASES = ['replica'] if os.environ.get('SQLITE_REPLICA_PATH') else []
+
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+
+BLOG_REPLICA_PIN_SECONDS = 10
+
+
+# Caching
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# BLOG_CACHE_BACKEND picks the backend for page/fragment caching in the blog
+# app: 'locmem' (default, per process), 'file', 'redis' (any Redis-compatible
+# server; needs the redis package) or 'dummy' (no caching, for benchmarks).
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'django_blog'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'dummy': ('django.core.cache.backends.dummy.DummyCache', ''),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('BLOG_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('BLOG_CACHE_LOCATION', _cache_location),
+    }
+}
+
+BLOG_CACHE_ALIAS = 'default'
+BLOG_CACHE_TIMEOUT = 60 * 60
+
+# Related posts on the detail page (blog/related.py; needs numpy and scipy).
+# BLOG_RELATED_TAG_WEIGHT splits the score between tag overlap and text similarity.
+# Changed posts are queued and refreshed by one `manage.py refresh_related_posts
+# --loop` process (or by cron running it without --loop).
+# BLOG_RELATED_WORKER = 'thread' runs a worker thread inside each web process instead.
+BLOG_RELATED_POSTS = 5
+BLOG_RELATED_TAG_WEIGHT = 0.5
+BLOG_RELATED_WORKER = None
+BLOG_RELATED_BATCH_SIZE = 500
+
+# View counts and trending posts (blog/post_stats.py). Views are buffered per
+# process and written every BLOG_VIEW_FLUSH_SECONDS; a view's trending weight
+# halves every BLOG_TRENDING_HALF_LIFE seconds.
+BLOG_VIEW_FLUSH_SECONDS = 10
+BLOG_VIEW_FLUSH_MAX_POSTS = 1000
+BLOG_TRENDING_HALF_LIFE = 24 * 60 * 60
+BLOG_TRENDING_POSTS = 20
+BLOG_TRENDING_CACHE_SECONDS = 60
+
+# Search suggestions (blog/suggest.py): an in-memory prefix index per process
+# over the newest BLOG_SUGGEST_MAX_POSTS post titles and every tag name. Each
+# process replays the cache's change log every BLOG_SUGGEST_SYNC_SECONDS; set
+# BLOG_SUGGEST_REFRESH_SECONDS to also rebuild the whole index that often.
+BLOG_SUGGEST_MAX_POSTS = 200_000
+BLOG_SUGGEST_SYNC_SECONDS = 5
+BLOG_SUGGEST_REFRESH_SECONDS = None
+
+# Comment moderation (blog/moderation.py), off by default: comments are
+# published as they are posted. With BLOG_COMMENT_MODERATION = True new
+# comments are queued and published by one dedicated `manage.py
+# moderate_comments --loop` process (or by cron running it without --loop), so
+# turn it on only together with that process. BLOG_MODERATION_WORKER =
+# 'thread' runs a worker thread inside each web process instead.
+BLOG_COMMENT_MODERATION = False
+BLOG_MODERATION_WORKER = None
+BLOG_MODERATION_BATCH_SIZE = 500
+BLOG_COMMENT_SPAM_THRESHOLD = 0.8
+BLOG_COMMENT_CLASSIFIERS = [
+    'blog.moderation.LinkClassifier',
+    'blog.moderation.DuplicateClassifier',
+    'blog.moderation.NaiveBayesClassifier',
+]
+
+# JSON API (blog/api.py): default and largest ?limit= for list endpoints.
+BLOG_API_PAGE_SIZE = 50
+BLOG_API_MAX_PAGE_SIZE = 200
 
 
 # Password validation